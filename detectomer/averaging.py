@@ -0,0 +1,107 @@
+import numpy as np
+
+AVERAGING_MODES = ('mean', 'exp', 'peak', 'min')
+
+
+class SpectrumAverager:
+    """Averages consecutive spectra in place, in O(bins) per spectrum.
+
+    "mean" is a moving average over the last `depth` spectra, kept as a
+    running sum over a preallocated circular buffer. "exp" is an exponential
+    average with the same effective depth, "peak" and "min" hold the highest
+    and lowest value per bin until `reset`. With `linear` the averages are
+    taken over power instead of dB.
+    """
+
+    # the running sum is recalculated after this many turns of the buffer
+    # to get rid of accumulated rounding errors
+    RESUM_TURNS = 16
+
+    def __init__(self, nbins, depth, mode='mean', linear=False):
+        if mode not in AVERAGING_MODES:
+            raise ValueError(f"Unknown averaging mode: {mode}")
+        self.nbins = nbins
+        self.depth = max(1, int(depth))
+        self.mode = mode
+        # peak and min hold give the same result in dB and in power
+        self.linear = linear and mode in ('mean', 'exp')
+        self.alpha = 2 / (self.depth + 1)
+
+        self.value = np.empty(nbins)
+        self.state = np.empty(nbins)
+        self.output = np.empty(nbins)
+        if mode == 'mean':
+            self.buffer = np.zeros((self.depth, nbins))
+            self.total = np.zeros(nbins)
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.index = 0
+        self.turns = 0
+        if self.mode == 'mean':
+            self.buffer[:] = 0
+            self.total[:] = 0
+
+    def update(self, spectrum):
+        """Add one spectrum in dB and return the current average in dB.
+
+        The returned array is overwritten by the next update.
+        """
+        if self.linear:
+            # 10 ** (spectrum / 10)
+            np.multiply(spectrum, np.log(10) / 10, out=self.value)
+            np.exp(self.value, out=self.value)
+        else:
+            self.value[:] = spectrum
+
+        if self.mode == 'mean':
+            result = self.update_mean()
+        elif self.mode == 'exp':
+            result = self.update_exp()
+        elif self.mode == 'peak':
+            result = self.update_hold(np.maximum)
+        else:
+            result = self.update_hold(np.minimum)
+        self.count += 1
+
+        if self.linear:
+            np.log10(result, out=self.output)
+            self.output *= 10
+            return self.output
+        return result
+
+    def update_mean(self):
+        slot = self.buffer[self.index]
+        self.total -= slot
+        slot[:] = self.value
+        self.total += slot
+        self.next_slot()
+        np.divide(self.total, min(self.count + 1, self.depth), out=self.state)
+        return self.state
+
+    def next_slot(self):
+        """Move on to the next slot of the circular buffer of the moving average."""
+        self.index += 1
+        if self.index == self.depth:
+            self.index = 0
+            self.turns += 1
+            if self.turns % self.RESUM_TURNS == 0:
+                np.sum(self.buffer, axis=0, out=self.total)
+
+    def update_exp(self):
+        if self.count == 0:
+            self.state[:] = self.value
+        else:
+            # state += alpha * (value - state)
+            self.value -= self.state
+            self.value *= self.alpha
+            self.state += self.value
+        return self.state
+
+    def update_hold(self, function):
+        if self.count == 0:
+            self.state[:] = self.value
+        else:
+            function(self.state, self.value, out=self.state)
+        return self.state
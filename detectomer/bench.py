@@ -0,0 +1,231 @@
+#
+# DETECTOMER offline benchmark of the detection chain
+#
+# (2025) xaratustrah@github
+#
+
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from loguru import logger
+
+from sdr2zmq.frame import FrameHeader, DTYPE_CF32
+from sdr2zmq.codec import wire_dtype, encode_raw, decode_payload
+
+from .config import load_config
+from .spectrum import SpectrumEstimator
+from .averaging import SpectrumAverager
+from .kernels import fused_spectrum
+from .trigger import RuleMatrix, load_rules
+from .cfar import Detector
+
+STAGES = ('decode', 'window', 'fft', 'log', 'average', 'detector', 'band', 'decision')
+
+DEFAULT_CONFIG = {
+    'data': {'lframe': 2048, 'sample_rate': 2.048e6, 'center_freq': 410e6},
+    'graph': {'avg_depth': 10},
+    'trigger': {
+        'threshold': 0, 'freq1': None, 'freq2': None, 'invert': False,
+        'ref_level': 0, 'hold_time': 1, 'triggerbox': False,
+    },
+}
+
+
+def synthetic_frames(lframe, nframes, seed=0):
+    """Raw 8 bit I/Q frames of noise with a tone that comes and goes."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(lframe)
+    frames = np.empty((nframes, 2 * lframe), dtype=np.uint8)
+    for i in range(nframes):
+        iq = rng.normal(0, 0.05, 2 * lframe).view(np.complex128)
+        if i % 4 == 0:
+            iq += 0.3 * np.exp(2j * np.pi * (0.05 + 0.001 * i) * t)
+        raw = np.empty(2 * lframe)
+        raw[0::2] = iq.real
+        raw[1::2] = iq.imag
+        frames[i] = np.clip(np.round(raw * 127.5 + 127.5), 0, 255)
+    return frames
+
+
+def file_frames(filename, lframe):
+    """Frames of a recording: raw 8 bit I/Q from rtl_sdr, or complex64 from a .sigmf-data file."""
+    if filename.endswith('.sigmf-data'):
+        data = np.memmap(filename, dtype=np.complex64, mode='r')
+        nframes = len(data) // lframe
+        return data[:nframes * lframe].reshape(nframes, lframe)
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+    nframes = len(data) // (2 * lframe)
+    return data[:nframes * 2 * lframe].reshape(nframes, 2 * lframe)
+
+
+class Bench:
+    """Runs frames through the same spectrum, averaging and trigger code as the engine.
+
+    Every stage is timed separately. The latency of a frame is the time from
+    the start of its batch to the decision on it.
+    """
+
+    def __init__(self, config, encoding='uint8', compression='none', batch=1):
+        self.config = config
+        data = config['data']
+        self.lframe = data['lframe']
+        self.sample_rate = data['sample_rate']
+        self.batch = batch
+        self.dtype = wire_dtype(encoding, compression)
+        self.estimator = SpectrumEstimator.from_config(
+            self.lframe, self.sample_rate, data['center_freq'], config.get('spectrum', {})
+        )
+        self.averager = SpectrumAverager(
+            len(self.estimator.freqs),
+            config['graph']['avg_depth'],
+            mode=config['graph'].get('avg_mode', 'mean'),
+            linear=config['graph'].get('avg_linear', False),
+        )
+        self.trigger = RuleMatrix(self.estimator.freqs, load_rules(config))
+        self.ref_level = config['trigger'].get('ref_level', 0)
+        self.fft_data = np.empty(len(self.estimator.freqs))
+        self.detector = Detector.from_config(len(self.estimator.freqs), config['trigger'])
+        self.fused = fused_spectrum(self.estimator, self.averager, config.get('spectrum', {}))
+        if self.fused is not None and self.detector is None:
+            # as in the engine, the detector needs the whole spectrum before the band levels
+            self.fused.set_bands(self.trigger.limits, self.trigger.invert)
+        self.header = FrameHeader(0, 0.0, self.sample_rate, data['center_freq'], 0.0, self.dtype, self.lframe)
+
+    def payloads(self, frames):
+        """Encode the frames the way sdr2zmq puts them on the wire."""
+        if frames.dtype == np.complex64:
+            header = self.header._replace(dtype=DTYPE_CF32)
+            return header, [np.ascontiguousarray(frame) for frame in frames]
+        return self.header, [encode_raw(np.asarray(frame), self.dtype) for frame in frames]
+
+    def run(self, header, payloads, nframes, warmup=10):
+        times = dict.fromkeys(STAGES, 0.0)
+        latencies = []
+        fires = 0
+        timer = time.perf_counter
+        done = 0
+        n = len(payloads)
+        while done < nframes + warmup:
+            count = min(self.batch, nframes + warmup - done)
+            batch_start = timer()
+            samples = [decode_payload(header, payloads[(done + i) % n]) for i in range(count)]
+            t1 = timer()
+            windowed = self.estimator.apply_window(samples)
+            t2 = timer()
+            spectrum = self.estimator.transform(windowed)
+            t3 = timer()
+            # the fused kernel starts from the FFT output, its time counts as averaging
+            spectra = spectrum if self.fused is not None else self.estimator.to_dbm(spectrum)
+            t4 = timer()
+            stage = dict.fromkeys(STAGES, 0.0)
+            stage.update(decode=t1 - batch_start, window=t2 - t1, fft=t3 - t2, log=t4 - t3)
+            frame_latencies = []
+            for row in spectra:
+                t5 = timer()
+                if self.fused is not None:
+                    fft_data = self.fused.update(row, self.ref_level, out=self.fft_data)
+                else:
+                    fft_data = np.add(self.averager.update(row), self.ref_level, out=self.fft_data)
+                t6 = timer()
+                if self.fused is not None and self.detector is None:
+                    t_detector = t7 = t6
+                    levels = self.fused.levels
+                else:
+                    if self.detector is not None:
+                        fft_data = self.detector.update(fft_data)
+                    t_detector = timer()
+                    levels = self.trigger.levels(fft_data)
+                    t7 = timer()
+                fired = self.trigger.decide(levels, t7)
+                t8 = timer()
+                stage['average'] += t6 - t5
+                stage['detector'] += t_detector - t6
+                stage['band'] += t7 - t_detector
+                stage['decision'] += t8 - t7
+                fires += int(fired.sum())
+                frame_latencies.append(t8 - batch_start)
+            if done >= warmup:
+                for name in STAGES:
+                    times[name] += stage[name]
+                latencies.extend(frame_latencies)
+            done += count
+
+        total = sum(times.values())
+        latencies = np.array(latencies)
+        p50, p99 = np.percentile(latencies, [50, 99])
+        return {
+            'settings': {
+                'lframe': self.lframe,
+                'sample_rate': self.sample_rate,
+                'nfft': self.estimator.nfft,
+                'segments': self.estimator.nseg,
+                'fft_backend': self.estimator.backend.name,
+                'kernel': 'numba' if self.fused is not None else 'numpy',
+                'avg_depth': self.averager.depth,
+                'avg_mode': self.averager.mode,
+                'rules': len(self.trigger.rules),
+                'detector': self.config['trigger'].get('detector', 'fixed'),
+                'dtype': self.dtype,
+                'batch': self.batch,
+            },
+            'frames': nframes,
+            'seconds': total,
+            'frames_per_s': nframes / total,
+            'msps': nframes * self.lframe / total / 1e6,
+            'realtime_factor': nframes * self.lframe / total / self.sample_rate,
+            'stages_us': {name: times[name] / nframes * 1e6 for name in STAGES},
+            'latency_us': {'p50': p50 * 1e6, 'p99': p99 * 1e6, 'max': latencies.max() * 1e6},
+            'fires': fires,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="detectomer-bench - time the detection chain on recorded or synthetic data")
+    parser.add_argument("--config", type=str, help="Path to the configuration file for the spectrum, averaging and trigger settings")
+    parser.add_argument("--file", type=str, help="Recording to replay, raw 8 bit I/Q or .sigmf-data, synthetic data if not given")
+    parser.add_argument("--frames", type=int, default=10000, help="Number of frames to time")
+    parser.add_argument("--lframe", type=int, help="Samples per frame, overrides the config file")
+    parser.add_argument("--avg-depth", type=int, help="Averaging depth, overrides the config file")
+    parser.add_argument("--encoding", type=str, default="uint8", help="Sample type on the wire: uint8, int16 or complex64")
+    parser.add_argument("--compression", type=str, default="none", help="Compression on the wire: none, lz4 or zstd")
+    parser.add_argument("--batch", type=int, default=1, help="Frames per batch")
+    parser.add_argument("--output", type=str, help="Write the JSON result to this file instead of stdout")
+
+    args = parser.parse_args()
+
+    config = load_config(args.config) if args.config else DEFAULT_CONFIG
+    if args.lframe:
+        config['data']['lframe'] = args.lframe
+    if args.avg_depth:
+        config['graph']['avg_depth'] = args.avg_depth
+
+    try:
+        bench = Bench(config, encoding=args.encoding, compression=args.compression, batch=args.batch)
+    except (KeyError, ValueError) as e:
+        logger.error(f"Configuration error: {e}")
+        sys.exit(1)
+
+    if args.file:
+        frames = file_frames(args.file, bench.lframe)[:args.frames]
+        if not len(frames):
+            logger.error(f"{args.file} is shorter than one frame")
+            sys.exit(1)
+    else:
+        frames = synthetic_frames(bench.lframe, 64)
+    header, payloads = bench.payloads(frames)
+
+    result = bench.run(header, payloads, args.frames)
+    result['source'] = args.file or 'synthetic'
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+# -----------------------
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import numpy as np
+
+DETECTORS = ('fixed', 'floor', 'ca-cfar', 'os-cfar')
+
+FLOOR_METHODS = ('quantile', 'min')
+
+# smallest noise power in the CFAR detectors, about -3000 dB
+TINY = np.finfo(np.float64).tiny
+
+
+class NoiseFloor:
+    """Per-bin noise floor in dB, tracked frame by frame without keeping any history.
+
+    "quantile" follows a running quantile of every bin by stochastic
+    approximation: the floor moves up by `step` * q dB when the bin is above
+    it and down by `step` * (1 - q) dB when it is below, so it settles where
+    a fraction q of the frames are below. "min" follows the minimum, which
+    is allowed to rise by `rise` dB per frame to follow a drifting floor.
+    """
+
+    def __init__(self, nbins, method='quantile', quantile=0.5, step=0.05, rise=0.01):
+        if method not in FLOOR_METHODS:
+            raise ValueError(f"Unknown noise floor method: {method}")
+        self.method = method
+        self.quantile = quantile
+        self.step = step
+        self.rise = rise
+        self.floor = np.empty(nbins)
+        self.below = np.empty(nbins, dtype=bool)
+        self.started = False
+
+    def update(self, spectrum):
+        if not self.started:
+            self.floor[:] = spectrum
+            self.started = True
+            return self.floor
+        if self.method == 'min':
+            self.floor += self.rise
+            np.minimum(self.floor, spectrum, out=self.floor)
+        else:
+            np.less(spectrum, self.floor, out=self.below)
+            self.floor += self.step * self.quantile
+            np.subtract(self.floor, self.step, out=self.floor, where=self.below)
+        return self.floor
+
+
+class CFAR:
+    """Noise level of every bin from its neighbours in the same spectrum.
+
+    Around the cell under test `guard` cells on each side are left out and
+    the next `train` cells on each side are the reference. "ca" averages
+    the reference cells in power, summed window by window, as a running sum
+    over the whole spectrum would lose the noise next to a line many orders
+    of magnitude stronger. "os" takes the `rank`-th smallest reference
+    cell, which is not pulled up by a neighbouring line. The spectrum is
+    mirrored at its edges, so every bin has the full reference.
+    """
+
+    def __init__(self, nbins, kind='ca', guard=2, train=8, rank=None):
+        if kind not in ('ca', 'os'):
+            raise ValueError(f"Unknown CFAR kind: {kind}")
+        if train < 1 or guard < 0:
+            raise ValueError("CFAR needs at least one training cell and no negative guard cells")
+        self.kind = kind
+        self.guard = guard
+        self.train = train
+        self.half = guard + train
+        if nbins <= self.half:
+            raise ValueError(f"CFAR window of {self.half} cells per side does not fit into {nbins} bins")
+        # 3/4 of the reference cells is a common choice for OS-CFAR
+        self.rank = int(1.5 * train) if rank is None else rank
+        if not 0 <= self.rank < 2 * train:
+            raise ValueError(f"CFAR rank {self.rank} outside of the {2 * train} reference cells")
+
+        self.padded = np.empty(nbins + 2 * self.half)
+        self.noise = np.empty(nbins)
+        self.windows = np.lib.stride_tricks.sliding_window_view(self.padded, 2 * self.half + 1)
+        if kind == 'ca':
+            self.trailing = np.empty(nbins)
+        else:
+            # the reference cells of every bin, gathered into one preallocated row per bin
+            self.cells = np.empty((nbins, 2 * train))
+
+    def update(self, power):
+        """Noise power of every bin for a spectrum in linear power."""
+        n = len(power)
+        half = self.half
+        self.padded[half:half + n] = power
+        self.padded[:half] = power[half:0:-1]
+        self.padded[half + n:] = power[-2:-half - 2:-1]
+        train = self.train
+        if self.kind == 'ca':
+            np.sum(self.windows[:, :train], axis=1, out=self.noise)
+            np.sum(self.windows[:, -train:], axis=1, out=self.trailing)
+            self.noise += self.trailing
+            self.noise /= 2 * train
+        else:
+            self.cells[:, :train] = self.windows[:, :train]
+            self.cells[:, train:] = self.windows[:, -train:]
+            self.cells.partition(self.rank, axis=1)
+            self.noise[:] = self.cells[:, self.rank]
+        return self.noise
+
+
+class Detector:
+    """Turns a spectrum in dB into dB above the noise, for thresholds relative to the floor.
+
+    "floor" compares every bin with its own tracked noise floor, before the
+    floor is updated with the frame. "ca-cfar" and "os-cfar" compare every
+    bin with its neighbours in the same spectrum.
+    """
+
+    def __init__(self, nbins, mode, floor_method='quantile', quantile=0.5, step=0.05, rise=0.01,
+                 guard=2, train=8, rank=None):
+        if mode not in DETECTORS or mode == 'fixed':
+            raise ValueError(f"Unknown detector: {mode}")
+        self.mode = mode
+        self.excess = np.empty(nbins)
+        if mode == 'floor':
+            self.floor = NoiseFloor(nbins, floor_method, quantile, step, rise)
+            self.noise = self.floor.floor
+        else:
+            self.cfar = CFAR(nbins, mode[:2], guard, train, rank)
+            self.power = np.empty(nbins)
+            self.noise = np.empty(nbins)
+
+    @classmethod
+    def from_config(cls, nbins, section):
+        """Detector of the [trigger] config section, None for the fixed threshold."""
+        mode = section.get('detector', 'fixed')
+        if mode == 'fixed':
+            return None
+        return cls(
+            nbins, mode,
+            floor_method=section.get('floor_method', 'quantile'),
+            quantile=section.get('floor_quantile', 0.5),
+            step=section.get('floor_step', 0.05),
+            rise=section.get('floor_rise', 0.01),
+            guard=section.get('cfar_guard', 2),
+            train=section.get('cfar_train', 8),
+            rank=section.get('cfar_rank'),
+        )
+
+    def update(self, spectrum):
+        """dB above the noise for every bin, overwritten by the next update."""
+        if self.mode == 'floor':
+            np.subtract(spectrum, self.floor.floor, out=self.excess)
+            if not self.floor.started:
+                self.excess[:] = 0
+            self.floor.update(spectrum)
+            return self.excess
+        # 10 ** (spectrum / 10)
+        np.multiply(spectrum, np.log(10) / 10, out=self.power)
+        np.exp(self.power, out=self.power)
+        noise = self.cfar.update(self.power)
+        # a noise of 0 would put every bin infinitely above it
+        np.maximum(noise, TINY, out=self.noise)
+        np.log10(self.noise, out=self.noise)
+        self.noise *= 10
+        np.subtract(spectrum, self.noise, out=self.excess)
+        return self.excess
@@ -0,0 +1,18 @@
+import toml
+
+
+def load_config(config_file):
+    """Load configuration from a TOML file."""
+    with open(config_file, 'r') as file:
+        config = toml.load(file)
+    return config
+
+
+# Function to validate the presence of required keys in the config
+def validate_config(config, required_keys):
+    for section, keys in required_keys.items():
+        if section not in config:
+            raise KeyError(f"Missing section: {section}")
+        for key in keys:
+            if key not in config[section]:
+                raise KeyError(f"Missing key: {key} in section: {section}")
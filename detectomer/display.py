@@ -0,0 +1,130 @@
+import time
+import numpy as np
+import pyqtgraph as pg
+from pyqtgraph.Qt import QtCore
+
+
+class MinMaxDecimator:
+    """Reduces a spectrum to the minimum and maximum of a few buckets per pixel.
+
+    Narrow peaks survive the decimation, and the plot only gets about two
+    points per pixel no matter how many bins the spectrum has. The bucket
+    boundaries are kept until the visible index range or the width changes.
+    """
+
+    def __init__(self):
+        self.key = None
+
+    def decimate(self, x, y, start, stop, width):
+        """Decimated copy of x[start:stop], y[start:stop] for `width` pixels."""
+        n = stop - start
+        nbuckets = max(1, int(width))
+        if n <= 2 * nbuckets:
+            return x[start:stop], y[start:stop]
+
+        key = (start, stop, nbuckets, x[start], x[stop - 1])
+        if self.key != key:
+            self.key = key
+            self.starts = np.linspace(start, stop, nbuckets, endpoint=False).astype(np.intp)
+            ends = np.append(self.starts[1:], stop) - 1
+            self.x = np.empty(2 * nbuckets)
+            self.x[0::2] = x[self.starts]
+            self.x[1::2] = x[ends]
+            self.y = np.empty(2 * nbuckets)
+
+        band = y[:stop]
+        self.y[0::2] = np.minimum.reduceat(band, self.starts)
+        self.y[1::2] = np.maximum.reduceat(band, self.starts)
+        return self.x, self.y
+
+    def decimate_view(self, x, y, x_range, width):
+        """Decimate only the part of the spectrum inside the visible x range."""
+        start = max(0, int(np.searchsorted(x, x_range[0])) - 1)
+        stop = min(len(x), int(np.searchsorted(x, x_range[1])) + 1)
+        if stop <= start:
+            start, stop = 0, len(x)
+        return self.decimate(x, y, start, stop, width)
+
+
+class SpectrumView:
+    """Keeps one curve, a threshold curve and optionally a waterfall, and updates them in place.
+
+    Redraws are limited to `max_fps`, independent of how often new spectra
+    arrive. The waterfall lives in a preallocated buffer of twice its depth:
+    every line is written twice, so the newest `depth` lines are always one
+    contiguous view and nothing has to be rolled.
+    """
+
+    def __init__(self, graph_widget, max_fps=10, waterfall_widget=None, waterfall_depth=200,
+                 waterfall_bins=512, levels=(-100, 10)):
+        self.graph_widget = graph_widget
+        self.curve = pg.PlotDataItem(pen='w')
+        graph_widget.addItem(self.curve)
+        self.decimator = MinMaxDecimator()
+        # per-bin threshold of a detector, hidden for a fixed threshold
+        self.threshold_curve = pg.PlotDataItem(pen=pg.mkPen('r', width=1, style=QtCore.Qt.PenStyle.DashLine))
+        self.threshold_curve.setVisible(False)
+        graph_widget.addItem(self.threshold_curve)
+        self.threshold_decimator = MinMaxDecimator()
+        self.min_interval = 1 / max_fps
+        self.last_draw = 0
+
+        self.waterfall = None
+        if waterfall_widget is not None:
+            self.waterfall = pg.ImageItem(axisOrder='row-major')
+            self.waterfall.setLevels(levels)
+            self.waterfall.setLookupTable(pg.colormap.get('viridis').getLookupTable())
+            waterfall_widget.clear()
+            waterfall_widget.addItem(self.waterfall)
+            self.depth = waterfall_depth
+            self.bins = waterfall_bins
+            self.floor = levels[0]
+            self.lines = np.full((2 * waterfall_depth, waterfall_bins), self.floor, dtype=np.float32)
+            self.line = 0
+            self.columns_key = None
+
+        # statistics for the status bar
+        self.fps = 0.0
+        self.render_time = 0.0
+        self.draws = 0
+        self.stats_start = time.monotonic()
+
+    def due(self, now):
+        return now - self.last_draw >= self.min_interval
+
+    def draw(self, freqs, fft_data, threshold=None):
+        start = time.perf_counter()
+        self.last_draw = time.monotonic()
+
+        x_range, width = self.graph_widget.viewRange()[0], self.graph_widget.width()
+        x, y = self.decimator.decimate_view(freqs, fft_data, x_range, width)
+        self.curve.setData(x, y, skipFiniteCheck=True)
+        self.threshold_curve.setVisible(threshold is not None)
+        if threshold is not None:
+            x, y = self.threshold_decimator.decimate_view(freqs, threshold, x_range, width)
+            self.threshold_curve.setData(x, y, skipFiniteCheck=True)
+        if self.waterfall is not None:
+            self.add_waterfall_line(freqs, fft_data)
+
+        self.render_time = time.perf_counter() - start
+        self.draws += 1
+        elapsed = self.last_draw - self.stats_start
+        if elapsed >= 1:
+            self.fps = self.draws / elapsed
+            self.draws = 0
+            self.stats_start = self.last_draw
+
+    def add_waterfall_line(self, freqs, fft_data):
+        key = (len(freqs), freqs[0], freqs[-1])
+        if self.columns_key != key:
+            self.columns_key = key
+            self.columns = np.linspace(0, len(freqs), min(self.bins, len(freqs)), endpoint=False).astype(np.intp)
+            self.lines[:] = self.floor
+            self.waterfall.setRect(QtCore.QRectF(freqs[0], 0, freqs[-1] - freqs[0], self.depth))
+
+        line = np.maximum.reduceat(fft_data, self.columns)
+        self.lines[self.line, :len(line)] = line
+        self.lines[self.line + self.depth, :len(line)] = line
+        self.line = (self.line + 1) % self.depth
+        # oldest line at the bottom, newest at the top
+        self.waterfall.setImage(self.lines[self.line:self.line + self.depth, :len(line)], autoLevels=False)
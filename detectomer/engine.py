@@ -0,0 +1,415 @@
+#
+# DETECTOMER headless trigger engine
+#
+# (2025) xaratustrah@github
+#
+
+import sys
+import json
+import time
+import datetime
+import signal
+import argparse
+import threading
+import zmq
+import numpy as np
+from loguru import logger
+
+from .config import load_config, validate_config
+from .spectrum import PrecomputedSpectrum
+from .workers import spectrum_estimator, close_estimator
+from .averaging import SpectrumAverager
+from .kernels import fused_spectrum
+from .trigger import RuleMatrix, load_rules
+from .cfar import Detector
+from .recorder import IQRecorder
+from .journal import EventJournal
+from .outputs import TriggerBox, RestDispatcher, RestTrigger
+from .receiver import FrameReceiver, group_by_tuning, stream_address
+from sdr2zmq.metrics import Metrics, start_server
+
+REQUIRED_KEYS = {
+    "zmq_sdr": ["url", "port"],
+    "zmq_trigger": ["url", "port"],
+    "zmq_engine": ["url", "port"],
+    "rest": ["url", "SCID"],
+    "data": ["lframe", "sample_rate", "center_freq"],
+    "graph": ["avg_depth"],
+    "trigger": ["threshold", "freq1", "freq2", "invert", "ref_level", "hold_time"],
+}
+
+RULE_KEYS = ["freq1", "freq2", "outputs"]
+
+
+class TriggerEngine(threading.Thread):
+    """Receives SDR frames, decides on the band power and fires the outputs.
+
+    All trigger rules are evaluated on every frame, and each rule fires the
+    outputs it names. Spectra and trigger states are published on the engine socket, so that
+    the GUI can follow the engine as a pure viewer.
+    """
+
+    def __init__(self, config):
+        super().__init__(name='trigger-engine', daemon=True)
+        self.config = config
+        self.stopped = threading.Event()
+        self.zmq_context = zmq.Context()
+
+        self.avg_depth = config['graph']['avg_depth']
+        self.avg_mode = config['graph'].get('avg_mode', 'mean')
+        self.avg_linear = config['graph'].get('avg_linear', False)
+        self.avg_reset = config['graph'].get('avg_reset', 0)
+        self.last_reset = time.monotonic()
+        trigger_config = config['trigger']
+        self.rules = load_rules(config)
+        self.trigger = RuleMatrix(None, self.rules)
+        self.ref_level = trigger_config['ref_level']
+        self.detector_mode = trigger_config.get('detector', 'fixed')
+        self.log_file = trigger_config.get('log_file', '')
+
+        # the text log goes through the journal thread even without a [journal] section
+        self.journal = EventJournal.from_config(config.get('journal', {})) or EventJournal(None)
+
+        self.recorder = None
+        capture_config = config.get('capture', {})
+        if capture_config.get('enabled', False):
+            self.recorder = IQRecorder(
+                capture_config.get('directory', '.'),
+                pre_time=capture_config.get('pre_time', 0.05),
+                post_time=capture_config.get('post_time', 0.05),
+            )
+
+        # the stream headers override the tuning from the config file
+        self.tuning = None
+        self.configure(config['data']['lframe'], config['data']['sample_rate'], config['data']['center_freq'], False)
+
+        # an output shared by several rules is held for the longest hold time
+        self.hold_times = {}
+        for rule in self.rules:
+            for target in rule.outputs:
+                self.hold_times[target] = max(rule.hold_time, self.hold_times.get(target, 0))
+
+        self.rest = {}
+        self.dispatcher = None
+        if any(target.startswith('rest:') for target in self.hold_times):
+            self.dispatcher = RestDispatcher(
+                config['rest']['url'],
+                timeout=config['rest'].get('timeout', 1.0),
+                retries=config['rest'].get('retries', 2),
+                backoff=config['rest'].get('backoff', 0.1),
+            )
+            for target, hold_time in self.hold_times.items():
+                if target.startswith('rest:'):
+                    self.rest[target] = RestTrigger(self.dispatcher, int(target.split(':', 1)[1]), hold_time)
+
+        self.receive_mode = config['data'].get('receive_mode', 'all')
+        self.max_batch = config['data'].get('max_batch', 64)
+
+        self.publish_interval = config['zmq_engine'].get('publish_interval', 0.1)
+        self.last_publish = 0
+        self.stats_interval = config['zmq_engine'].get('stats_interval', 10)
+        self.last_stats = time.monotonic()
+
+        self.metrics = Metrics('detectomer')
+        self.receive_time = self.metrics.histogram('receive_seconds', 'Time to receive and decode a batch of frames')
+        self.frame_age = self.metrics.histogram('frame_age_seconds', 'Time from the capture of a frame until its decision')
+        self.fft_time = self.metrics.histogram('fft_seconds', 'Time to estimate the spectra of a batch of frames')
+        self.decision_time = self.metrics.histogram('decision_seconds', 'Time to average and evaluate the rules per frame')
+        self.dispatch_time = self.metrics.histogram('dispatch_seconds', 'Time to fire the outputs of a trigger')
+        self.fires = self.metrics.counter('fires', 'Rules that fired')
+        if self.dispatcher is not None:
+            self.metrics.add(self.dispatcher.latency)
+            self.metrics.counter('rest_sent', 'REST requests answered', lambda: self.dispatcher.sent)
+            self.metrics.counter('rest_failed', 'REST requests that failed', lambda: self.dispatcher.failed)
+            self.metrics.gauge('rest_pending', 'REST requests waiting to be sent', lambda: self.dispatcher.commands.qsize())
+
+    def run(self):
+        sdr_address = stream_address(self.config['zmq_sdr']['url'], self.config['zmq_sdr']['port'])
+        trigger_address = f"{self.config['zmq_trigger']['url']}:{self.config['zmq_trigger']['port']}"
+        engine_address = f"{self.config['zmq_engine']['url']}:{self.config['zmq_engine']['port']}"
+
+        self.receiver = FrameReceiver(
+            self.zmq_context, sdr_address, mode=self.receive_mode, max_batch=self.max_batch,
+            topic=self.config['zmq_sdr'].get('topic', ''),
+        )
+        self.metrics.counter('frames_received', 'Frames received from sdr2zmq', lambda: self.receiver.received)
+        self.metrics.counter('frames_processed', 'Frames analysed', lambda: self.receiver.processed)
+        self.metrics.counter('frames_dropped', 'Frames lost or skipped', lambda: self.receiver.dropped)
+        self.metrics.counter('frames_other_topic', 'Frames of other topics than the one analysed',
+                             lambda: self.receiver.other_topic)
+        metrics_server = start_server(self.metrics, self.config.get('metrics', {}))
+
+        self.socket_trigger = self.zmq_context.socket(zmq.PUB)
+        self.socket_trigger.bind(trigger_address)
+        self.triggerboxes = {
+            target: TriggerBox(self.socket_trigger, hold_time, topic=target.split(':', 1)[1])
+            for target, hold_time in self.hold_times.items()
+            if target.startswith('triggerbox:')
+        }
+
+        self.socket_engine = self.zmq_context.socket(zmq.PUB)
+        self.socket_engine.bind(engine_address)
+
+        logger.info(f"Trigger engine listening on {sdr_address}, publishing on {engine_address}")
+
+        if self.dispatcher is not None:
+            self.dispatcher.start()
+
+        poller = zmq.Poller()
+        poller.register(self.receiver.socket, zmq.POLLIN)
+
+        try:
+            while not self.stopped.is_set():
+                # frames left in a shared memory ring are not announced again
+                pending = self.receiver.pending()
+                events = dict(poller.poll(0 if pending else 100))
+                if pending or self.receiver.socket in events:
+                    start = time.perf_counter()
+                    frames = self.receiver.drain()
+                    self.receive_time.observe(time.perf_counter() - start)
+                    self.process(frames)
+                    self.receiver.mark_processed(len(frames))
+                now = time.monotonic()
+                for rest in self.rest.values():
+                    rest.poll(now)
+                if now - self.last_stats >= self.stats_interval:
+                    self.last_stats = now
+                    self.publish_stats()
+        finally:
+            if metrics_server is not None:
+                metrics_server.stop()
+            for rest in self.rest.values():
+                rest.poll(float('inf'))
+            if self.dispatcher is not None:
+                self.dispatcher.stop()
+                self.dispatcher.join(timeout=5)
+            if self.recorder is not None:
+                self.recorder.close()
+            self.journal.stop()
+            close_estimator(self.estimator)
+            self.receiver.close()
+            self.zmq_context.destroy(linger=0)
+
+    def stop(self):
+        self.stopped.set()
+
+    def configure(self, lframe, sample_rate, center_freq, spectrum):
+        """Set up frequency axis and averaging for the tuning of the stream.
+
+        With `spectrum` the stream carries spectra of `lframe` bins instead of I/Q.
+        """
+        if self.tuning is not None:
+            kind = 'bins' if spectrum else 'samples'
+            logger.info(f"Stream tuning changed to {lframe} {kind} at {sample_rate} Hz around {center_freq} Hz")
+        self.tuning = (lframe, sample_rate, center_freq, spectrum)
+        self.data_lframe = lframe
+        if hasattr(self, 'estimator'):
+            close_estimator(self.estimator)
+        if spectrum:
+            self.estimator = PrecomputedSpectrum(lframe, sample_rate, center_freq)
+        else:
+            self.estimator = spectrum_estimator(lframe, sample_rate, center_freq, self.config.get('spectrum', {}))
+        self.freqs = self.estimator.freqs
+        self.averager = SpectrumAverager(len(self.freqs), self.avg_depth, mode=self.avg_mode, linear=self.avg_linear)
+        self.fft_data = np.empty(len(self.freqs))
+        self.trigger.set_freqs(self.freqs)
+        # with a detector the thresholds are in dB above the noise
+        self.detector = Detector.from_config(len(self.freqs), self.config['trigger'])
+        self.fused = fused_spectrum(self.estimator, self.averager, self.config.get('spectrum', {}))
+        if self.fused is not None and self.detector is None:
+            # the band levels come out of the kernel, the detector needs the whole spectrum first
+            self.fused.set_bands(self.trigger.limits, self.trigger.invert)
+        self.record = self.recorder is not None and not spectrum
+        if self.record:
+            self.recorder.configure(lframe, sample_rate, center_freq)
+
+    def process(self, frames):
+        """Run every frame of a batch through averaging and trigger decision."""
+        result = None
+        for tuning, samples, headers in group_by_tuning(frames):
+            if tuning != self.tuning:
+                self.configure(*tuning)
+            start = time.perf_counter()
+            try:
+                if self.fused is not None:
+                    spectra = self.fused.transform(samples)
+                else:
+                    spectra = self.estimator.estimate(samples)
+                self.fft_time.observe(time.perf_counter() - start)
+            except ValueError as e:
+                logger.warning(f"Skipping {len(samples)} frames: {e}")
+                continue
+
+            for frame, header, spectrum in zip(samples, headers, spectra):
+                if self.record:
+                    self.recorder.write(frame, header.timestamp)
+                now = time.monotonic()
+                if self.avg_reset and now - self.last_reset >= self.avg_reset:
+                    # a peak or min hold would otherwise keep its value forever
+                    self.last_reset = now
+                    self.averager.reset()
+                start = time.perf_counter()
+                try:
+                    if self.fused is not None:
+                        fft_data = self.fused.update(spectrum, self.ref_level, out=self.fft_data)
+                    else:
+                        fft_data = np.add(self.averager.update(spectrum), self.ref_level, out=self.fft_data)
+                    excess = None
+                    if self.detector is not None:
+                        excess = self.detector.update(fft_data)
+                        levels, fired = self.trigger.evaluate(excess, now)
+                    elif self.fused is not None:
+                        levels = self.fused.levels
+                        fired = self.trigger.decide(levels, now)
+                    else:
+                        levels, fired = self.trigger.evaluate(fft_data, now)
+                except ValueError as e:
+                    logger.warning(f"Skipping frame: {e}")
+                    continue
+                self.decision_time.observe(time.perf_counter() - start)
+                self.frame_age.observe(time.time() - header.timestamp)
+
+                if fired.any():
+                    start = time.perf_counter()
+                    self.fire(now, levels, fired, fft_data, header.seq)
+                    self.dispatch_time.observe(time.perf_counter() - start)
+                result = (fft_data, levels, excess)
+
+        # the display only gets the newest spectrum of the batch
+        now = time.monotonic()
+        if result is not None and now - self.last_publish >= self.publish_interval:
+            self.last_publish = now
+            self.publish_spectrum(*result)
+
+    def fire(self, now, levels, fired, fft_data, seq):
+        for i in np.flatnonzero(fired):
+            rule = self.rules[i]
+            outputs = []
+            for target in rule.outputs:
+                if target in self.rest:
+                    sent = self.rest[target].fire(now)
+                elif target in self.triggerboxes:
+                    sent = self.triggerboxes[target].fire(now)
+                elif self.log_file:
+                    self.journal.log_line(self.log_file, datetime.datetime.now())
+                    sent = True
+                else:
+                    sent = False
+                if sent:
+                    outputs.append(target)
+            if self.record:
+                self.recorder.trigger(rule.name)
+                outputs.append('capture')
+            state = {
+                'time': time.time(),
+                'rule': rule.name,
+                **self.levels_dict(levels, i),
+                'level': float(self.trigger.level[i]),
+                'threshold': rule.threshold,
+                'outputs': outputs,
+            }
+            self.socket_engine.send_multipart([b'trigger', json.dumps(state).encode()])
+            if self.journal.directory is not None:
+                self.journal_event(state, i, fft_data, seq)
+            self.fires.inc()
+            logger.info(f"Rule {rule.name}: threshold crossed, sent to: {', '.join(outputs) or 'nothing'}")
+
+    def journal_event(self, state, i, fft_data, seq):
+        rule = self.rules[i]
+        lower, upper = self.trigger.limits[i]
+        band = fft_data[lower:upper]
+        peak = lower + (np.argmin(band) if rule.invert else np.argmax(band))
+        freq1, freq2 = self.trigger.band(i)
+        event = {
+            **state,
+            'seq': seq,
+            'freq1': freq1,
+            'freq2': freq2,
+            'peak_freq': self.freqs[peak],
+        }
+        self.journal.add(event, fft_data, self.freqs[0], self.freqs[1] - self.freqs[0])
+
+    def publish_stats(self):
+        """Log the metrics and publish them on the stats topic."""
+        stats = self.metrics.summary()
+        self.socket_engine.send_multipart([b'stats', json.dumps(stats).encode()])
+        logger.info(f"Stats: {stats}")
+
+    @staticmethod
+    def levels_dict(levels, i):
+        return {
+            'graph_max': float(levels.maximum[i]),
+            'graph_min': float(levels.minimum[i]),
+            'band_mean': float(levels.mean[i]),
+            'band_power': float(levels.power[i]),
+        }
+
+    def publish_spectrum(self, fft_data, levels, excess=None):
+        """Publish the spectrum with the trigger state of the first rule.
+
+        With a detector the threshold of every bin in dBm and the spectrum in
+        dB above the noise that was compared with it follow the spectrum.
+        """
+        # the first rule drives the window and threshold lines of the viewer
+        rule = self.rules[0]
+        meta = {
+            'time': time.time(),
+            'f0': float(self.freqs[0]),
+            'df': float(self.freqs[1] - self.freqs[0]),
+            **self.levels_dict(levels, 0),
+            'threshold': rule.threshold,
+            'freq1': rule.freq1,
+            'freq2': rule.freq2,
+            'invert': rule.invert,
+            'detector': self.detector_mode,
+            'crossed': bool(self.trigger.active[0]),
+            'rules': [
+                {'name': r.name, 'level': float(level), 'active': bool(active)}
+                for r, level, active in zip(self.rules, self.trigger.level, self.trigger.active)
+            ],
+            'frames': self.receiver.stats(),
+        }
+        # an inverted trigger compares against the mirrored spectrum
+        sign = -1.0 if rule.invert else 1.0
+        parts = [b'spectrum', json.dumps(meta).encode(), (sign * fft_data).astype(np.float32)]
+        if excess is not None:
+            # the noise the frame was compared with is the spectrum minus its excess
+            parts.append((sign * (fft_data - excess) + rule.threshold).astype(np.float32))
+            parts.append((sign * excess).astype(np.float32))
+        self.socket_engine.send_multipart(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="detectomer-engine - headless software trigger on spectral power")
+    parser.add_argument("--config", type=str, required=True, help="Path to the configuration file")
+
+    args = parser.parse_args()
+
+    # Load configuration from TOML file
+    config = load_config(args.config)
+
+    # Validate config
+    try:
+        validate_config(config, REQUIRED_KEYS)
+        for rule in config.get('rules', []):
+            validate_config({'rules': rule}, {'rules': RULE_KEYS})
+    except KeyError as e:
+        logger.error(f"Configuration error: {e}")
+        sys.exit(1)
+
+    try:
+        engine = TriggerEngine(config)
+    except ValueError as e:
+        logger.error(f"Configuration error: {e}")
+        sys.exit(1)
+    signal.signal(signal.SIGINT, lambda sig, frame: engine.stop())
+    signal.signal(signal.SIGTERM, lambda sig, frame: engine.stop())
+    engine.start()
+    while engine.is_alive():
+        engine.join(0.5)
+    logger.info('Exiting gracefully...')
+
+
+# -----------------------
+if __name__ == '__main__':
+    main()
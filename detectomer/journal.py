@@ -0,0 +1,269 @@
+import os
+import json
+import queue
+import datetime
+import threading
+import collections
+import numpy as np
+from time import monotonic
+from loguru import logger
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+FORMATS = ('binary', 'hdf5')
+
+Events = collections.namedtuple('Events', ['path', 'freqs', 'records'])
+
+
+def record_dtype(nbins):
+    """One trigger event together with the spectrum of `nbins` bins it fired on."""
+    return np.dtype([
+        ('time', 'f8'),
+        ('seq', 'u8'),
+        ('rule', 'S32'),
+        ('freq1', 'f8'),
+        ('freq2', 'f8'),
+        ('peak_freq', 'f8'),
+        ('level', 'f4'),
+        ('threshold', 'f4'),
+        ('outputs', 'S64'),
+        ('spectrum', 'f4', (nbins,)),
+    ])
+
+
+class BinaryJournalFile:
+    """Records appended as they are in memory, described by a JSON file next to them."""
+
+    extension = '.events'
+
+    def __init__(self, path, nbins, meta):
+        self.path = path
+        with open(path + '.json', 'w') as f:
+            json.dump({**meta, 'nbins': nbins}, f, indent=2)
+        self.file = open(path, 'ab')
+        self.size = 0
+
+    def append(self, records):
+        self.file.write(records.tobytes())
+        self.file.flush()
+        self.size += records.nbytes
+
+    def close(self):
+        self.file.close()
+
+
+class HDF5JournalFile:
+    """Records appended to a resizable `events` dataset, the spectrum axis as attributes."""
+
+    extension = '.h5'
+
+    def __init__(self, path, nbins, meta):
+        self.path = path
+        self.file = h5py.File(path, 'w')
+        self.file.attrs.update({**meta, 'nbins': nbins})
+        self.events = self.file.create_dataset(
+            'events', shape=(0,), maxshape=(None,), dtype=record_dtype(nbins), chunks=(64,)
+        )
+        self.size = 0
+
+    def append(self, records):
+        n = len(self.events)
+        self.events.resize((n + len(records),))
+        self.events[n:] = records
+        self.file.flush()
+        self.size = os.path.getsize(self.path)
+
+    def close(self):
+        self.file.close()
+
+
+class EventJournal(threading.Thread):
+    """Structured log of the trigger events, written from its own thread.
+
+    Every event is a record with time, frame sequence number, rule, band,
+    peak frequency and level, threshold, the outputs it was sent to and the
+    spectrum that fired it. The records are collected and appended in one
+    go every `flush_interval` seconds, to HDF5 files if h5py is installed
+    and to raw binary files with a JSON description otherwise. A new file
+    is started after `max_bytes` bytes or `max_age` seconds, and whenever
+    the frequency axis changes. Plain text log lines can be passed along,
+    so that no output writes to the disk from the analysis. Without a
+    `directory` only the text lines are written.
+    """
+
+    def __init__(self, directory, format=None, flush_interval=1.0, max_bytes=64 * 2 ** 20, max_age=3600,
+                 prefix='events'):
+        super().__init__(name='event-journal', daemon=True)
+        if format is None:
+            format = 'hdf5' if h5py is not None else 'binary'
+        if format not in FORMATS:
+            raise ValueError(f"Unknown journal format: {format}")
+        if format == 'hdf5' and h5py is None:
+            raise ValueError("The hdf5 journal format needs h5py")
+        self.directory = directory
+        self.file_class = HDF5JournalFile if format == 'hdf5' else BinaryJournalFile
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.prefix = prefix
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.jobs = queue.SimpleQueue()
+        self.file = None
+        self.axis = None
+        self.opened = 0.0
+        self.written = 0
+        self.start()
+
+    @classmethod
+    def from_config(cls, section):
+        """Journal of the [journal] config section, None if it is not enabled."""
+        if not section.get('enabled', False):
+            return None
+        return cls(
+            section.get('directory', '.'),
+            format=section.get('format'),
+            flush_interval=section.get('flush_interval', 1.0),
+            max_bytes=int(section.get('max_mbytes', 64) * 2 ** 20),
+            max_age=section.get('max_age', 3600),
+        )
+
+    def add(self, event, spectrum, f0, df):
+        """Queue an event dict with the spectrum it fired on, on a frequency axis from f0 in steps of df."""
+        if self.directory is None:
+            return
+        self.jobs.put(('event', event, np.array(spectrum, dtype=np.float32), (float(f0), float(df))))
+
+    def log_line(self, log_file, line):
+        """Queue a line for a plain text log file."""
+        self.jobs.put(('line', log_file, line))
+
+    def stop(self):
+        self.jobs.put(None)
+        self.join()
+
+    def run(self):
+        events = []
+        lines = []
+        deadline = monotonic() + self.flush_interval
+        while True:
+            try:
+                job = self.jobs.get(timeout=max(deadline - monotonic(), 0))
+            except queue.Empty:
+                job = ()
+            if job is None:
+                break
+            if job:
+                (events if job[0] == 'event' else lines).append(job[1:])
+            if monotonic() >= deadline:
+                self.flush(events, lines)
+                events, lines = [], []
+                deadline = monotonic() + self.flush_interval
+        self.flush(events, lines)
+        if self.file is not None:
+            self.file.close()
+
+    def flush(self, events, lines):
+        try:
+            self.write_lines(lines)
+            # consecutive events on the same frequency axis go into one append
+            start = 0
+            for i in range(1, len(events) + 1):
+                if i == len(events) or events[i][2] != events[start][2] or len(events[i][1]) != len(events[start][1]):
+                    self.write_events(events[start:i])
+                    start = i
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not write event journal: {e}")
+
+    @staticmethod
+    def write_lines(lines):
+        by_file = {}
+        for log_file, line in lines:
+            by_file.setdefault(log_file, []).append(line)
+        for log_file, file_lines in by_file.items():
+            with open(log_file, 'a') as f:
+                f.write(''.join(f"{line}\n" for line in file_lines))
+
+    def write_events(self, events):
+        nbins = len(events[0][1])
+        axis = (nbins,) + events[0][2]
+        now = monotonic()
+        if (self.file is None or axis != self.axis or self.file.size >= self.max_bytes
+                or now - self.opened >= self.max_age):
+            self.rotate(axis, events[0][0]['time'])
+            self.opened = now
+        records = np.zeros(len(events), dtype=record_dtype(nbins))
+        for record, (event, spectrum, _) in zip(records, events):
+            record['time'] = event['time']
+            record['seq'] = event.get('seq', 0)
+            record['rule'] = event['rule'].encode()[:32]
+            record['freq1'] = event['freq1']
+            record['freq2'] = event['freq2']
+            record['peak_freq'] = event['peak_freq']
+            record['level'] = event['level']
+            record['threshold'] = event['threshold']
+            record['outputs'] = ','.join(event['outputs']).encode()[:64]
+            record['spectrum'] = spectrum
+        self.file.append(records)
+        self.written += len(records)
+
+    def rotate(self, axis, timestamp):
+        if self.file is not None:
+            self.file.close()
+        nbins, f0, df = axis
+        stamp = datetime.datetime.fromtimestamp(timestamp).strftime('%Y%m%d_%H%M%S_%f')
+        path = os.path.join(self.directory, f"{self.prefix}_{stamp}{self.file_class.extension}")
+        self.file = self.file_class(path, nbins, {'f0': f0, 'df': df})
+        self.axis = axis
+        logger.info(f"Event journal: writing to {path}")
+
+
+def load_events(directory, start=None, stop=None, prefix='events'):
+    """Events with start <= time < stop of all journal files in `directory`.
+
+    Returns one Events tuple per file, with the frequency axis of its
+    spectra. Binary files are mapped into memory and the time range is
+    found by bisection on the time column, so only the selected records
+    are read.
+    """
+    result = []
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith(prefix):
+            continue
+        path = os.path.join(directory, name)
+        if name.endswith(BinaryJournalFile.extension):
+            with open(path + '.json') as f:
+                meta = json.load(f)
+            dtype = record_dtype(meta['nbins'])
+            # a record cut short by a crash is left out
+            count = os.path.getsize(path) // dtype.itemsize
+            if not count:
+                continue
+            events = np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+            i, j = time_range(events['time'], start, stop)
+            records = np.array(events[i:j])
+        elif name.endswith(HDF5JournalFile.extension):
+            if h5py is None:
+                logger.warning(f"Skipping {path}, reading HDF5 journals needs h5py")
+                continue
+            with h5py.File(path, 'r') as f:
+                meta = dict(f.attrs)
+                events = f['events']
+                i, j = time_range(events.fields('time')[()], start, stop)
+                records = events[i:j]
+        else:
+            continue
+        if len(records):
+            freqs = meta['f0'] + meta['df'] * np.arange(int(meta['nbins']))
+            result.append(Events(path, freqs, records))
+    return result
+
+
+def time_range(times, start, stop):
+    """Index range of the sorted `times` with start <= time < stop."""
+    i = 0 if start is None else np.searchsorted(times, start, side='left')
+    j = len(times) if stop is None else np.searchsorted(times, stop, side='left')
+    return i, max(i, j)
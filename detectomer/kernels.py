@@ -0,0 +1,149 @@
+import math
+import numpy as np
+
+from .spectrum import SpectrumEstimator
+from .trigger import BandLevels
+from .averaging import AVERAGING_MODES
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+KERNELS = ('auto', 'numba', 'numpy')
+
+
+def fused_kernel(spectrum, power_floor, db_offset, mode, first, buffer, total, index, depth, state, alpha,
+                 ref_level, invert, out, lower, upper, band_invert, maximum, minimum, mean, power):
+    """Everything from one FFT output of shape (nseg, nfft) to the band levels, bin by bin.
+
+    Power of every bin averaged over the segments, clamped to `power_floor`,
+    converted to dBm and added to the average in `state` (`mode` is the
+    index in AVERAGING_MODES), then the reference level added or the
+    spectrum mirrored into `out`. The bands lower:upper are reduced to
+    their levels afterwards, while `out` is still in the cache, the ones of
+    `band_invert` on the mirrored values.
+    """
+    nseg, nfft = spectrum.shape
+    n = min(first + 1, depth)
+    for k in range(nfft):
+        p = 0.0
+        for s in range(nseg):
+            z = spectrum[s, k]
+            p += z.real * z.real + z.imag * z.imag
+        p /= nseg
+        if p < power_floor:
+            p = power_floor
+        value = 10.0 * math.log10(p) + db_offset
+        if mode == 0:
+            total[k] += value - buffer[index, k]
+            buffer[index, k] = value
+            value = total[k] / n
+        elif first == 0:
+            pass
+        elif mode == 1:
+            value = state[k] + alpha * (value - state[k])
+        elif mode == 2:
+            value = max(state[k], value)
+        else:
+            value = min(state[k], value)
+        state[k] = value
+        out[k] = -value - ref_level if invert else value + ref_level
+
+    scale = math.log(10.0) / 10.0
+    for i in range(len(lower)):
+        sign = -1.0 if band_invert[i] else 1.0
+        high = -math.inf
+        low = math.inf
+        level_sum = 0.0
+        power_sum = 0.0
+        for k in range(lower[i], upper[i]):
+            x = sign * out[k]
+            high = max(high, x)
+            low = min(low, x)
+            level_sum += x
+            power_sum += math.exp(x * scale)
+        maximum[i] = high
+        minimum[i] = low
+        mean[i] = level_sum / (upper[i] - lower[i])
+        power[i] = 10.0 * math.log10(power_sum)
+
+
+compiled_kernel = numba.njit(cache=True)(fused_kernel) if numba is not None else None
+
+
+def fused_spectrum(estimator, averager, section):
+    """FusedSpectrum for the `kernel` of the [spectrum] section, None for the NumPy path.
+
+    "auto" uses the compiled kernel if numba is installed. Averaging in
+    power and spectra computed elsewhere always take the NumPy path.
+    """
+    kernel = section.get('kernel', 'auto')
+    if kernel not in KERNELS:
+        raise ValueError(f"Unknown spectrum kernel: {kernel}")
+    if kernel == 'numba' and numba is None:
+        raise ValueError("Spectrum kernel numba is not installed")
+    if kernel == 'numpy' or compiled_kernel is None:
+        return None
+    if type(estimator) is not SpectrumEstimator or averager.linear:
+        return None
+    return FusedSpectrum(estimator, averager)
+
+
+class FusedSpectrum:
+    """Power, dBm, averaging, reference level and band levels in one compiled pass.
+
+    Window and FFT are left to the estimator. The NumPy path makes a pass
+    over the spectrum with a temporary array for every step, this one reads
+    the FFT output once and keeps the average in the arrays of the
+    SpectrumAverager, so both paths can take turns on the same average.
+    """
+
+    def __init__(self, estimator, averager, kernel=None):
+        self.estimator = estimator
+        self.averager = averager
+        self.kernel = compiled_kernel if kernel is None else kernel
+        self.mode = AVERAGING_MODES.index(averager.mode)
+        if averager.mode == 'mean':
+            self.buffer, self.total = averager.buffer, averager.total
+        else:
+            self.buffer, self.total = np.zeros((1, 0)), np.zeros(0)
+        self.limits = None
+        self.set_bands(np.zeros((0, 2), dtype=np.intp), np.zeros(0, dtype=bool))
+
+    def set_bands(self, limits, invert):
+        """Bins (lower, upper) of the bands to reduce, and which of them look at the mirrored spectrum."""
+        limits = np.asarray(limits, dtype=np.intp).reshape(-1, 2)
+        if self.limits is not None and np.array_equal(limits, self.limits) \
+                and np.array_equal(invert, self.invert):
+            return
+        self.limits = limits
+        self.lower = np.ascontiguousarray(limits[:, 0])
+        self.upper = np.ascontiguousarray(limits[:, 1])
+        self.invert = np.array(invert, dtype=bool)
+        self.levels = BandLevels(*(np.empty(len(limits)) for _ in BandLevels._fields))
+
+    def transform(self, frames):
+        """FFT outputs of a batch of frames, one (nseg, nfft) block per frame."""
+        return self.estimator.transform(self.estimator.apply_window(frames))
+
+    def update(self, spectrum, ref_level, invert=False, out=None):
+        """Add one FFT output to the average and return it in dBm with the reference level.
+
+        The band levels of the spectrum are left in `levels`, overwritten by
+        the next update like the returned array.
+        """
+        averager = self.averager
+        if out is None:
+            out = np.empty(self.estimator.nfft)
+        levels = self.levels
+        self.kernel(
+            spectrum, self.estimator.power_floor, self.estimator.db_offset, self.mode, averager.count,
+            self.buffer, self.total, averager.index, averager.depth, averager.state, averager.alpha,
+            float(ref_level), bool(invert), out, self.lower, self.upper, self.invert,
+            levels.maximum, levels.minimum, levels.mean, levels.power,
+        )
+        if self.mode == 0:
+            averager.next_slot()
+        averager.count += 1
+        return out
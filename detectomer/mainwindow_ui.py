@@ -1,4 +1,3 @@
-import numpy as np
 import pyqtgraph as pg
 from pyqtgraph.Qt import QtCore, QtWidgets
 import toml
@@ -16,6 +15,11 @@ class MainWindowUI(QtWidgets.QMainWindow):
 
         self.graph_widget.sigRangeChanged.connect(self.update_slider_range)
 
+        self.waterfall_widget = pg.PlotWidget()
+        self.waterfall_widget.setXLink(self.graph_widget)
+        self.waterfall_widget.hideAxis('left')
+        self.waterfall_widget.setVisible(False)
+
         self.vslider = QtWidgets.QSlider(QtCore.Qt.Vertical)
         self.vslider.valueChanged.connect(self.update_slider_label)
 
@@ -27,6 +31,8 @@ class MainWindowUI(QtWidgets.QMainWindow):
 
         self.vslider_label = QtWidgets.QLabel(f'Threshold: {self.vslider.value()} dBm')
         self.graph_max_label = QtWidgets.QLabel('Graph Max: -∞ dBm')
+        self.frame_stats_label = QtWidgets.QLabel('Frames rx: 0 proc: 0 drop: 0')
+        self.render_stats_label = QtWidgets.QLabel('0.0 fps')
 
         self.hslider1_label = QtWidgets.QLabel(f'Freq 1: {self.hslider1.value()} Hz')
         self.hslider2_label = QtWidgets.QLabel(f'Freq 2: {self.hslider2.value()} Hz')
@@ -61,14 +67,17 @@ class MainWindowUI(QtWidgets.QMainWindow):
 
         self.run_button = QtWidgets.QPushButton('Run')
         self.stop_button = QtWidgets.QPushButton('Stop')
+        self.reset_button = QtWidgets.QPushButton('Reset Average')
 
         button_layout = QtWidgets.QHBoxLayout()
         button_layout.addWidget(self.load_button)
         button_layout.addWidget(self.run_button)
         button_layout.addWidget(self.stop_button)
+        button_layout.addWidget(self.reset_button)
 
         graph_layout = QtWidgets.QVBoxLayout()
-        graph_layout.addWidget(self.graph_widget)
+        graph_layout.addWidget(self.graph_widget, stretch=2)
+        graph_layout.addWidget(self.waterfall_widget, stretch=1)
 
         label_layout1 = QtWidgets.QHBoxLayout()
         label_layout1.addWidget(self.graph_max_label)
@@ -150,6 +159,8 @@ class MainWindowUI(QtWidgets.QMainWindow):
         self.current_color_action = self.color_actions[0]
 
         self.statusBar().showMessage("Ready")
+        self.statusBar().addPermanentWidget(self.frame_stats_label)
+        self.statusBar().addPermanentWidget(self.render_stats_label)
 
         self.setWindowTitle('DETECT-O-MER')
         self.resize(800, 600)
@@ -178,10 +189,9 @@ class MainWindowUI(QtWidgets.QMainWindow):
         if self.log_checkbox.isChecked():
             log_file = self.log_filename.text()
             if log_file:
-                with open(log_file, "a") as f:
-                    now = datetime.datetime.now()
-                    f.write(f"{now}\n")
-                            
+                # written by the journal thread, not by the GUI
+                self.journal.log_line(log_file, datetime.datetime.now())
+
     def update_slider_range(self):
         x_range, y_range = self.graph_widget.viewRange()
         min_x, max_x = x_range
@@ -212,12 +222,17 @@ class MainWindowUI(QtWidgets.QMainWindow):
 
                 self.zmq_sdr_url = config['zmq_sdr']['url']
                 self.zmq_sdr_port = config['zmq_sdr']['port']
+                self.zmq_sdr_topic = config['zmq_sdr'].get('topic', '')
                 self.zmq_trigger_url = config['zmq_trigger']['url']
                 self.zmq_trigger_port = config['zmq_trigger']['port']
                 
                 self.data_lframe = config['data']['lframe']
                 self.data_sample_rate = config['data']['sample_rate']
                 self.data_center_freq = config['data']['center_freq']
+                # "all" analyses every frame, "latest" only the newest one per tick
+                self.data_receive_mode = config['data'].get('receive_mode', 'all')
+                self.data_max_batch = config['data'].get('max_batch', 64)
+                self.data_poll_interval = config['data'].get('poll_interval', 10)
                 
                 self.graph_xmin = config['graph']['xmin']
                 self.graph_xmax = config['graph']['xmax']
@@ -226,16 +241,30 @@ class MainWindowUI(QtWidgets.QMainWindow):
                 self.graph_xunit = config['graph']['xunit']
                 self.graph_yunit = config['graph']['yunit']
                 self.graph_avg_depth = config['graph']['avg_depth']
-
-                # Start buffer with an empty array must be a 1D Vector
-                # and have double size for complex vectors!!!
-                self.avg_buffer = np.zeros((1, 2 * self.data_lframe))
+                self.graph_avg_mode = config['graph'].get('avg_mode', 'mean')
+                self.graph_avg_linear = config['graph'].get('avg_linear', False)
+                self.graph_display_interval = config['graph'].get('display_interval', 100)
+                self.graph_waterfall = config['graph'].get('waterfall', False)
+                self.graph_waterfall_depth = config['graph'].get('waterfall_depth', 200)
+                self.waterfall_widget.setVisible(self.graph_waterfall)
+                self.spectrum_config = config.get('spectrum', {})
+                self.journal_config = config.get('journal', {})
+                self.trigger_measure = config.get('trigger', {}).get('measure', 'max')
+                # "sdr" analyses the IQ stream, "engine" only views the trigger engine
+                self.graph_source = config['graph'].get('source', 'sdr')
+
+                if 'zmq_engine' in config:
+                    self.zmq_engine_url = config['zmq_engine']['url']
+                    self.zmq_engine_port = config['zmq_engine']['port']
 
                 self.window_xsize = config['window']['xsize']
                 self.window_ysize = config['window']['ysize']
                                 
                 self.rest_url = config['rest']['url']
                 self.rest_scid = config['rest']['SCID']
+                self.rest_timeout = config['rest'].get('timeout', 1.0)
+                self.rest_retries = config['rest'].get('retries', 2)
+                self.rest_backoff = config['rest'].get('backoff', 0.1)
                 
                 self.hslider1.setRange(0, self.data_lframe - 1)
                 self.hslider1.setValue(int(self.data_lframe / 4) - 5)
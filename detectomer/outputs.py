@@ -0,0 +1,130 @@
+import time
+import queue
+import datetime
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError
+from urllib3.util.retry import Retry
+from loguru import logger
+
+from sdr2zmq.metrics import Histogram
+
+
+class TriggerBox:
+    """Publishes a timestamp on the trigger box ZMQ socket, at most once per hold time."""
+
+    def __init__(self, socket, hold_time, topic='10002'):
+        self.socket = socket
+        self.hold_time = hold_time
+        self.topic = topic  # just a number for identification
+        self.busy_until = 0
+
+    def fire(self, now):
+        if now < self.busy_until:
+            return False
+        current_time = datetime.datetime.now().strftime('%Y-%m-%d@%H:%M:%S.%f')
+        self.socket.send_string("{} {}".format(self.topic, current_time))
+        self.busy_until = now + self.hold_time
+        return True
+
+
+class RestDispatcher(threading.Thread):
+    """Sends REST activate/release messages from its own worker thread.
+
+    The analysis loop only puts commands on a queue and never waits for the
+    network. One persistent session keeps the connection alive, failed
+    requests are retried with exponential backoff, and the time from sending
+    a request to its answer goes into a latency histogram. A single worker
+    keeps activation and release in order.
+    """
+
+    def __init__(self, url, timeout=1.0, retries=2, backoff=0.1):
+        super().__init__(name='rest-dispatcher', daemon=True)
+        self.url = url
+        self.timeout = timeout
+        self.commands = queue.SimpleQueue()
+        self.latency = Histogram('rest_seconds', 'Time from sending a REST request to its answer')
+        self.sent = 0
+        self.failed = 0
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=None,  # PUT is idempotent here, retry it as well
+            raise_on_status=False,
+        )
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.session.mount("http://", HTTPAdapter(max_retries=retry, pool_maxsize=1))
+        self.session.mount("https://", HTTPAdapter(max_retries=retry, pool_maxsize=1))
+
+    def activate(self, scid):
+        self.commands.put((scid, True))
+
+    def release(self, scid):
+        self.commands.put((scid, False))
+
+    def stop(self):
+        self.commands.put(None)
+
+    def run(self):
+        while True:
+            command = self.commands.get()
+            if command is None:
+                break
+            self.send(*command)
+        self.session.close()
+
+    def send(self, scid, status):
+        data = {
+            "dynamicSignals": [{"enabled": status, "id": scid}],
+            "staticSignals": [],
+        }
+        start = time.perf_counter()
+        try:
+            response = self.session.put(self.url, json=data, timeout=self.timeout)
+            response.raise_for_status()  # Check for HTTP errors
+            self.sent += 1
+        except HTTPError as http_err:
+            self.failed += 1
+            logger.error(f"HTTP error occurred: {http_err}")
+        except Exception as err:
+            self.failed += 1
+            logger.error(f"Other error occurred: {err}")
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+
+    def stats(self):
+        """Request counts and send-to-ack latency percentiles in seconds."""
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'pending': self.commands.qsize(),
+            **self.latency.summary(),
+        }
+
+
+class RestTrigger:
+    """Activates the dynamic signal `scid` and releases it after the hold time."""
+
+    def __init__(self, dispatcher, scid, hold_time):
+        self.dispatcher = dispatcher
+        self.scid = scid
+        self.hold_time = hold_time
+        self.release_at = None
+
+    def fire(self, now):
+        if self.release_at is not None:
+            return False
+        self.dispatcher.activate(self.scid)
+        self.release_at = now + self.hold_time
+        return True
+
+    def poll(self, now):
+        """Queue the release message once the hold time has elapsed."""
+        if self.release_at is not None and now >= self.release_at:
+            self.release_at = None
+            self.dispatcher.release(self.scid)
+
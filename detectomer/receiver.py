@@ -0,0 +1,208 @@
+import time
+import zmq
+import numpy as np
+from loguru import logger
+
+from sdr2zmq.frame import parse_frame, unpack_header, is_spectrum, DTYPE_CU8, DTYPE_CI16, DTYPE_SPEC_F16, COMPRESSION_MASK
+from sdr2zmq.codec import decode_payload
+from sdr2zmq.shmring import RingSubscriber, is_ring_address
+
+# payload types that are converted on decoding, the others are used in place
+CONVERTED_DTYPES = (DTYPE_CU8, DTYPE_CI16, DTYPE_SPEC_F16)
+
+
+class FrameReceiver:
+    """SUB socket on the sdr2zmq stream that keeps count of the frames.
+
+    In "all" mode every queued frame is handed out, in batches of at most
+    `max_batch`. In "latest" mode the queue is drained as well, but only the
+    newest frame is kept and the others are counted as dropped. Frames lost
+    on the way show up as gaps in the sequence numbers and are counted as
+    dropped too. Only the frames of `topic` are taken, "" being the frames
+    without topic, the others are counted in `other_topic` and every such
+    topic is logged once.
+
+    Messages are received without copying and the payloads are decoded
+    into preallocated buffers, or used in place when they are already
+    complex64 or float32. The samples handed out are views that are only
+    valid until the next `drain`.
+
+    With a shm:// address the frames are read from the shared memory ring
+    of an sdr2zmq on the same machine instead. They are always decoded
+    into the buffers, as the publisher reuses the slots, and frames whose
+    slot was overwritten in the meantime are counted as dropped. `socket`
+    is then the notification socket of the ring, for the pollers.
+    """
+
+    def __init__(self, context, address, mode='all', max_batch=64, hwm=1000, topic=''):
+        if mode not in ('all', 'latest'):
+            raise ValueError(f"Unknown receive mode: {mode}")
+        self.mode = mode
+        self.max_batch = max_batch
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.other_topic = 0
+        self.other_topics = set()
+        self.last_seq = None
+        self.latency = 0.0
+        # decode buffers of max_batch frames per (type, length)
+        self.buffers = {}
+
+        # SUB matches topic prefixes, "dev" would also get the channels "dev/..."
+        self.topic = topic.encode()
+
+        self.ring = None
+        if is_ring_address(address):
+            self.ring = RingSubscriber(context, address)
+            self.socket = self.ring.socket
+            return
+        self.socket = context.socket(zmq.SUB)
+        self.socket.setsockopt(zmq.RCVHWM, hwm)
+        self.socket.connect(address)
+        # a multi-device sdr2zmq sends every device on its own topic
+        self.socket.setsockopt(zmq.SUBSCRIBE, self.topic)
+
+    def receive(self):
+        """(header, payload, ring message number) of the frames queued on the socket."""
+        pending = []
+        try:
+            while len(pending) < self.max_batch or self.mode == 'latest':
+                parts = self.socket.recv_multipart(flags=zmq.NOBLOCK, copy=False)
+                # frames without topic part belong to the empty topic
+                topic = parts[0].bytes if len(parts) == 3 else b""
+                if topic != self.topic:
+                    self.skip_topic(topic)
+                    continue
+                self.received += 1
+                try:
+                    header, payload = parse_frame(parts)
+                    pending.append((header, payload.buffer, None))
+                except ValueError:
+                    self.dropped += 1
+        except zmq.Again:
+            pass
+        return pending
+
+    def receive_ring(self):
+        """(header, payload, ring message number) of the frames written to the ring since the last call."""
+        pending = []
+        limit = None if self.mode == 'latest' else self.max_batch
+        for topic, header, payload, number in self.ring.read(limit):
+            if topic != self.topic:
+                self.skip_topic(topic)
+                continue
+            self.received += 1
+            try:
+                pending.append((unpack_header(header), payload, number))
+            except ValueError:
+                self.dropped += 1
+        return pending
+
+    def skip_topic(self, topic):
+        self.other_topic += 1
+        if topic not in self.other_topics:
+            self.other_topics.add(topic)
+            logger.warning(f"Skipping the frames of topic {topic.decode(errors='replace')!r}, "
+                           f"only topic {self.topic.decode()!r} is analysed")
+
+    def drain(self):
+        """Return the (header, samples) pairs queued on the socket without blocking."""
+        pending = self.receive() if self.ring is None else self.receive_ring()
+        for header, _, _ in pending:
+            self.check_sequence(header.seq)
+        if pending:
+            self.latency = time.time() - pending[-1][0].timestamp
+        if self.mode == 'latest' and len(pending) > 1:
+            # only the newest frame is decoded
+            self.dropped += len(pending) - 1
+            pending = pending[-1:]
+
+        frames = []
+        for header, payload, number in pending:
+            try:
+                if number is None:
+                    converted = header.dtype & ~COMPRESSION_MASK in CONVERTED_DTYPES
+                    out = self.buffer(header, len(frames)) if converted else None
+                    samples = decode_payload(header, payload, out=out)
+                else:
+                    samples = self.decode_slot(header, payload, len(frames))
+            except ValueError:
+                self.dropped += 1
+                continue
+            if number is not None and not self.ring.intact(number):
+                self.dropped += 1
+                continue
+            frames.append((header, samples))
+        return frames
+
+    def decode_slot(self, header, payload, i):
+        """Decode a payload in a ring slot into row i of the decode buffer."""
+        out = self.buffer(header, i)
+        if header.dtype & ~COMPRESSION_MASK in CONVERTED_DTYPES:
+            return decode_payload(header, payload, out=out)
+        samples = decode_payload(header, payload)
+        out[:] = samples
+        return out
+
+    def buffer(self, header, i):
+        """Row i of the decode buffer for frames like `header`."""
+        dtype = np.float32 if is_spectrum(header.dtype) else np.complex64
+        key = (dtype, header.nsamples)
+        if key not in self.buffers:
+            self.buffers[key] = np.empty((self.max_batch, header.nsamples), dtype=dtype)
+        return self.buffers[key][i]
+
+    def check_sequence(self, seq):
+        if self.last_seq is not None and seq > self.last_seq + 1:
+            self.dropped += seq - self.last_seq - 1
+        # a restarted publisher starts over with smaller numbers
+        self.last_seq = seq
+
+    def pending(self):
+        """Whether frames are waiting that do not wake up a poller on the socket."""
+        return self.ring is not None and self.ring.pending()
+
+    def mark_processed(self, count):
+        self.processed += count
+
+    def stats(self):
+        stats = {
+            'received': self.received,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'other_topic': self.other_topic,
+            'latency': self.latency,
+        }
+        if self.ring is not None:
+            stats['ring_overruns'] = self.ring.overruns
+        return stats
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+        else:
+            self.socket.close(linger=0)
+
+
+def stream_address(url, port):
+    """Address of the sdr2zmq stream, the port is not used for a shared memory ring."""
+    if is_ring_address(url):
+        return url
+    return f"{url}:{port}"
+
+
+def group_by_tuning(frames):
+    """Split a batch into runs of frames with the same (nsamples, sample_rate, center_freq, spectrum).
+
+    Every run is returned as (tuning, samples, headers). `spectrum` is true
+    for frames that carry spectra computed by sdr2zmq instead of I/Q.
+    """
+    groups = []
+    for header, samples in frames:
+        tuning = (header.nsamples, header.sample_rate, header.center_freq, is_spectrum(header.dtype))
+        if not groups or groups[-1][0] != tuning:
+            groups.append((tuning, [], []))
+        groups[-1][1].append(samples)
+        groups[-1][2].append(header)
+    return groups
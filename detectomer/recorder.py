@@ -0,0 +1,155 @@
+import os
+import json
+import queue
+import datetime
+import threading
+import numpy as np
+from loguru import logger
+
+
+class IQRecorder:
+    """Keeps the recent IQ samples and stores the signal around each trigger.
+
+    The samples of every frame are copied into a ring buffer that holds
+    `pre_time` seconds before and `post_time` seconds after a trigger. Once
+    the post-trigger samples have arrived, the capture is cut out of the ring
+    and handed to a writer thread, which stores it as a SigMF recording: a
+    `.sigmf-data` file of complex64 samples written through `np.memmap` and a
+    `.sigmf-meta` JSON file with sample rate, center frequency and the
+    triggers as annotations.
+    """
+
+    def __init__(self, directory, pre_time=0.05, post_time=0.05, prefix='trigger'):
+        self.directory = directory
+        self.pre_time = pre_time
+        self.post_time = post_time
+        self.prefix = prefix
+        os.makedirs(directory, exist_ok=True)
+        self.pending = []
+        self.writer = CaptureWriter()
+        self.ring = None
+
+    def configure(self, nsamples, sample_rate, center_freq):
+        """Set up the ring for the tuning of the stream, pending captures are lost."""
+        if self.pending:
+            logger.warning(f"Tuning changed, dropping {len(self.pending)} pending IQ captures")
+        self.sample_rate = sample_rate
+        self.center_freq = center_freq
+        self.npre = int(round(self.pre_time * sample_rate))
+        self.npost = int(round(self.post_time * sample_rate))
+        self.ring = np.zeros(self.npre + self.npost + nsamples, dtype=np.complex64)
+        self.position = 0  # samples written since configure
+        self.timestamp = 0.0
+        self.pending = []
+
+    def write(self, samples, timestamp):
+        """Append one frame, `timestamp` being the time of its last sample."""
+        n = len(samples)
+        size = len(self.ring)
+        if n > size:
+            samples = samples[-size:]
+            self.position += n - size
+            n = size
+        start = self.position % size
+        first = min(n, size - start)
+        self.ring[start:start + first] = samples[:first]
+        self.ring[:n - first] = samples[first:]
+        self.position += n
+        self.timestamp = timestamp
+
+        while self.pending and self.pending[0]['stop'] <= self.position:
+            self.finish(self.pending.pop(0))
+
+    def trigger(self, label):
+        """Capture the signal around the end of the last written frame."""
+        if self.pending and self.pending[-1]['trigger'] == self.position:
+            self.pending[-1]['labels'].append(label)
+            return
+        self.pending.append({
+            'start': max(self.position - self.npre, 0),
+            'trigger': self.position,
+            'stop': self.position + self.npost,
+            'time': self.timestamp,
+            'labels': [label],
+        })
+
+    def finish(self, capture):
+        size = len(self.ring)
+        start = max(capture['start'], self.position - size)
+        stop = capture['stop']
+        # copy out of the ring, the writer thread must not see it change
+        indices = np.arange(start, stop) % size
+        samples = self.ring[indices]
+        trigger_index = capture['trigger'] - start
+        start_time = capture['time'] - trigger_index / self.sample_rate
+        meta = {
+            'global': {
+                'core:datatype': 'cf32_le',
+                'core:sample_rate': self.sample_rate,
+                'core:version': '1.0.0',
+                'core:recorder': 'detectomer',
+                'core:description': f"{self.pre_time} s before and {self.post_time} s after the trigger",
+            },
+            'captures': [{
+                'core:sample_start': 0,
+                'core:frequency': self.center_freq,
+                'core:datetime': utc_string(start_time),
+            }],
+            'annotations': [{
+                'core:sample_start': int(trigger_index),
+                'core:sample_count': int(stop - capture['trigger']),
+                'core:label': label,
+                'core:comment': f"trigger at {utc_string(capture['time'])}",
+            } for label in capture['labels']],
+        }
+        name = f"{self.prefix}_{datetime.datetime.fromtimestamp(capture['time']).strftime('%Y%m%d_%H%M%S_%f')}"
+        self.writer.put(os.path.join(self.directory, name), samples, meta)
+
+    def close(self):
+        """Store the pending captures with the samples that have arrived and stop the writer."""
+        for capture in self.pending:
+            capture['stop'] = min(capture['stop'], self.position)
+            self.finish(capture)
+        self.pending = []
+        self.writer.stop()
+        self.writer.join(timeout=5)
+
+
+class CaptureWriter(threading.Thread):
+    """Writes SigMF recordings from its own thread, so the analysis never waits on the disk."""
+
+    def __init__(self):
+        super().__init__(name='capture-writer', daemon=True)
+        self.jobs = queue.SimpleQueue()
+        self.start()
+
+    def put(self, basename, samples, meta):
+        self.jobs.put((basename, samples, meta))
+
+    def stop(self):
+        self.jobs.put(None)
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            try:
+                self.write(*job)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not write IQ capture: {e}")
+
+    @staticmethod
+    def write(basename, samples, meta):
+        data = np.memmap(basename + '.sigmf-data', dtype=np.complex64, mode='w+', shape=samples.shape)
+        data[:] = samples
+        data.flush()
+        del data
+        with open(basename + '.sigmf-meta', 'w') as f:
+            json.dump(meta, f, indent=2)
+        logger.info(f"IQ capture written to {basename}.sigmf-data")
+
+
+def utc_string(timestamp):
+    """ISO 8601 UTC time as used in SigMF."""
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
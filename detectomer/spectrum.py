@@ -0,0 +1,202 @@
+import numpy as np
+
+try:
+    import pyfftw
+except ImportError:
+    pyfftw = None
+
+try:
+    import scipy.fft
+except ImportError:
+    scipy = None
+
+# numpy.fft takes an output array since NumPy 2.0
+NUMPY_FFT_OUT = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+
+# cosine sum coefficients of the periodic windows
+WINDOWS = {
+    'rectangular': [1.0],
+    'hann': [0.5, 0.5],
+    'blackmanharris': [0.35875, 0.48829, 0.14128, 0.01168],
+    'flattop': [0.21557895, 0.41663158, 0.277263158, 0.083578947, 0.006947368],
+}
+
+
+def make_window(name, n):
+    """Periodic window of length n, as used for spectral analysis."""
+    if name not in WINDOWS:
+        raise ValueError(f"Unknown window: {name}")
+    phase = 2 * np.pi * np.arange(n) / n
+    window = np.zeros(n)
+    for k, a in enumerate(WINDOWS[name]):
+        window += (-1) ** k * a * np.cos(k * phase)
+    return window
+
+
+def frequency_axis(nfft, sample_rate, center_freq):
+    """Frequency of every bin of a shifted complex spectrum, in ascending order."""
+    return np.fft.fftshift(np.fft.fftfreq(nfft, d=1.0 / sample_rate)) + center_freq
+
+
+class FFTBackend:
+    """Complex FFT along the last axis with pyFFTW, scipy.fft or NumPy.
+
+    "auto" picks the first one installed in that order. The returned array
+    may be a buffer owned by the backend that is reused on the next call.
+    """
+
+    def __init__(self, name='auto', workers=1):
+        if name == 'auto':
+            name = 'pyfftw' if pyfftw is not None else 'scipy' if scipy is not None else 'numpy'
+        if name == 'pyfftw' and pyfftw is None:
+            raise ValueError("FFT backend pyfftw is not installed")
+        if name == 'scipy' and scipy is None:
+            raise ValueError("FFT backend scipy is not installed")
+        if name not in ('pyfftw', 'scipy', 'numpy'):
+            raise ValueError(f"Unknown FFT backend: {name}")
+        self.name = name
+        self.workers = workers
+        self.plans = {}
+        self.out = None
+
+    def fft(self, x):
+        if self.name == 'pyfftw':
+            # plans are built once per shape and reused
+            if x.shape not in self.plans:
+                self.plans[x.shape] = pyfftw.builders.fft(
+                    pyfftw.empty_aligned(x.shape, dtype=np.complex64), axis=-1, threads=self.workers
+                )
+            return self.plans[x.shape](x)
+        if self.name == 'scipy':
+            return scipy.fft.fft(x, axis=-1, workers=self.workers, overwrite_x=True)
+        if NUMPY_FFT_OUT:
+            # one output buffer for the largest batch so far
+            if self.out is None or self.out.shape[1:] != x.shape[1:] or len(self.out) < len(x):
+                self.out = np.empty(x.shape, dtype=np.complex64)
+            return np.fft.fft(x, axis=-1, out=self.out[:len(x)])
+        return np.fft.fft(x, axis=-1)
+
+
+class PrecomputedSpectrum:
+    """Stand-in for SpectrumEstimator on streams that already carry spectra in dBm.
+
+    sdr2zmq can publish the spectrum it computed once for all viewers, so
+    the frames are only stacked into the usual (frames, bins) array.
+    """
+
+    def __init__(self, nbins, sample_rate, center_freq):
+        self.nsamples = self.nfft = nbins
+        self.freqs = frequency_axis(nbins, sample_rate, center_freq)
+        self.work = None
+
+    def estimate(self, frames):
+        if self.work is None or len(self.work) < len(frames):
+            self.work = np.empty((len(frames), self.nfft))
+        out = self.work[:len(frames)]
+        for row, spectrum in zip(out, frames):
+            if len(spectrum) != self.nfft:
+                raise ValueError(f"Spectrum has {len(spectrum)} bins instead of {self.nfft}")
+            row[:] = spectrum
+        return out
+
+
+class SpectrumEstimator:
+    """Windowed power spectrum in dBm of complex64 I/Q frames.
+
+    With method "fft" each frame of `nsamples` is transformed as a whole.
+    With "welch" each frame is cut into overlapping segments of `segment`
+    samples, which are windowed through a strided view and transformed in
+    one batched FFT, and their power is averaged.
+
+    The window also carries a modulation by half the FFT length, so the
+    transform comes out already shifted to ascending frequencies. The power
+    is scaled to a full scale tone into `impedance` ohms, and empty bins are
+    clamped to `floor_db` instead of giving -inf.
+    """
+
+    def __init__(self, nsamples, sample_rate, center_freq, window='hann', backend='auto', workers=1,
+                 impedance=50, floor_db=-300, method='fft', segment=None, overlap=0.5):
+        if method not in ('fft', 'welch'):
+            raise ValueError(f"Unknown spectrum method: {method}")
+        if method == 'fft' or not segment:
+            segment, overlap = nsamples, 0
+        if segment > nsamples:
+            raise ValueError(f"Segment of {segment} samples is longer than the frame of {nsamples}")
+        if not 0 <= overlap < 1:
+            raise ValueError(f"Overlap {overlap} must be in [0, 1)")
+        self.nsamples = nsamples
+        self.nfft = nfft = segment
+        self.step = max(1, int(round(segment * (1 - overlap))))
+        self.nseg = 1 + (nsamples - segment) // self.step
+        self.freqs = frequency_axis(nfft, sample_rate, center_freq)
+        taper = make_window(window, nfft)
+        shift = np.exp(1j * np.pi * 2 * (nfft // 2) * np.arange(nfft) / nfft)
+        self.window = (taper * shift).astype(np.complex64)
+        # power of a tone filling one bin
+        self.db_offset = -10 * np.log10(np.sum(taper) ** 2 * impedance * 1e-3)
+        self.power_floor = 10 ** ((floor_db - self.db_offset) / 10)
+        self.backend = FFTBackend(backend, workers)
+        self.work = None
+
+    @classmethod
+    def from_config(cls, nsamples, sample_rate, center_freq, section):
+        """Estimator with the options of the [spectrum] config section."""
+        return cls(
+            nsamples, sample_rate, center_freq,
+            window=section.get('window', 'hann'),
+            backend=section.get('backend', 'auto'),
+            workers=section.get('workers', 1),
+            impedance=section.get('impedance', 50),
+            method=section.get('method', 'fft'),
+            segment=section.get('segment'),
+            overlap=section.get('overlap', 0.5),
+        )
+
+    def work_buffers(self, nframes):
+        if self.work is None or len(self.work[0]) < nframes:
+            self.work = (
+                np.empty((nframes, self.nseg, self.nfft), dtype=np.complex64),
+                np.empty((nframes, self.nseg, self.nfft), dtype=np.float32),
+                np.empty((nframes, self.nfft), dtype=np.float32),
+                np.empty((nframes, self.nfft)),
+            )
+        return tuple(buffer[:nframes] for buffer in self.work)
+
+    def segments(self, samples):
+        """Strided (nseg, nfft) view on the segments of one frame."""
+        if len(samples) != self.nsamples:
+            raise ValueError(f"Frame has {len(samples)} samples instead of {self.nsamples}")
+        return np.lib.stride_tricks.sliding_window_view(samples, self.nfft)[::self.step][:self.nseg]
+
+    def apply_window(self, frames):
+        windowed = self.work_buffers(len(frames))[0]
+        for i, samples in enumerate(frames):
+            np.multiply(self.segments(samples), self.window, out=windowed[i])
+        return windowed
+
+    def transform(self, windowed):
+        return self.backend.fft(windowed)
+
+    def to_dbm(self, spectrum):
+        _, power, mean, out = self.work_buffers(len(spectrum))
+        np.abs(spectrum, out=power)
+        np.square(power, out=power)
+        if self.nseg > 1:
+            np.mean(power, axis=1, out=mean)
+            power = mean
+        else:
+            power = power[:, 0]
+        np.maximum(power, self.power_floor, out=power)
+        np.log10(power, out=out)
+        out *= 10
+        out += self.db_offset
+        return out
+
+    def estimate(self, frames):
+        """dBm spectra of a batch of frames, one row per frame.
+
+        The rows are views into work buffers that are overwritten by the
+        next call.
+        """
+        return self.to_dbm(self.transform(self.apply_window(frames)))
+
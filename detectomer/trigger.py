@@ -0,0 +1,278 @@
+import numpy as np
+from collections import namedtuple
+
+BandLevels = namedtuple('BandLevels', ['maximum', 'minimum', 'mean', 'power'])
+
+TriggerRule = namedtuple(
+    'TriggerRule',
+    ['name', 'freq1', 'freq2', 'threshold', 'invert', 'measure', 'hysteresis', 'hold_time', 'outputs'],
+)
+
+MEASURES = ('max', 'mean', 'power')
+
+TRIGGERBOX_TOPIC = '10002'
+
+
+def apply_reference(fft_data, ref_level, invert, out=None):
+    """Add the reference level, or mirror the spectrum for the inverted trigger."""
+    if invert:
+        out = np.negative(fft_data, out=out)
+        out -= ref_level
+        return out
+    return np.add(fft_data, ref_level, out=out)
+
+
+def band_limits(freqs, freq1, freq2):
+    """Bin indices (lower, upper) of the band, the whole span if it does not fit."""
+    n = len(freqs)
+    if freq1 is None or freq2 is None:
+        return 0, n
+    lower_index = np.searchsorted(freqs, freq1)
+    upper_index = np.searchsorted(freqs, freq2)
+    if 0 < lower_index < n and 0 < upper_index < n:
+        if lower_index > upper_index:
+            lower_index, upper_index = upper_index, lower_index
+        if lower_index < upper_index:
+            return lower_index, upper_index
+    return 0, n
+
+
+def check_output(target, rule_name):
+    """Output of a rule as "rest:<SCID>", "triggerbox:<topic>" or "log", a bare "triggerbox" gets the default topic."""
+    if target == 'log':
+        return target
+    if target == 'triggerbox':
+        return f"triggerbox:{TRIGGERBOX_TOPIC}"
+    kind, _, value = str(target).partition(':')
+    # SCIDs and trigger box topics are numbers
+    if kind in ('rest', 'triggerbox') and value.isdigit():
+        return target
+    raise ValueError(f"Unknown output {target} in rule {rule_name}, "
+                     "expected \"rest:<SCID>\", \"triggerbox:<topic>\" or \"log\"")
+
+
+def load_rules(config):
+    """Trigger rules from the [[rules]] tables, or a single rule from [trigger].
+
+    Outputs are given as "rest:<SCID>", "triggerbox:<topic>" or "log", and
+    are checked here, so a mistyped one fails on loading and not on firing.
+    Missing rule settings default to the values of the [trigger] section.
+    """
+    trigger_config = config['trigger']
+    defaults = {
+        'threshold': trigger_config['threshold'],
+        'invert': trigger_config['invert'],
+        'measure': trigger_config.get('measure', 'max'),
+        'hysteresis': trigger_config.get('hysteresis', 0),
+        'hold_time': trigger_config['hold_time'],
+    }
+    if 'rules' not in config:
+        outputs = []
+        if trigger_config.get('rest', False):
+            outputs.append(f"rest:{config['rest']['SCID']}")
+        if trigger_config.get('triggerbox', True):
+            outputs.append(f"triggerbox:{TRIGGERBOX_TOPIC}")
+        if trigger_config.get('log_file', ''):
+            outputs.append('log')
+        outputs = [check_output(target, 'trigger') for target in outputs]
+        rule = {'name': 'trigger', 'freq1': trigger_config['freq1'], 'freq2': trigger_config['freq2'], 'outputs': outputs}
+        return [TriggerRule(**{**defaults, **rule})]
+
+    rules = []
+    for i, rule in enumerate(config['rules']):
+        try:
+            rule = TriggerRule(**{**defaults, 'name': f"rule{i}", 'outputs': [], **rule})
+        except TypeError as e:
+            raise ValueError(f"Invalid trigger rule {i}: {e}")
+        rules.append(rule._replace(outputs=[check_output(target, rule.name) for target in rule.outputs]))
+    return rules
+
+
+class BandTrigger:
+    """Threshold decision on the spectral power between two frequencies.
+
+    With the "max" measure the trigger fires when the band maximum rises
+    above the threshold, or with inversion when the band minimum drops below
+    it. "mean" compares the mean level in dB and "power" the power integrated
+    over the band. The band is turned into bin indices only when the
+    frequencies or the frequency axis change.
+    """
+
+    def __init__(self, freqs, threshold=0, freq1=None, freq2=None, invert=False, measure='max'):
+        if measure not in MEASURES:
+            raise ValueError(f"Unknown trigger measure: {measure}")
+        self.threshold = threshold
+        self.invert = invert
+        self.measure = measure
+        self.freq1 = freq1
+        self.freq2 = freq2
+        self.set_freqs(freqs)
+
+    def set_freqs(self, freqs):
+        self.freqs = freqs
+        self.update_limits()
+
+    def set_band(self, freq1, freq2):
+        if (freq1, freq2) != (self.freq1, self.freq2):
+            self.freq1 = freq1
+            self.freq2 = freq2
+            self.update_limits()
+
+    def update_limits(self):
+        self.limits = None
+        if self.freqs is None:
+            return
+        self.limits = band_limits(self.freqs, self.freq1, self.freq2)
+        # work buffer for the integrated power
+        self.band_power = np.empty(self.limits[1] - self.limits[0])
+
+    def levels(self, fft_data):
+        """Reduce the band of one spectrum to its BandLevels."""
+        band = fft_data[self.limits[0]:self.limits[1]]
+        # 10 ** (band / 10)
+        np.multiply(band, np.log(10) / 10, out=self.band_power)
+        np.exp(self.band_power, out=self.band_power)
+        return BandLevels(
+            band.max(), band.min(), band.mean(), 10 * np.log10(np.sum(self.band_power))
+        )
+
+    def evaluate(self, fft_data):
+        """Return (levels, crossed) for one spectrum."""
+        levels = self.levels(fft_data)
+        return levels, self.decide(levels)
+
+    def decide(self, levels):
+        """Whether the BandLevels of the band cross the threshold."""
+        if self.measure == 'mean':
+            level = levels.mean
+        elif self.measure == 'power':
+            level = levels.power
+        else:
+            level = levels.minimum if self.invert else levels.maximum
+        if self.invert:
+            crossed = level < self.threshold
+        else:
+            crossed = level > self.threshold
+        return crossed
+
+
+class RuleMatrix:
+    """Evaluates many trigger rules on one spectrum in a single vectorized pass.
+
+    Every rule watches its own band with its own threshold, polarity,
+    hysteresis and hold time. The band levels of all rules come from
+    segmented reductions over a padded copy of the spectrum, so the cost per
+    frame does not grow with a Python loop over the rules. Inverted rules
+    look at the mirrored spectrum, just like the inverted BandTrigger.
+
+    A rule becomes active when its level crosses the threshold and stays
+    active until the level falls back by the hysteresis. It fires whenever
+    it is active and its hold time has elapsed.
+    """
+
+    def __init__(self, freqs, rules):
+        if not rules:
+            raise ValueError("No trigger rules given")
+        for rule in rules:
+            if rule.measure not in MEASURES:
+                raise ValueError(f"Unknown trigger measure in rule {rule.name}: {rule.measure}")
+        self.rules = rules
+        self.threshold = np.array([rule.threshold for rule in rules], dtype=float)
+        self.invert = np.array([rule.invert for rule in rules], dtype=bool)
+        self.hysteresis = np.array([rule.hysteresis for rule in rules], dtype=float)
+        self.hold_time = np.array([rule.hold_time for rule in rules], dtype=float)
+        self.measure = np.array([MEASURES.index(rule.measure) for rule in rules])
+        # row of the (mirrored) spectrum and column of the result for every rule
+        self.rows = self.invert.astype(np.intp)
+        self.columns = np.arange(len(rules))
+        self.release_above = self.threshold + self.hysteresis
+        self.release_below = self.threshold - self.hysteresis
+        self.active = np.zeros(len(rules), dtype=bool)
+        self.hold_until = np.zeros(len(rules))
+        self.level = np.zeros(len(rules))
+        # results and work arrays, so that a frame allocates nothing
+        nrules = len(rules)
+        self.result = BandLevels(*(np.empty(nrules) for _ in BandLevels._fields))
+        self.peak = np.empty(nrules)
+        self.crossed = np.empty(nrules, dtype=bool)
+        self.released = np.empty(nrules, dtype=bool)
+        self.below = np.empty(nrules, dtype=bool)
+        self.fired = np.empty(nrules, dtype=bool)
+        self.set_freqs(freqs)
+
+    def set_freqs(self, freqs):
+        self.freqs = freqs
+        if freqs is None:
+            return
+        n = len(freqs)
+        self.limits = np.array([band_limits(freqs, rule.freq1, rule.freq2) for rule in self.rules])
+        # reduceat over (start, stop) pairs, every second result is a band
+        self.indices = self.limits.ravel()
+        self.counts = self.limits[:, 1] - self.limits[:, 0]
+        # one extra bin so that a band may end at the last bin
+        nrows = 2 if self.invert.any() else 1
+        self.padded = np.zeros((nrows, n + 1))
+        self.linear = np.empty_like(self.padded)
+        self.reduced = np.empty((nrows, len(self.indices)))
+        # position of every rule in the flattened reduceat result
+        self.picks = self.rows * len(self.indices) + 2 * self.columns
+
+    def band(self, i):
+        """Frequencies (lower, upper) of the bins that rule i looks at."""
+        lower, upper = self.limits[i]
+        return self.freqs[lower], self.freqs[upper - 1]
+
+    def reduce(self, ufunc, data, out):
+        ufunc.reduceat(data, self.indices, axis=1, out=self.reduced)
+        return np.take(self.reduced, self.picks, out=out)
+
+    def levels(self, fft_data):
+        """BandLevels of all rules, each field an array with one entry per rule.
+
+        The arrays are overwritten by the next call.
+        """
+        n = len(fft_data)
+        self.padded[0, :n] = fft_data
+        if len(self.padded) > 1:
+            np.negative(fft_data, out=self.padded[1, :n])
+        # 10 ** (padded / 10)
+        np.multiply(self.padded, np.log(10) / 10, out=self.linear)
+        np.exp(self.linear, out=self.linear)
+        levels = self.result
+        self.reduce(np.maximum, self.padded, levels.maximum)
+        self.reduce(np.minimum, self.padded, levels.minimum)
+        self.reduce(np.add, self.padded, levels.mean)
+        np.divide(levels.mean, self.counts, out=levels.mean)
+        self.reduce(np.add, self.linear, levels.power)
+        np.log10(levels.power, out=levels.power)
+        np.multiply(levels.power, 10, out=levels.power)
+        return levels
+
+    def evaluate(self, fft_data, now):
+        """Return (levels, fired) for one spectrum, fired being a boolean array."""
+        levels = self.levels(fft_data)
+        return levels, self.decide(levels, now)
+
+    def decide(self, levels, now):
+        """Update the rule states from the band levels and return the rules that fire.
+
+        The returned array is overwritten by the next call.
+        """
+        np.copyto(self.peak, levels.maximum)
+        np.copyto(self.peak, levels.minimum, where=self.invert)
+        np.choose(self.measure, (self.peak, levels.mean, levels.power), out=self.level)
+        # inverted rules cross below the threshold and release above it
+        np.greater(self.level, self.threshold, out=self.crossed)
+        np.less(self.level, self.threshold, out=self.below)
+        np.copyto(self.crossed, self.below, where=self.invert)
+        np.less(self.level, self.release_below, out=self.released)
+        np.greater(self.level, self.release_above, out=self.below)
+        np.copyto(self.released, self.below, where=self.invert)
+        # active = crossed | (active & ~released)
+        np.logical_not(self.released, out=self.released)
+        self.active &= self.released
+        self.active |= self.crossed
+        np.greater_equal(now, self.hold_until, out=self.fired)
+        self.fired &= self.active
+        np.add(self.hold_time, now, out=self.hold_until, where=self.fired)
+        return self.fired
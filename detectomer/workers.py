@@ -0,0 +1,189 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import queue
+import time
+import numpy as np
+from loguru import logger
+
+from .spectrum import SpectrumEstimator
+
+
+def spectrum_estimator(nsamples, sample_rate, center_freq, section):
+    """Estimator of the [spectrum] section, spread over `processes` worker processes if more than one."""
+    processes = section.get('processes', 1)
+    if processes > 1:
+        return ParallelSpectrum(nsamples, sample_rate, center_freq, section, processes,
+                                slots=section.get('slots', 64))
+    return SpectrumEstimator.from_config(nsamples, sample_rate, center_freq, section)
+
+
+def close_estimator(estimator):
+    """Stop the worker processes of an estimator, if it has any."""
+    if isinstance(estimator, ParallelSpectrum):
+        estimator.close()
+
+
+def attach(name, shape, dtype):
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def spectrum_worker(input_name, output_name, slots, nsamples, nfft, tuning, section, tasks, results):
+    """Compute the spectra of the frame slots given as (round, start, stop) until None arrives."""
+    input_memory, frames = attach(input_name, (slots, nsamples), np.complex64)
+    output_memory, spectra = attach(output_name, (slots, nfft), np.float64)
+    estimator = SpectrumEstimator.from_config(*tuning, section)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            number, start, stop = task
+            try:
+                spectra[start:stop] = estimator.estimate(frames[start:stop])
+                results.put((number, start, stop, None))
+            except ValueError as e:
+                results.put((number, start, stop, str(e)))
+    finally:
+        del frames, spectra
+        input_memory.close()
+        output_memory.close()
+
+
+class ParallelSpectrum:
+    """SpectrumEstimator spread over a pool of worker processes.
+
+    The frames of a batch are copied into slots of a shared memory block
+    and split into one contiguous shard per worker, which runs window, FFT
+    and dBm conversion on its shard and writes the spectra into a second
+    shared block. Only slot numbers travel through the queues. The spectra
+    come back in the order of the frames, so averaging and trigger see the
+    same sequence as with a single estimator. Batches larger than `slots`
+    are done in several rounds.
+
+    Every round has its own number, so results of an earlier round are
+    thrown away. A batch the workers do not finish in `timeout` seconds is
+    computed in the calling process instead, and so are all batches after
+    it, or after a worker process died: the workers are stopped then, as a
+    late one would write its shard over the spectra of a later round.
+    """
+
+    def __init__(self, nsamples, sample_rate, center_freq, section, processes, slots=64, timeout=10.0):
+        # the estimator of the main process gives the frequency axis and checks the settings,
+        # and computes the spectra when the workers fail
+        self.estimator = estimator = SpectrumEstimator.from_config(nsamples, sample_rate, center_freq, section)
+        self.nsamples = nsamples
+        self.nfft = estimator.nfft
+        self.nseg = estimator.nseg
+        self.backend = estimator.backend
+        self.freqs = estimator.freqs
+        self.slots = slots
+        self.timeout = timeout
+
+        self.input_memory = shared_memory.SharedMemory(create=True, size=slots * nsamples * 8)
+        self.output_memory = shared_memory.SharedMemory(create=True, size=slots * self.nfft * 8)
+        self.frames = np.ndarray((slots, nsamples), dtype=np.complex64, buffer=self.input_memory.buf)
+        self.spectra = np.ndarray((slots, self.nfft), dtype=np.float64, buffer=self.output_memory.buf)
+        self.out = np.empty((0, self.nfft))
+        self.round = 0
+        self.failed = False
+
+        # fork would copy the ZMQ sockets and threads of the parent
+        context = multiprocessing.get_context('spawn')
+        self.results = context.Queue()
+        self.tasks = []
+        self.processes = []
+        for i in range(processes):
+            tasks = context.Queue()
+            process = context.Process(
+                target=spectrum_worker,
+                args=(self.input_memory.name, self.output_memory.name, slots, nsamples, self.nfft,
+                      (nsamples, sample_rate, center_freq), section, tasks, self.results),
+                name=f"spectrum-worker-{i}", daemon=True,
+            )
+            process.start()
+            self.tasks.append(tasks)
+            self.processes.append(process)
+        logger.info(f"Spectra of {nsamples} samples computed by {processes} worker processes")
+
+    def estimate(self, frames):
+        """dBm spectra of a batch of frames, one row per frame.
+
+        The rows are views into buffers that are overwritten by the next call.
+        """
+        if self.failed:
+            return self.estimator.estimate(frames)
+        nframes = len(frames)
+        if nframes <= self.slots:
+            return self.run(frames)
+        if len(self.out) < nframes:
+            self.out = np.empty((nframes, self.nfft))
+        for first in range(0, nframes, self.slots):
+            batch = frames[first:first + self.slots]
+            self.out[first:first + len(batch)] = self.run(batch)
+        return self.out[:nframes]
+
+    def run(self, frames):
+        for i, samples in enumerate(frames):
+            if len(samples) != self.nsamples:
+                raise ValueError(f"Frame has {len(samples)} samples instead of {self.nsamples}")
+            self.frames[i] = samples
+        n = len(frames)
+        if not self.workers_alive():
+            return self.estimator.estimate(frames)
+        self.round += 1
+        bounds = np.linspace(0, n, min(n, len(self.tasks)) + 1).astype(int)
+        shards = set(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+        for tasks, (start, stop) in zip(self.tasks, sorted(shards)):
+            tasks.put((self.round, start, stop))
+        error = None
+        deadline = time.monotonic() + self.timeout
+        while shards:
+            try:
+                number, start, stop, message = self.results.get(timeout=0.5)
+            except queue.Empty:
+                if not self.workers_alive():
+                    return self.estimator.estimate(frames)
+                if time.monotonic() > deadline:
+                    # a late worker would still write its shard into the spectra of a later round
+                    self.give_up(f"Spectrum worker processes did not answer in {self.timeout} s")
+                    return self.estimator.estimate(frames)
+                continue
+            # left over from a round that timed out
+            if number != self.round or (start, stop) not in shards:
+                continue
+            shards.discard((start, stop))
+            error = error or message
+        if error:
+            raise ValueError(error)
+        return self.spectra[:n]
+
+    def workers_alive(self):
+        """False once a worker process has died, the pool is then given up."""
+        if not self.failed and all(process.is_alive() for process in self.processes):
+            return True
+        self.give_up("A spectrum worker process died")
+        return False
+
+    def give_up(self, reason):
+        """Stop the workers, so none of them writes to the spectra any more, and compute here from now on."""
+        if self.failed:
+            return
+        self.failed = True
+        logger.error(f"{reason}, computing the spectra in the analysis thread")
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+
+    def close(self):
+        for tasks in self.tasks:
+            tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        del self.frames, self.spectra
+        self.input_memory.close()
+        self.input_memory.unlink()
+        self.output_memory.close()
+        self.output_memory.unlink()
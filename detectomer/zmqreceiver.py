@@ -1,20 +1,22 @@
 import zmq
+import json
+import time
 import numpy as np
 from pyqtgraph.Qt import QtCore, QtWidgets
-import requests
-import warnings
 import datetime
-from requests.exceptions import HTTPError
+from loguru import logger
 from .mainwindow_ui import MainWindowUI
+from .spectrum import PrecomputedSpectrum
+from .workers import spectrum_estimator, close_estimator
+from .averaging import SpectrumAverager
+from .kernels import fused_spectrum
+from .receiver import FrameReceiver, group_by_tuning, stream_address
+from .trigger import BandTrigger, BandLevels, apply_reference
+from .display import SpectrumView
+from .outputs import RestDispatcher
+from .journal import EventJournal
 
 
-# Function to handle warnings as exceptions
-def warn_handler(message, category, filename, lineno, file=None, line=None):
-    raise category(message)
-
-# Set the warning handler
-warnings.showwarning = warn_handler
-
 class ZMQReceiver(MainWindowUI):
     def __init__(self):
         super().__init__()
@@ -24,9 +26,13 @@ class ZMQReceiver(MainWindowUI):
         
         self.run_button.clicked.connect(self.start_receiving)
         self.run_button.clicked.connect(self.start_trigger_server)
+        self.run_button.clicked.connect(self.start_rest_dispatcher)
         
         self.stop_button.clicked.connect(self.stop_receiving)
         self.stop_button.clicked.connect(self.stop_trigger_server)
+        self.stop_button.clicked.connect(self.stop_rest_dispatcher)
+
+        self.reset_button.clicked.connect(self.reset_average)
 
         self.timer = QtCore.QTimer()
         self.timer.timeout.connect(self.update_plot)
@@ -34,15 +40,9 @@ class ZMQReceiver(MainWindowUI):
         self.busy_triggerbox = False
         self.busy_statusbar_show = False
         self.busy_rest_interface = False
-        
-    def get_moving_average(self, new_array):      
-        if len(self.avg_buffer) < self.graph_avg_depth:
-            self.avg_buffer = np.vstack((self.avg_buffer, new_array))
-        else:
-            # Discard the oldest value and append the new one
-            self.avg_buffer = np.roll(self.avg_buffer, -1, axis = 0)  # Shift all elements to the left
-            self.avg_buffer[-1] = new_array  # Add the new value at the end
-        return np.mean(self.avg_buffer, axis=0)
+
+    def is_viewer(self):
+        return getattr(self, "graph_source", "sdr") == "engine"
 
     def start_receiving(self):
         if not hasattr(self, "zmq_sdr_url") or not hasattr(self, "zmq_sdr_port"):
@@ -51,24 +51,84 @@ class ZMQReceiver(MainWindowUI):
             )
             return
 
-        self.freqs = (
-            np.fft.fftfreq(self.data_lframe, d=1.0 / self.data_sample_rate)
-            + self.data_center_freq
+        if self.is_viewer():
+            self.start_viewing()
+            return
+
+        self.trigger = BandTrigger(None, measure=self.trigger_measure)
+        # the text log goes through the journal thread even without a [journal] section
+        self.journal = EventJournal.from_config(self.journal_config) or EventJournal(None)
+        self.crossed = False
+        self.setup_spectrum_view()
+        self.configure_stream(self.data_lframe, self.data_sample_rate, self.data_center_freq, False)
+
+        try:
+            address = stream_address(self.zmq_sdr_url, self.zmq_sdr_port)
+            self.receiver = FrameReceiver(
+                self.zmq_context_sdr, address, mode=self.data_receive_mode, max_batch=self.data_max_batch,
+                topic=self.zmq_sdr_topic,
+            )
+            self.socket_sdr = self.receiver.socket
+            # analysis runs on every tick, the display only every display_interval
+            self.timer.start(self.data_poll_interval)
+        except Exception as e:
+            QtWidgets.QMessageBox.warning(self, "Error", f"Failed to connect: {e}")
+
+    def setup_spectrum_view(self):
+        if hasattr(self, "spectrum_view"):
+            self.graph_widget.removeItem(self.spectrum_view.curve)
+        self.spectrum_view = SpectrumView(
+            self.graph_widget,
+            max_fps=1000 / self.graph_display_interval,
+            waterfall_widget=self.waterfall_widget if self.graph_waterfall else None,
+            waterfall_depth=self.graph_waterfall_depth,
+            levels=(self.graph_ymin, self.graph_ymax),
         )
-        
+
+    def configure_stream(self, lframe, sample_rate, center_freq, spectrum):
+        """Follow the tuning announced in the frame headers."""
+        self.data_lframe = lframe
+        self.data_sample_rate = sample_rate
+        self.data_center_freq = center_freq
+        self.stream_tuning = (lframe, sample_rate, center_freq, spectrum)
+
+        if hasattr(self, "estimator"):
+            close_estimator(self.estimator)
+        if spectrum:
+            # sdr2zmq publishes the spectra, no FFT needed here
+            self.estimator = PrecomputedSpectrum(lframe, sample_rate, center_freq)
+        else:
+            self.estimator = spectrum_estimator(
+                self.data_lframe, self.data_sample_rate, self.data_center_freq, self.spectrum_config
+            )
+        self.freqs = self.estimator.freqs
+        self.trigger.set_freqs(self.freqs)
+        self.averager = SpectrumAverager(
+            len(self.freqs), self.graph_avg_depth, mode=self.graph_avg_mode, linear=self.graph_avg_linear
+        )
+        self.reference = np.empty(len(self.freqs))
+        self.fused = fused_spectrum(self.estimator, self.averager, self.spectrum_config)
+
         self.hslider1.setValue(int(self.freqs[0]))
         self.update_hslider1_label()
-        self.hslider2.setValue(int(self.freqs[int(self.data_lframe / 2)]))
+        self.hslider2.setValue(int(self.freqs[-1]))
         self.update_hslider2_label()
-        
+
         self.graph_widget.setXRange(np.min(self.freqs), np.max(self.freqs))
 
+    def start_viewing(self):
+        if not hasattr(self, "zmq_engine_url") or not hasattr(self, "zmq_engine_port"):
+            QtWidgets.QMessageBox.warning(
+                self, "Error", "Viewer mode needs a [zmq_engine] section in the config file."
+            )
+            return
         try:
-            address = f"{self.zmq_sdr_url}:{self.zmq_sdr_port}"
+            address = f"{self.zmq_engine_url}:{self.zmq_engine_port}"
             self.socket_sdr = self.zmq_context_sdr.socket(zmq.SUB)
             self.socket_sdr.connect(address)
-            self.socket_sdr.setsockopt(zmq.SUBSCRIBE, b"")
-            self.socket_sdr.setsockopt(zmq.CONFLATE, 1)  # Keep only the most recent message
+            self.socket_sdr.setsockopt(zmq.SUBSCRIBE, b"spectrum")
+            self.socket_sdr.setsockopt(zmq.SUBSCRIBE, b"trigger")
+            self.setup_spectrum_view()
             self.timer.start(100)
         except Exception as e:
             QtWidgets.QMessageBox.warning(self, "Error", f"Failed to connect: {e}")
@@ -78,99 +138,175 @@ class ZMQReceiver(MainWindowUI):
         if hasattr(self, "socket_sdr"):
             self.socket_sdr.close()
             del self.socket_sdr
+        if hasattr(self, "receiver"):
+            self.receiver.close()
+            del self.receiver
+        if hasattr(self, "journal"):
+            self.journal.stop()
+            del self.journal
+        if hasattr(self, "estimator"):
+            close_estimator(self.estimator)
+            del self.estimator
+
+    def reset_average(self):
+        """Start averaging, or peak and min hold, over with the next frame."""
+        if hasattr(self, "averager"):
+            self.averager.reset()
 
     def update_plot(self):
+        if self.is_viewer():
+            self.update_viewer()
+            return
+
         try:
-            if not hasattr(self, "socket_sdr"):
-                raise AttributeError("'ZMQReceiver' object has no attribute 'socket_sdr'")
+            if not hasattr(self, "receiver"):
+                raise AttributeError("'ZMQReceiver' object has no attribute 'receiver'")
+
+            frames = self.receiver.drain()
+            if not frames:
+                return
+
+            # the band indices are only recalculated when the lines moved
+            self.trigger.set_band(self.green_line_1.getPos()[0], self.green_line_2.getPos()[0])
+            self.trigger.threshold = self.vslider.value()
+            self.trigger.invert = self.invert_checkbox.isChecked()
+            ref_level = int(self.ref_value_spinbox.value())
+
+            for tuning, samples, headers in group_by_tuning(frames):
+                if tuning != self.stream_tuning:
+                    self.configure_stream(*tuning)
+
+                if self.fused is not None:
+                    # the kernel reduces the band on the spectrum as displayed, already mirrored
+                    self.fused.set_bands([self.trigger.limits], [False])
+                    spectra = self.fused.transform(samples)
+                else:
+                    spectra = self.estimator.estimate(samples)
+
+                for spectrum, header in zip(spectra, headers):
+                    if self.fused is not None:
+                        fft_data = self.fused.update(spectrum, ref_level, self.trigger.invert, out=self.reference)
+                        levels = BandLevels(*(level[0] for level in self.fused.levels))
+                        crossed = self.trigger.decide(levels)
+                    else:
+                        fft_data = self.averager.update(spectrum)
+                        fft_data = apply_reference(fft_data, ref_level, self.trigger.invert, out=self.reference)
+                        levels, crossed = self.trigger.evaluate(fft_data)
+
+                    # here comes all the triggering etc.
+                    if crossed:
+                        self.send_outputs()
+                        # one journal record per crossing, not per frame above the threshold
+                        if not self.crossed:
+                            self.journal_event(levels, fft_data, header.seq)
+                    self.crossed = crossed
+
+            self.receiver.mark_processed(len(frames))
+
+            if self.spectrum_view.due(time.monotonic()):
+                self.draw_spectrum(self.freqs, fft_data, levels.maximum)
 
-            data = self.socket_sdr.recv(flags=zmq.NOBLOCK)
-            received_array = np.frombuffer(data, dtype=np.float32)
-            
-            fft_data = np.abs(np.fft.fftshift(np.fft.fft(received_array))) ** 2
-            
-            try:
-                
-                fft_data = 10 * np.log10(fft_data)
-                
-            except RuntimeWarning as e:
-                pass
-                #fft_data = np.where(np.isfinite(10 * np.log10(fft_data)), 10 * np.log10(fft_data), 1)
-
-            fft_data = self.get_moving_average(fft_data)
-            
-            if self.invert_checkbox.isChecked():
-                fft_data = -fft_data - int(self.ref_value_spinbox.value())
-            else:
-                fft_data += int(self.ref_value_spinbox.value())
+        except ValueError:
+            pass
+        except AttributeError:
+            QtWidgets.QMessageBox.warning(self, "Error", "Please enter ZMQ address and port")
 
-            self.plot_curve = self.graph_widget.plot(
-                self.freqs[: int(self.data_lframe / 2)],
-                fft_data[: int(self.data_lframe / 2)],
-                pen="w",
-                clear=True,
-            )
-            self.graph_widget.addItem(self.red_line)
-            self.graph_widget.addItem(self.green_line_1)
-            self.graph_widget.addItem(self.green_line_2)
-
-            pos1 = self.green_line_1.getPos()[0]
-            pos2 = self.green_line_2.getPos()[0]
-
-            lower_index = np.searchsorted(self.freqs[: int(self.data_lframe / 2)], pos1)
-            upper_index = np.searchsorted(self.freqs[: int(self.data_lframe / 2)], pos2)
-
-            if (
-                lower_index < int(self.data_lframe / 2)
-                and lower_index > 0
-                and upper_index < int(self.data_lframe / 2)
-                and upper_index > 0
-            ):
-                if lower_index > upper_index:
-                    lower_index, upper_index = upper_index, lower_index
-                graph_max = np.max(fft_data[lower_index:upper_index])
-                graph_min = np.min(fft_data[lower_index:upper_index])
-            else:
-                graph_max = np.max(fft_data)
-                graph_min = np.min(fft_data)
+    def draw_spectrum(self, freqs, fft_data, graph_max, threshold=None):
+        self.spectrum_view.draw(freqs, fft_data, threshold)
 
-            self.graph_max_label.setText(f"Graph Max: {graph_max:.2f} dBm")
+        self.graph_max_label.setText(f"Graph Max: {graph_max:.2f} dBm")
+        self.render_stats_label.setText(
+            f"{self.spectrum_view.fps:.1f} fps, render: {self.spectrum_view.render_time * 1e3:.1f} ms"
+        )
+        if hasattr(self, "receiver"):
+            self.update_frame_stats(self.receiver.stats())
 
-            # here comes all the triggering etc.
-            
-            if (
-                graph_max > self.vslider.value()
-                and not self.invert_checkbox.isChecked()
-            ):
-                if self.rest_checkbox.isChecked():
-                    self.send_to_rest_interface()
-                    if self.triggerbox_checkbox.isChecked():
-                        self.send_to_triggerbox()
-                else:
-                    self.statusbar_show()
-                    self.writeLog()
-                    if self.triggerbox_checkbox.isChecked():
-                        self.send_to_triggerbox()
+    def update_frame_stats(self, stats):
+        self.frame_stats_label.setText(
+            f"Frames rx: {stats['received']} proc: {stats['processed']} drop: {stats['dropped']} "
+            f"other topic: {stats['other_topic']} latency: {stats['latency'] * 1e3:.1f} ms"
+        )
 
-            if graph_min < self.vslider.value() and self.invert_checkbox.isChecked():
-                if self.rest_checkbox.isChecked():
-                    self.send_to_rest_interface()
-                else:
+    def send_outputs(self):
+        if not self.trigger.invert:
+            if self.rest_checkbox.isChecked():
+                self.send_to_rest_interface()
+                if self.triggerbox_checkbox.isChecked():
+                    self.send_to_triggerbox()
+            else:
+                self.statusbar_show()
+                self.writeLog()
+                if self.triggerbox_checkbox.isChecked():
+                    self.send_to_triggerbox()
+        else:
+            if self.rest_checkbox.isChecked():
+                self.send_to_rest_interface()
+            else:
+                self.statusbar_show()
+                self.writeLog()
+
+    def journal_event(self, levels, fft_data, seq):
+        lower, upper = self.trigger.limits
+        band = fft_data[lower:upper]
+        peak = lower + (np.argmin(band) if self.trigger.invert else np.argmax(band))
+        if self.trigger.measure == 'mean':
+            level = levels.mean
+        elif self.trigger.measure == 'power':
+            level = levels.power
+        else:
+            level = fft_data[peak]
+        # the outputs send_outputs asks for
+        outputs = []
+        if self.rest_checkbox.isChecked():
+            outputs.append('rest')
+        elif self.log_checkbox.isChecked():
+            outputs.append('log')
+        if self.triggerbox_checkbox.isChecked() and not self.trigger.invert:
+            outputs.append('triggerbox')
+        event = {
+            'time': time.time(),
+            'seq': seq,
+            'rule': 'gui',
+            'freq1': self.freqs[lower],
+            'freq2': self.freqs[upper - 1],
+            'peak_freq': self.freqs[peak],
+            'level': level,
+            'threshold': self.trigger.threshold,
+            'outputs': outputs,
+        }
+        self.journal.add(event, fft_data, self.freqs[0], self.freqs[1] - self.freqs[0])
+
+    def update_viewer(self):
+        if not hasattr(self, "socket_sdr"):
+            return
+        latest = None
+        try:
+            while True:
+                topic, meta, *payload = self.socket_sdr.recv_multipart(flags=zmq.NOBLOCK)
+                if topic == b"trigger":
                     self.statusbar_show()
-                    self.writeLog()
-
+                else:
+                    latest = (json.loads(meta), payload)
         except zmq.Again:
             pass
-        except ValueError:
-            pass
-        except AttributeError:
-            QtWidgets.QMessageBox.warning(self, "Error", "Please enter ZMQ address and port")
+
+        if latest is None or not self.spectrum_view.due(time.monotonic()):
+            return
+        meta, payload = latest
+        fft_data = np.frombuffer(payload[0], dtype=np.float32)
+        freqs = meta["f0"] + meta["df"] * np.arange(len(fft_data))
+        # with a detector the engine sends the threshold of every bin after the spectrum
+        threshold = np.frombuffer(payload[1], dtype=np.float32) if len(payload) > 1 else None
+        self.red_line.setVisible(threshold is None)
+        self.red_line.setPos(meta["threshold"])
+        self.draw_spectrum(freqs, fft_data, meta["graph_max"], threshold)
+        self.update_frame_stats(meta["frames"])
 
     # ------------ REST interface
     
     def send_to_rest_interface(self):
         if self.busy_rest_interface:
-            print('REST interface is busy.')
+            logger.debug('REST interface is busy.')
         else:
             self.busy_rest_interface = True
             self.actually_send_rest_message(True)
@@ -183,53 +319,38 @@ class ZMQReceiver(MainWindowUI):
         self.rest_checkbox.setStyleSheet('')
         
     def actually_send_rest_message(self, status):
-        headers = {"Content-Type": "application/json"}
-
+        if not hasattr(self, "rest_dispatcher"):
+            return
         if status:
             self.rest_checkbox.setStyleSheet('background-color: purple')
+            self.rest_dispatcher.activate(self.rest_scid)
+        else:
+            self.rest_dispatcher.release(self.rest_scid)
+            # clear up anyways
+            self.rest_checkbox.setStyleSheet('')
 
-            data = {
-                "dynamicSignals": [{"enabled": True, "id": self.rest_scid}],
-                "staticSignals": [],
-            }
-            try:
-                response = requests.put(self.rest_url, json=data, headers=headers)
-                response.raise_for_status()  # Check for HTTP errors
-                # print(response.json())
-
-            except HTTPError as http_err:
-                pass
-                print(f"HTTP error occurred: {http_err}")
-
-            except Exception as err:
-                pass
-                print(f"Other error occurred: {err}")
+    def start_rest_dispatcher(self):
+        if self.is_viewer() or hasattr(self, "rest_dispatcher"):
+            # the engine owns the REST interface
+            return
+        self.rest_dispatcher = RestDispatcher(
+            self.rest_url, timeout=self.rest_timeout, retries=self.rest_retries, backoff=self.rest_backoff
+        )
+        self.rest_dispatcher.start()
 
-        else:
-            data = {
-                "dynamicSignals": [{"enabled": False, "id": self.rest_scid}],
-                "staticSignals": [],
-            }
-            try:
-                response = requests.put(self.rest_url, json=data, headers=headers)
-                response.raise_for_status()  # Check for HTTP errors
-                # print(response.json())
-
-            except HTTPError as http_err:
-                pass
-                print(f"HTTP error occurred: {http_err}")
-
-            except Exception as err:
-                pass
-                print(f"Other error occurred: {err}")
-
-            finally:
-                # clear up anyways
-                self.rest_checkbox.setStyleSheet('')
+    def stop_rest_dispatcher(self):
+        if hasattr(self, "rest_dispatcher"):
+            if self.busy_rest_interface:
+                self.busy_rest_interface_reset()
+            self.rest_dispatcher.stop()
+            del self.rest_dispatcher
 
     # ------------ trigger box section
 
     def start_trigger_server(self):
+        if self.is_viewer():
+            # the engine owns the trigger box socket
+            return
         address = f"{self.zmq_trigger_url}:{self.zmq_trigger_port}"
         # print(f"Trigger server started on {address}")
         self.socket_trigger = self.zmq_context_trigger.socket(zmq.PUB)
@@ -247,7 +368,7 @@ class ZMQReceiver(MainWindowUI):
             
     def send_to_triggerbox(self):
         if self.busy_triggerbox:
-            print('Trigger box show is busy.')
+            logger.debug('Trigger box show is busy.')
         else:
             self.busy_triggerbox = True
             topic = '10002'  # just a number for identification
@@ -265,7 +386,7 @@ class ZMQReceiver(MainWindowUI):
 
     def statusbar_show(self):
         if self.busy_statusbar_show:
-            print('Status bar show is busy.')
+            logger.debug('Status bar show is busy.')
         else:
             self.busy_statusbar_show = True
             self.statusBar().setStyleSheet(
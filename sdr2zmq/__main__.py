@@ -10,9 +10,17 @@ import zmq
 import toml
 import argparse
 import numpy as np
-from time import sleep
+from time import sleep, monotonic, time
 from loguru import logger
-from rtlsdr import RtlSdr
+
+from .capture import RingBuffer, StreamCapture
+from .codec import bytes_to_iq, encode_raw, wire_dtype
+from .frame import FrameHeader, gain_value, send_frame
+from .metrics import Metrics, start_server
+from .devices import Supervisor
+from .channelizer import Channelizer
+from .spectrum import SpectrumPublisher
+from .shmring import open_publisher, slot_bytes_for
 
 def load_config(config_file):
     """Load configuration from a JSON file."""
@@ -34,14 +42,179 @@ def validate_config(config):
             if key not in config[section]:
                 raise KeyError(f"Missing key: {key} in section: {section}")
 
-def signal_handler(sig, frame, sdr, zmq_context):
+    # the asynchronous reads of librtlsdr come in multiples of 512 bytes, i.e. 256 samples
+    sections = [config["sdr"]] + [{**config["sdr"], **device} for device in config.get("devices", [])]
+    for section in sections:
+        if section.get("mode", "poll") == "stream" and section["lframe"] % 256:
+            where = f" of device {section['name']}" if "name" in section else ""
+            raise ValueError(f"lframe = {section['lframe']}{where} is not a multiple of 256 as needed in stream mode")
+
+def signal_handler(sig, frame, sdr, zmq_context, capture=None):
     logger.info('Exiting gracefully...')
+    if capture is not None:
+        capture.stop()
     sdr.close()
-    zmq_context.destroy()
+    if zmq_context is not None:
+        zmq_context.destroy()
     sys.exit(0)
 
+def open_sdr(config):
+    """Open the RTL-SDR by `serial` or `index`, or replay a recorded file if `replay_file` is set."""
+    replay_file = config["sdr"].get("replay_file", "")
+    if replay_file:
+        from .replay import FileReplaySdr
+        return FileReplaySdr(replay_file)
+
+    from rtlsdr import RtlSdr
+    serial = config["sdr"].get("serial", "")
+    if serial:
+        return RtlSdr(serial_number=serial)
+    return RtlSdr(device_index=config["sdr"].get("index", 0))
+
+def configure_sdr(sdr, section):
+    """Apply the tuning of the config section to the SDR."""
+    sdr.sample_rate = section["sample_rate"]
+    sdr.center_freq = section["center_freq"]
+    sdr.freq_correction = section["freq_correction"]
+    sdr.gain = section["gain"]
+
+def frame_template(sdr, config, lframe):
+    """Header with the tuning of the SDR, sequence number and time are filled in per frame."""
+    return FrameHeader(
+        seq=0,
+        timestamp=0.0,
+        sample_rate=float(sdr.sample_rate),
+        center_freq=float(sdr.center_freq),
+        gain=gain_value(config["sdr"]["gain"]),
+        dtype=wire_dtype(config["zmq"].get("encoding", "complex64"), config["zmq"].get("compression", "none")),
+        nsamples=lframe,
+    )
+
+def bind_publisher(zmq_context, config, address=None):
+    """Publisher on the [zmq] address, a shared memory ring for shm:// addresses."""
+    section = config["zmq"]
+    return open_publisher(
+        zmq_context, address or section["address"],
+        slots=section.get("ring_slots", 64),
+        slot_bytes=section.get("ring_slot_bytes") or slot_bytes_for(config["sdr"]["lframe"]),
+    )
+
+def frame_sender(publisher, template, metrics, topic=None, channelizer=None, spectra=None, send_raw=True):
+    """Function that sends one raw frame, its channels and spectrum, shared by both modes."""
+    published = metrics.counter('frames_published', 'Frames sent on the ZMQ socket')
+    publish_time = metrics.histogram('publish_seconds', 'Time to encode and send one frame')
+    channel_time = metrics.histogram('channelize_seconds', 'Time to channelize and send the channels of one frame')
+    spectrum_time = metrics.histogram('spectrum_seconds', 'Time to estimate, average and send the spectrum of one frame')
+    age = metrics.histogram('capture_age_seconds', 'Time from the capture of a frame until it is sent')
+    # channels and spectrum share the conversion to complex64
+    iq = np.empty(template.nsamples, dtype=np.complex64)
+
+    def send(seq, raw, timestamp):
+        start = monotonic()
+        if send_raw:
+            # every frame gets its own buffer, as ZMQ sends it without copying
+            send_frame(publisher, template._replace(seq=seq, timestamp=timestamp), encode_raw(raw, template.dtype), topic)
+        now = monotonic()
+        publish_time.observe(now - start)
+        if channelizer is not None or spectra is not None:
+            bytes_to_iq(raw, iq)
+        if channelizer is not None:
+            channelizer.publish(publisher, iq, seq, timestamp)
+            channel_time.observe(monotonic() - now)
+            now = monotonic()
+        if spectra is not None:
+            spectra.publish(publisher, iq, seq, timestamp)
+            spectrum_time.observe(monotonic() - now)
+        age.observe(time() - timestamp)
+        published.inc()
+
+    return send
+
+def publish_polling(sdr, send, lframe, sleep_time, metrics, stats_interval):
+    """Read one frame at a time and pause in between."""
+    read_time = metrics.histogram('read_seconds', 'Time to read one frame from the SDR')
+    last_stats = monotonic()
+    seq = 0
+    while True:
+        start = monotonic()
+        raw = np.frombuffer(sdr.read_bytes(2 * lframe), dtype=np.uint8)
+        timestamp = time()
+        read_time.observe(monotonic() - start)
+        send(seq, raw, timestamp)
+        seq += 1
+        now = monotonic()
+        if now - last_stats >= stats_interval:
+            last_stats = now
+            logger.info(f"Stats: {metrics.summary()}")
+        sleep(sleep_time)
+
+def publish_streaming(capture, ring, send, stats_interval, metrics):
+    """Publish the frames of the capture ring back-to-back."""
+    metrics.gauge('ring_depth', 'Frames waiting in the capture ring', lambda: ring.write_seq - ring.read_seq)
+    metrics.counter('ring_overruns', 'Frames overwritten in the ring before they were sent', lambda: ring.overruns)
+    metrics.counter('usb_overruns', 'Frames lost between the SDR and the capture thread', lambda: capture.usb_overruns)
+    last_stats = monotonic()
+    frame = np.empty(2 * ring.lframe, dtype=np.uint8)
+    while True:
+        item = ring.read(timeout=1)
+        if item is None:
+            if not capture.is_alive():
+                break
+            continue
+        seq, raw, timestamp = item
+        # copied out of the ring, a frame the capture overwrote meanwhile is not sent
+        frame[:] = raw
+        if not ring.intact(seq):
+            continue
+        send(seq, frame, timestamp)
+
+        now = monotonic()
+        if now - last_stats >= stats_interval:
+            last_stats = now
+            logger.info(f"Stats: {metrics.summary()}")
+
+    if capture.error is not None:
+        raise capture.error
+
+def publish(sdr, config, publisher, metrics, topic=None, on_capture=None):
+    """Publish the frames of a configured SDR in the mode of the config, until it stops.
+
+    In stream mode `on_capture` is called with the capture thread, so it can be stopped.
+    """
+    section = config["sdr"]
+    lframe = section["lframe"]
+    stats_interval = section.get("stats_interval", 10)
+    template = frame_template(sdr, config, lframe)
+    channelizer = None
+    if config.get("channels"):
+        channelizer = Channelizer(config["channels"], template, topic)
+    spectra = None
+    if config.get("spectrum", {}).get("publish", False):
+        spectra = SpectrumPublisher(config["spectrum"], template, topic)
+    send = frame_sender(publisher, template, metrics, topic, channelizer, spectra, config["zmq"].get("raw", True))
+    if section.get("mode", "poll") == "stream":
+        ring = RingBuffer(lframe, section.get("ring_frames", 64))
+        capture = StreamCapture(sdr, ring, metrics=metrics)
+        if on_capture is not None:
+            on_capture(capture)
+        capture.start()
+        publish_streaming(capture, ring, send, stats_interval, metrics)
+    else:
+        publish_polling(sdr, send, lframe, section["sleep_time"], metrics, stats_interval)
+
+def run_devices(config):
+    """Run every device of the [[devices]] tables in its own process."""
+    supervisor = Supervisor(config, config["sdr"].get("restart_delay", 2.0))
+    signal.signal(signal.SIGINT, lambda sig, frame: supervisor.stop())
+    signal.signal(signal.SIGTERM, lambda sig, frame: supervisor.stop())
+    supervisor.run()
+    logger.info('Exiting gracefully...')
+
 def main():
-    signal.signal(signal.SIGINT, lambda sig, frame: signal_handler(sig, frame, sdr, zmq_context))
+    zmq_context = None
+    capture = None
+    publisher = None
+    signal.signal(signal.SIGINT, lambda sig, frame: signal_handler(sig, frame, sdr, zmq_context, capture))
 
     parser = argparse.ArgumentParser(description="sdr2zmq - captures RTL-SDR and publish over ZMQ")
     parser.add_argument("--config", type=str, required=True, help="Path to the configuration file")
@@ -54,50 +227,55 @@ def main():
     # Validate config
     try:
         validate_config(config)
-    except KeyError as e:
+    except (KeyError, ValueError) as e:
         logger.error(f"Configuration error: {e}")
         sys.exit(1)
 
     # Configure logging
     logger.add(sys.stderr, format="{time} {level} {message}", level="INFO")
 
+    if "devices" in config:
+        run_devices(config)
+        return
+
     # Initialize SDR
     try:
-        sdr = RtlSdr()
-        
+        sdr = open_sdr(config)
+
     except Exception as e:
         logger.error(f"Maybe SDR device is not connected. Aborting...")
         sys.exit()
         
     try:
         # Configure SDR using settings from TOML file
-        sdr.sample_rate = config["sdr"]["sample_rate"]
-        sdr.center_freq = config["sdr"]["center_freq"]
-        sdr.freq_correction = config["sdr"]["freq_correction"]
-        sdr.gain = config["sdr"]["gain"]
-        sleep_time = config["sdr"]["sleep_time"]
-        lframe = config["sdr"]["lframe"]
+        configure_sdr(sdr, config["sdr"])
 
         logger.info("SDR configured. Starting ZMQ publisher...")
 
         # Set up ZMQ context and PUB socket using settings from TOML file
         zmq_context = zmq.Context()
-        publisher = zmq_context.socket(zmq.PUB)
-        publisher.bind(config["zmq"]["address"])
-
-        while True:
-            samples = sdr.read_samples(lframe)
-            # original samples are float64
-            samples_float32 = np.vstack((samples.real, samples.imag)).reshape((-1,), order='F').astype(np.float32)
-            #publisher.send(samples.tobytes())
-            publisher.send(samples_float32.tobytes())
-            logger.info(f"Published {lframe} samples.")
-            sleep(sleep_time)
+        publisher = bind_publisher(zmq_context, config)
+
+        metrics = Metrics('sdr2zmq')
+        start_server(metrics, config.get("metrics", {}))
+
+        def started(stream_capture):
+            nonlocal capture
+            capture = stream_capture
+
+        publish(sdr, config, publisher, metrics, on_capture=started)
 
     except Exception as e:
         logger.error(f"An error occurred: {e}")
+        if capture is not None:
+            capture.stop()
         sdr.close()
-        zmq_context.destroy()
+        if zmq_context is not None:
+            zmq_context.destroy()
+    finally:
+        # a shared memory ring is removed with the publisher
+        if publisher is not None:
+            publisher.close(linger=0)
 
 #-------------------------
 if __name__ == '__main__':
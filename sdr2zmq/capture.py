@@ -0,0 +1,117 @@
+import time
+import threading
+import numpy as np
+
+
+class RingBuffer:
+    """Preallocated ring of raw 8 bit I/Q frames.
+
+    Filled by the capture thread and emptied by the publisher. The writer
+    fills the slot of `write_seq` before it counts it as written, so that
+    slot is never handed out. When the publisher falls behind by more than
+    the rest of the ring, the oldest frames are skipped and counted as
+    overruns. A frame that is overwritten while the publisher still holds it
+    is caught by `intact`.
+    """
+
+    def __init__(self, lframe, nframes):
+        self.lframe = lframe
+        self.nframes = nframes
+        self.buffer = np.zeros((nframes, 2 * lframe), dtype=np.uint8)
+        self.timestamps = np.zeros(nframes)
+        self.write_seq = 0
+        self.read_seq = 0
+        self.overruns = 0
+        self.cond = threading.Condition()
+
+    def write(self, raw, timestamp):
+        """Copy one frame of raw bytes into the next slot."""
+        self.buffer[self.write_seq % self.nframes] = raw
+        self.timestamps[self.write_seq % self.nframes] = timestamp
+        with self.cond:
+            self.write_seq += 1
+            self.cond.notify()
+
+    def read(self, timeout=None):
+        """Return (sequence number, frame view, timestamp) of the next frame, or None on timeout.
+
+        The view stays valid until the writer comes around the ring to its
+        slot, which `intact` tells after the frame was copied out.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.read_seq < self.write_seq, timeout):
+                return None
+            # the slot of write_seq may be in the middle of being written
+            if self.write_seq - self.read_seq >= self.nframes:
+                self.overruns += self.write_seq - self.read_seq - self.nframes + 1
+                self.read_seq = self.write_seq - self.nframes + 1
+            seq = self.read_seq
+            self.read_seq += 1
+        return seq, self.buffer[seq % self.nframes], self.timestamps[seq % self.nframes]
+
+    def intact(self, seq):
+        """Whether frame `seq` is still in its slot, counted as an overrun if not."""
+        with self.cond:
+            if self.write_seq - seq < self.nframes:
+                return True
+            self.overruns += 1
+            return False
+
+
+class StreamCapture(threading.Thread):
+    """Streams the SDR with async reads into a ring buffer, without any pause.
+
+    librtlsdr silently drops USB transfers when the callback is too slow, so
+    once per `check_interval` the number of delivered frames is compared with
+    the elapsed time. Shortfalls are counted as `usb_overruns` (in frames).
+    """
+
+    def __init__(self, sdr, ring, check_interval=1.0, slack=2, metrics=None):
+        super().__init__(name='sdr-capture', daemon=True)
+        self.sdr = sdr
+        self.ring = ring
+        self.check_interval = check_interval
+        self.slack = slack
+        self.frames = 0
+        self.usb_overruns = 0
+        self.window_start = None
+        self.window_frames = 0
+        self.error = None
+        self.capture_time = None
+        if metrics is not None:
+            self.capture_time = metrics.histogram('capture_seconds', 'Time spent in the capture callback per frame')
+
+    def run(self):
+        try:
+            self.sdr.read_bytes_async(self.callback, 2 * self.ring.lframe)
+        except Exception as e:
+            self.error = e
+        finally:
+            # wake up the publisher
+            with self.ring.cond:
+                self.ring.cond.notify_all()
+
+    def callback(self, values, context):
+        start = time.monotonic()
+        self.ring.write(np.frombuffer(values, dtype=np.uint8), time.time())
+        self.frames += 1
+
+        now = time.monotonic()
+        if self.capture_time is not None:
+            self.capture_time.observe(now - start)
+        if self.window_start is None:
+            # the first frame is complete when the clock starts
+            self.window_start = now
+            return
+        self.window_frames += 1
+        elapsed = now - self.window_start
+        if elapsed >= self.check_interval:
+            expected = int(elapsed * self.sdr.sample_rate / self.ring.lframe)
+            if expected - self.window_frames > self.slack:
+                self.usb_overruns += expected - self.window_frames
+            self.window_start = now
+            self.window_frames = 0
+
+    def stop(self):
+        self.sdr.cancel_read_async()
+
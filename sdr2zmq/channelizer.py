@@ -0,0 +1,91 @@
+import numpy as np
+
+from .frame import DTYPE_CF32, send_frame
+
+
+def lowpass(ntaps, cutoff):
+    """Windowed-sinc lowpass with unity gain at DC, `cutoff` relative to the sample rate."""
+    n = np.arange(ntaps) - (ntaps - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.blackman(ntaps)
+    return taps / np.sum(taps)
+
+
+class Channel:
+    """Narrowband channel cut out of the wideband stream.
+
+    The frame is mixed down by a numerically controlled oscillator and then
+    lowpass filtered and decimated in one step: only every `decimation`-th
+    output of the FIR filter is computed, which is what a polyphase
+    decimator does. Oscillator phase and the last input samples are kept
+    between frames, so consecutive frames join without edge effects.
+    """
+
+    def __init__(self, name, lframe, sample_rate, center_freq, frequency, decimation,
+                 taps_per_phase=16, bandwidth=0.8):
+        if decimation < 1 or lframe % decimation:
+            raise ValueError(f"Channel {name}: frame of {lframe} samples cannot be decimated by {decimation}")
+        offset = frequency - center_freq
+        if abs(offset) >= sample_rate / 2:
+            raise ValueError(f"Channel {name}: {frequency} Hz is outside of the captured band")
+        self.name = name
+        self.lframe = lframe
+        self.decimation = decimation
+        self.sample_rate = sample_rate / decimation
+        self.frequency = frequency
+
+        # oscillator for one frame, continued by a phase step per frame
+        step = -2 * np.pi * offset / sample_rate
+        self.oscillator = np.exp(1j * step * np.arange(lframe)).astype(np.complex64)
+        self.frame_step = step * lframe
+        self.phase = 0.0
+
+        ntaps = taps_per_phase * decimation if decimation > 1 else 1
+        # reversed, so that the filter is a dot product with the sliding windows
+        self.taps = lowpass(ntaps, bandwidth / (2 * decimation))[::-1].astype(np.complex64)
+        # the last ntaps - 1 input samples followed by the new frame
+        self.history = ntaps - 1
+        self.buffer = np.zeros(self.history + lframe, dtype=np.complex64)
+        self.windows = np.lib.stride_tricks.sliding_window_view(self.buffer, ntaps)[decimation - 1::decimation]
+
+    def process(self, samples):
+        """Mix, filter and decimate one frame into a new complex64 array."""
+        mixed = self.buffer[self.history:]
+        np.multiply(samples, self.oscillator, out=mixed)
+        mixed *= np.complex64(np.exp(1j * self.phase))
+        self.phase = (self.phase + self.frame_step) % (2 * np.pi)
+        out = self.windows @ self.taps
+        self.buffer[:self.history] = self.buffer[self.lframe:]
+        return out
+
+
+class Channelizer:
+    """Publishes every channel of the [[channels]] tables on its own topic.
+
+    Channels are given by `frequency` in Hz and `decimation`, the topic is
+    the channel name, after the device topic if there is one.
+    """
+
+    def __init__(self, channels, template, topic=None):
+        self.template = template
+        self.channels = []
+        for i, section in enumerate(channels):
+            name = section.get('name', f"ch{i}")
+            channel = Channel(
+                name, template.nsamples, template.sample_rate, template.center_freq,
+                section['frequency'], section['decimation'],
+                taps_per_phase=section.get('taps_per_phase', 16),
+                bandwidth=section.get('bandwidth', 0.8),
+            )
+            channel_topic = name.encode() if topic is None else topic + b'/' + name.encode()
+            header = template._replace(
+                sample_rate=channel.sample_rate,
+                center_freq=channel.frequency,
+                dtype=DTYPE_CF32,
+                nsamples=template.nsamples // channel.decimation,
+            )
+            self.channels.append((channel, channel_topic, header))
+
+    def publish(self, publisher, iq, seq, timestamp):
+        """Channelize one frame of I/Q and send every channel."""
+        for channel, topic, header in self.channels:
+            send_frame(publisher, header._replace(seq=seq, timestamp=timestamp), channel.process(iq), topic)
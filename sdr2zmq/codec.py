@@ -0,0 +1,139 @@
+import numpy as np
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .frame import (
+    DTYPE_CF32, DTYPE_CU8, DTYPE_CI16, DTYPE_SPEC_F16, DTYPE_SPEC_F32,
+    COMPRESS_LZ4, COMPRESS_ZSTD, COMPRESSION_MASK,
+)
+
+ENCODINGS = {
+    'complex64': DTYPE_CF32,
+    'float32': DTYPE_CF32,  # interleaved float32 I/Q is the same as complex64
+    'int16': DTYPE_CI16,
+    'uint8': DTYPE_CU8,
+}
+
+SPECTRUM_DTYPES = {
+    'float16': DTYPE_SPEC_F16,
+    'float32': DTYPE_SPEC_F32,
+}
+
+COMPRESSIONS = {
+    'none': 0,
+    'lz4': COMPRESS_LZ4,
+    'zstd': COMPRESS_ZSTD,
+}
+
+# int16 full scale of the 8 bit samples, (u8 - 127.5) * 256 stays integer
+CI16_SCALE = 32640
+
+
+def wire_dtype(encoding, compression='none'):
+    """Header dtype for an encoding and compression name from the config."""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding: {encoding}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == 'lz4' and lz4 is None:
+        raise ValueError("lz4 compression needs the lz4 package")
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError("zstd compression needs the zstandard package")
+    return ENCODINGS[encoding] | COMPRESSIONS[compression]
+
+
+def bytes_to_iq(raw, out):
+    """Convert raw 8 bit I/Q into normalized complex64 samples in `out`."""
+    iq = out.view(np.float32)
+    np.multiply(raw, 1 / 127.5, out=iq, casting='unsafe')
+    iq -= 1
+    return out
+
+
+def encode_raw(raw, dtype):
+    """Encode raw 8 bit I/Q from the SDR into a new payload buffer of the given header dtype."""
+    encoding = dtype & ~COMPRESSION_MASK
+    if encoding == DTYPE_CU8:
+        payload = raw.copy()
+    elif encoding == DTYPE_CI16:
+        payload = raw.astype(np.int16)
+        payload -= 128
+        payload *= 256
+        payload += 128
+    elif encoding == DTYPE_CF32:
+        payload = bytes_to_iq(raw, np.empty(len(raw) // 2, dtype=np.complex64))
+    else:
+        raise ValueError(f"Unknown sample type {encoding}")
+    return compress(payload, dtype)
+
+
+def compress(payload, dtype):
+    compression = dtype & COMPRESSION_MASK
+    if compression == COMPRESS_LZ4:
+        return lz4.frame.compress(payload)
+    if compression == COMPRESS_ZSTD:
+        return zstandard.ZstdCompressor(level=1).compress(payload)
+    return payload
+
+
+def decompress(payload, dtype):
+    compression = dtype & COMPRESSION_MASK
+    if compression == COMPRESS_LZ4:
+        if lz4 is None:
+            raise ValueError("Stream is lz4 compressed but the lz4 package is missing")
+        return lz4.frame.decompress(payload)
+    if compression == COMPRESS_ZSTD:
+        if zstandard is None:
+            raise ValueError("Stream is zstd compressed but the zstandard package is missing")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return payload
+
+
+def decode_payload(header, payload, out=None):
+    """Return the payload as normalized complex64 samples, a view where possible.
+
+    Spectra are returned as float32 dBm values. Payloads that have to be
+    converted are written into `out` if it is given, an array of
+    `nsamples` complex64 samples or float32 bins, instead of a new array.
+    """
+    payload = decompress(payload, header.dtype)
+    encoding = header.dtype & ~COMPRESSION_MASK
+    if encoding == DTYPE_CF32:
+        samples = np.frombuffer(payload, dtype=np.complex64)
+    elif encoding == DTYPE_CU8:
+        raw = np.frombuffer(payload, dtype=np.uint8)
+        check_length(header, len(raw) // 2)
+        samples = bytes_to_iq(raw, np.empty(len(raw) // 2, dtype=np.complex64) if out is None else out)
+    elif encoding == DTYPE_CI16:
+        iq = np.frombuffer(payload, dtype=np.int16)
+        check_length(header, len(iq) // 2)
+        if out is None:
+            out = np.empty(len(iq) // 2, dtype=np.complex64)
+        np.multiply(iq, np.float32(1 / CI16_SCALE), out=out.view(np.float32))
+        samples = out
+    elif encoding == DTYPE_SPEC_F16:
+        bins = np.frombuffer(payload, dtype=np.float16)
+        check_length(header, len(bins))
+        if out is None:
+            out = np.empty(len(bins), dtype=np.float32)
+        np.copyto(out, bins)
+        samples = out
+    elif encoding == DTYPE_SPEC_F32:
+        samples = np.frombuffer(payload, dtype=np.float32)
+    else:
+        raise ValueError(f"Unknown sample type {encoding}")
+    check_length(header, len(samples))
+    return samples
+
+
+def check_length(header, n):
+    if n != header.nsamples:
+        raise ValueError(f"Frame has {n} samples instead of {header.nsamples}")
@@ -0,0 +1,179 @@
+import os
+import sys
+import signal
+import tempfile
+import threading
+import multiprocessing
+import zmq
+from time import monotonic
+from loguru import logger
+
+from .metrics import Metrics, start_server
+from .shmring import is_ring_address
+
+
+def device_configs(config):
+    """One config per [[devices]] table, the settings not given are taken from [sdr]."""
+    configs = []
+    for i, device in enumerate(config['devices']):
+        section = {**config['sdr'], **device}
+        section.setdefault('name', f"sdr{i}")
+        section.setdefault('topic', section['name'])
+        configs.append({
+            'sdr': section,
+            'channels': section.pop('channels', []),
+            'spectrum': {**config.get('spectrum', {}), **section.pop('spectrum', {})},
+            'zmq': config['zmq'],
+            'metrics': {**config.get('metrics', {}), 'port': section.get('metrics_port', 0)},
+        })
+    return configs
+
+
+def run_device(config, backend_address):
+    """Capture one device and publish its frames with its topic to the backend of the proxy.
+
+    With a shm:// address every device writes to a ring of its own,
+    named after the address and the device.
+    """
+    # imported here to avoid a circular import with the entry point
+    from .__main__ import open_sdr, configure_sdr, publish, bind_publisher
+
+    section = config['sdr']
+    name = section['name']
+    if section.get('cpu') is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {section['cpu']})
+
+    stopping = threading.Event()
+    capture = None
+
+    def stop(sig, frame):
+        stopping.set()
+        if capture is not None:
+            capture.stop()
+        else:
+            # poll mode has no capture thread to wait for
+            raise SystemExit(0)
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor decides
+    signal.signal(signal.SIGTERM, stop)
+
+    logger.info(f"Device {name}: opening in process {os.getpid()}")
+    sdr = open_sdr(config)
+    zmq_context = zmq.Context()
+    publisher = None
+    try:
+        configure_sdr(sdr, section)
+        address = config['zmq']['address']
+        if is_ring_address(address):
+            publisher = bind_publisher(zmq_context, config, f"{address}-{name}")
+        else:
+            publisher = zmq_context.socket(zmq.PUB)
+            publisher.connect(backend_address)
+        metrics = Metrics('sdr2zmq')
+        start_server(metrics, config['metrics'])
+
+        def started(stream_capture):
+            nonlocal capture
+            capture = stream_capture
+            if stopping.is_set():
+                capture.stop()
+
+        publish(sdr, config, publisher, metrics, topic=section['topic'].encode(), on_capture=started)
+    finally:
+        sdr.close()
+        if publisher is not None:
+            publisher.close(linger=0)
+        zmq_context.destroy(linger=0)
+    if not stopping.is_set():
+        # a capture that ends on its own is a failure
+        sys.exit(1)
+
+
+class Supervisor:
+    """Runs every device in its own process and restarts the ones that fail.
+
+    The device processes publish to the XSUB side of a proxy, which forwards
+    all frames to the single XPUB socket on the configured address. Each
+    device sends its frames with its own topic. Shared memory rings have a
+    single writer, so with a shm:// address there is no proxy and every
+    device gets its own ring "<address>-<name>".
+    """
+
+    def __init__(self, config, restart_delay=2.0):
+        self.configs = device_configs(config)
+        self.address = config['zmq']['address']
+        self.backend_address = config['zmq'].get(
+            'backend', f"ipc://{tempfile.gettempdir()}/sdr2zmq-{os.getpid()}"
+        )
+        self.restart_delay = restart_delay
+        self.stopping = threading.Event()
+        self.processes = {}
+        self.restart_at = {}
+        self.restarts = {}
+        # fork would copy the ZMQ context of the proxy into the children
+        self.mp_context = multiprocessing.get_context('spawn')
+
+    def start(self, i):
+        config = self.configs[i]
+        process = self.mp_context.Process(
+            target=run_device, args=(config, self.backend_address), name=f"sdr2zmq-{config['sdr']['name']}"
+        )
+        process.start()
+        self.processes[i] = process
+
+    def proxy(self, zmq_context):
+        frontend = zmq_context.socket(zmq.XPUB)
+        frontend.bind(self.address)
+        backend = zmq_context.socket(zmq.XSUB)
+        backend.bind(self.backend_address)
+        try:
+            zmq.proxy(backend, frontend)
+        except zmq.ZMQError:
+            # the context is destroyed on shutdown
+            pass
+        finally:
+            frontend.close(linger=0)
+            backend.close(linger=0)
+
+    def run(self):
+        zmq_context = zmq.Context()
+        if is_ring_address(self.address):
+            names = ', '.join(f"{self.address}-{config['sdr']['name']}" for config in self.configs)
+            logger.info(f"Publishing {len(self.configs)} devices on {names}")
+        else:
+            proxy = threading.Thread(target=self.proxy, args=(zmq_context,), name='sdr2zmq-proxy', daemon=True)
+            proxy.start()
+            logger.info(f"Publishing {len(self.configs)} devices on {self.address}")
+        for i in range(len(self.configs)):
+            self.start(i)
+        try:
+            while not self.stopping.is_set():
+                self.check(monotonic())
+                self.stopping.wait(0.5)
+        finally:
+            for process in self.processes.values():
+                if process.is_alive():
+                    process.terminate()
+            for process in self.processes.values():
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.kill()
+            zmq_context.destroy(linger=0)
+
+    def check(self, now):
+        """Restart the devices whose process has ended, after `restart_delay`."""
+        for i, process in self.processes.items():
+            if process.is_alive():
+                continue
+            name = self.configs[i]['sdr']['name']
+            if i not in self.restart_at:
+                logger.error(f"Device {name} stopped with exit code {process.exitcode}, restarting in {self.restart_delay} s")
+                self.restart_at[i] = now + self.restart_delay
+            elif now >= self.restart_at[i]:
+                del self.restart_at[i]
+                self.restarts[i] = self.restarts.get(i, 0) + 1
+                logger.info(f"Restarting device {name} (restart {self.restarts[i]})")
+                self.start(i)
+
+    def stop(self):
+        self.stopping.set()
@@ -0,0 +1,74 @@
+import struct
+from collections import namedtuple
+
+# Every message on the stream is [header, payload], optionally preceded by a
+# topic part. The header has a fixed size, the payload is sent as is.
+MAGIC = b'SDRZ'
+VERSION = 1
+HEADER_FORMAT = '<4sHHQdddfI'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# payload types in the low byte of dtype
+DTYPE_CF32 = 1  # interleaved float32 I/Q, same layout as complex64
+DTYPE_CU8 = 2   # raw interleaved 8 bit I/Q as delivered by the RTL-SDR
+DTYPE_CI16 = 3  # interleaved int16 I/Q
+DTYPE_SPEC_F16 = 4  # power spectrum in dBm as float16, bins in ascending frequency
+DTYPE_SPEC_F32 = 5  # power spectrum in dBm as float32
+
+# payload compression in the high byte of dtype
+COMPRESS_LZ4 = 0x100
+COMPRESS_ZSTD = 0x200
+COMPRESSION_MASK = 0xff00
+
+FrameHeader = namedtuple(
+    'FrameHeader', ['seq', 'timestamp', 'sample_rate', 'center_freq', 'gain', 'dtype', 'nsamples']
+)
+
+
+def pack_header(header):
+    return struct.pack(
+        HEADER_FORMAT, MAGIC, VERSION, header.dtype, header.seq, header.timestamp,
+        header.sample_rate, header.center_freq, header.gain, header.nsamples,
+    )
+
+
+def unpack_header(data):
+    if len(data) != HEADER_SIZE:
+        raise ValueError(f"Frame header has {len(data)} bytes instead of {HEADER_SIZE}")
+    magic, version, dtype, seq, timestamp, sample_rate, center_freq, gain, nsamples = struct.unpack(
+        HEADER_FORMAT, data
+    )
+    if magic != MAGIC:
+        raise ValueError(f"Not a sdr2zmq frame: {magic!r}")
+    if version != VERSION:
+        raise ValueError(f"Unsupported frame version {version}")
+    return FrameHeader(seq, timestamp, sample_rate, center_freq, gain, dtype, nsamples)
+
+
+def is_spectrum(dtype):
+    """True if the payload is a power spectrum instead of I/Q samples.
+
+    For spectra `nsamples` is the number of bins, which together with
+    sample rate and center frequency gives the frequency axis.
+    """
+    return dtype & ~COMPRESSION_MASK in (DTYPE_SPEC_F16, DTYPE_SPEC_F32)
+
+
+def gain_value(gain):
+    """Numeric gain for the header, NaN stands for automatic gain."""
+    return float('nan') if gain == 'auto' else float(gain)
+
+
+def send_frame(socket, header, payload, topic=None):
+    """Send header and payload, the payload buffer is not copied."""
+    parts = [pack_header(header), payload]
+    if topic is not None:
+        parts.insert(0, topic)
+    socket.send_multipart(parts, copy=False)
+
+
+def parse_frame(parts):
+    """Return (header, payload) of a received multipart message."""
+    if len(parts) not in (2, 3):
+        raise ValueError(f"Frame has {len(parts)} parts")
+    return unpack_header(bytes(parts[-2])), parts[-1]
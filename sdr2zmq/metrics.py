@@ -0,0 +1,191 @@
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Counter:
+    """Monotonic count, either incremented or read from `fn` when exported."""
+
+    kind = 'counter'
+    suffix = '_total'
+
+    def __init__(self, name, help, fn=None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+    @property
+    def family(self):
+        return self.name + self.suffix
+
+    def lines(self):
+        return [f"{self.family} {self.get()}"]
+
+    def summary(self):
+        return self.get()
+
+
+class Gauge(Counter):
+    """Current value like a queue depth, set or read from `fn` when exported."""
+
+    kind = 'gauge'
+    suffix = ''
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """Latency histogram in seconds with logarithmic buckets.
+
+    Like HDR histograms the bucket width grows with the value, so the relative
+    error is the same from microseconds to seconds: `per_octave` buckets per
+    factor of two between `lowest` and `highest`. Recording is a logarithm
+    and an increment, cheap enough for every frame.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, lowest=1e-6, highest=10.0, per_octave=4):
+        self.name = name
+        self.help = help
+        self.lowest = lowest
+        self.per_octave = per_octave
+        nbuckets = int(math.ceil(math.log2(highest / lowest) * per_octave)) + 1
+        self.bounds = [lowest * 2 ** (i / per_octave) for i in range(nbuckets)]
+        # the last bucket takes everything above the highest bound
+        self.counts = [0] * (nbuckets + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    @property
+    def family(self):
+        return self.name
+
+    def observe(self, seconds):
+        if seconds <= self.lowest:
+            index = 0
+        else:
+            index = min(int(math.ceil(math.log2(seconds / self.lowest) * self.per_octave)), len(self.bounds))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def lines(self):
+        lines = []
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            lines.append(f'{self.name}_bucket{{le="{bound:.3g}"}} {total}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+class Metrics:
+    """Registry of the counters, gauges and histograms of one process.
+
+    The values are exported on demand in the Prometheus text format, or as a
+    dict for the log and the ZMQ stats topic, never per frame.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.metrics = {}
+
+    def add(self, metric):
+        metric.name = f"{self.prefix}_{metric.name}"
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, fn=None):
+        return self.add(Counter(name, help, fn))
+
+    def gauge(self, name, help, fn=None):
+        return self.add(Gauge(name, help, fn))
+
+    def histogram(self, name, help, **kwargs):
+        return self.add(Histogram(name, help, **kwargs))
+
+    def prometheus(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.family} {metric.help}")
+            lines.append(f"# TYPE {metric.family} {metric.kind}")
+            lines.extend(metric.lines())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        return {name[len(self.prefix) + 1:]: metric.summary() for name, metric in self.metrics.items()}
+
+
+class MetricsServer(threading.Thread):
+    """Serves the metrics in the Prometheus text format on http://address:port/metrics."""
+
+    def __init__(self, metrics, port, address='127.0.0.1'):
+        super().__init__(name='metrics-server', daemon=True)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((address, port), Handler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_server(metrics, section):
+    """Start the HTTP endpoint of the [metrics] config section, None if no port is set."""
+    port = section.get('port', 0)
+    if not port:
+        return None
+    server = MetricsServer(metrics, port, section.get('address', '127.0.0.1'))
+    server.start()
+    return server
@@ -0,0 +1,59 @@
+import time
+import numpy as np
+
+
+class FileReplaySdr:
+    """Stand-in for `rtlsdr.RtlSdr` that replays a recorded file.
+
+    The file holds raw interleaved 8 bit I/Q as written by `rtl_sdr`. It is
+    looped endlessly and, if `realtime` is set, paced at the sample rate.
+    """
+
+    def __init__(self, filename, realtime=True):
+        self.data = np.memmap(filename, dtype=np.uint8, mode='r')
+        self.realtime = realtime
+        self.position = 0
+        self.sample_rate = 2.048e6
+        self.center_freq = 0
+        self.freq_correction = 0
+        self.gain = 0
+        self.read_async_canceling = False
+
+    def read_bytes(self, num_bytes):
+        num_bytes = int(num_bytes)
+        idx = (self.position + np.arange(num_bytes)) % len(self.data)
+        self.position = (self.position + num_bytes) % len(self.data)
+        return self.data[idx]
+
+    def read_samples(self, num_samples):
+        return self.packed_bytes_to_iq(self.read_bytes(2 * num_samples))
+
+    @staticmethod
+    def packed_bytes_to_iq(raw):
+        iq = raw.astype(np.float64).view(np.complex128)
+        iq /= 127.5
+        iq -= (1 + 1j)
+        return iq
+
+    def read_bytes_async(self, callback, num_bytes, context=None):
+        self.read_async_canceling = False
+        start = time.monotonic()
+        sent = 0
+        while not self.read_async_canceling:
+            callback(self.read_bytes(num_bytes), context or self)
+            sent += num_bytes
+            if self.realtime:
+                delay = start + sent / 2 / self.sample_rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def read_samples_async(self, callback, num_samples, context=None):
+        def converter(raw, context):
+            callback(self.packed_bytes_to_iq(raw), context)
+        self.read_bytes_async(converter, 2 * num_samples, context)
+
+    def cancel_read_async(self):
+        self.read_async_canceling = True
+
+    def close(self):
+        self.cancel_read_async()
@@ -1,45 +1,341 @@
+#
+# SDR2ZMQ simulator
+# Synthetic I/Q in the sdr2zmq wire format, driven by a scenario file
+# (2025) xaratustrah@github
+#
+
+import sys
+import json
+import signal
+import argparse
+import threading
 import zmq
+import toml
 import numpy as np
-import time
-import sys
-import select
+from collections import namedtuple
+from time import sleep, monotonic, time
 from loguru import logger
 
-lframe = 2048
+from .codec import encode_raw, wire_dtype
+from .frame import FrameHeader, send_frame
+from .shmring import open_publisher, slot_bytes_for
+
+EVENT_KINDS = ('tone', 'chirp', 'drift', 'noise_step')
+
+# start and stop in samples since the start of the stream, frequencies in Hz
+Occurrence = namedtuple(
+    'Occurrence', ['index', 'name', 'kind', 'start', 'stop', 'frequency', 'stop_frequency', 'level', 'expect']
+)
+
+
+def load_scenario(events, sample_rate):
+    """All occurrences of the [[events]] tables, repeated every `period` seconds `count` times."""
+    occurrences = []
+    for i, event in enumerate(events):
+        kind = event.get('kind', 'tone')
+        if kind not in EVENT_KINDS:
+            raise ValueError(f"Unknown event kind: {kind}")
+        name = event.get('name', f"{kind}{i}")
+        duration = event['duration']
+        frequency = event.get('frequency', 0.0)
+        if kind == 'chirp':
+            stop_frequency = event['stop_frequency']
+        elif kind == 'drift':
+            stop_frequency = frequency + event['drift'] * duration
+        else:
+            stop_frequency = frequency
+        period = event.get('period', 0)
+        count = event.get('count', 1) if period else 1
+        for n in range(count):
+            start = event['start'] + n * period
+            occurrences.append(Occurrence(
+                len(occurrences), name, kind,
+                int(round(start * sample_rate)), int(round((start + duration) * sample_rate)),
+                frequency, stop_frequency, event['level'],
+                # a changed noise floor is not supposed to trigger
+                event.get('expect', kind != 'noise_step'),
+            ))
+    occurrences.sort(key=lambda o: o.start)
+    return occurrences
+
+
+class Simulator:
+    """Generates frames of synthetic I/Q with the events of a scenario.
+
+    Nothing is computed from scratch per frame: the noise is cut at a random
+    offset out of a pool of pre-generated complex Gaussian noise, and the
+    signals are looked up in a sine table with a phase that continues
+    over frame boundaries. Levels are in dB relative to full scale, the
+    8 bit range of the RTL-SDR.
+    """
+
+    def __init__(self, section, events, table_bits=16):
+        self.sample_rate = section.get('sample_rate', 2.048e6)
+        self.center_freq = section.get('center_freq', 410e6)
+        self.lframe = section.get('lframe', 16384)
+        self.noise_amplitude = 10 ** (section.get('noise_level', -30) / 20)
+        self.rng = np.random.default_rng(section.get('seed'))
+        self.occurrences = load_scenario(events, self.sample_rate)
+        for o in self.occurrences:
+            for frequency in (o.frequency, o.stop_frequency):
+                if o.kind != 'noise_step' and abs(frequency - self.center_freq) >= self.sample_rate / 2:
+                    raise ValueError(f"Event {o.name}: {frequency} Hz is outside of the simulated band")
+
+        self.table_bits = table_bits
+        self.table = np.exp(2j * np.pi * np.arange(2 ** table_bits) / 2 ** table_bits).astype(np.complex64)
+        # noise pool of `noise_frames` frames, read at random offsets
+        npool = section.get('noise_frames', 32) * self.lframe
+        self.pool = (
+            (self.rng.standard_normal(npool + self.lframe) + 1j * self.rng.standard_normal(npool + self.lframe))
+            * np.sqrt(0.5)
+        ).astype(np.complex64)
+        self.npool = npool
+        self.iq = np.empty(self.lframe, dtype=np.complex64)
+        self.work = np.empty(self.lframe, dtype=np.complex64)
+        self.index = np.empty(self.lframe, dtype=np.int64)
+        self.phase = np.empty(self.lframe)
+        self.tau = np.empty(self.lframe)
+        self.samples = np.arange(self.lframe, dtype=np.float64)
+        self.raw = np.empty(2 * self.lframe, dtype=np.uint8)
+        self.next = 0  # first occurrence that has not ended yet
+
+    def frame(self, seq):
+        """Complex I/Q of frame `seq` and the occurrences that are in it."""
+        first = seq * self.lframe
+        last = first + self.lframe
+        offset = self.rng.integers(self.npool)
+        np.multiply(self.pool[offset:offset + self.lframe], self.noise_amplitude, out=self.iq)
+
+        while self.next < len(self.occurrences) and self.occurrences[self.next].stop <= first:
+            self.next += 1
+        active = []
+        for o in self.occurrences[self.next:]:
+            if o.start >= last:
+                break
+            if o.stop <= first:
+                continue
+            active.append(o)
+        # the noise is scaled before any signal is added, so a noise step does not change the signals
+        for o in sorted(active, key=lambda o: o.kind != 'noise_step'):
+            a = max(o.start, first) - first
+            b = min(o.stop, last) - first
+            if o.kind == 'noise_step':
+                # the level is relative to the noise floor
+                self.iq[a:b] *= 10 ** (o.level / 20)
+            else:
+                self.add_signal(o, first, a, b)
+        return self.iq, active
+
+    def add_signal(self, o, first, a, b):
+        """Add the signal of an occurrence to the samples a:b of the frame."""
+        # cycles since the start of the occurrence, frequency linear in time
+        tau = self.tau[:b - a]
+        np.add(self.samples[:b - a], first + a - o.start, out=tau)
+        tau /= self.sample_rate
+        f0 = o.frequency - self.center_freq
+        rate = (o.stop_frequency - o.frequency) * self.sample_rate / (o.stop - o.start)
+        phase = self.phase[:b - a]
+        np.multiply(tau, 0.5 * rate, out=phase)
+        phase += f0
+        phase *= tau
+        phase -= np.floor(phase)
+        phase *= 2 ** self.table_bits
+        index = self.index[:b - a]
+        np.copyto(index, phase, casting='unsafe')
+        work = self.work[:b - a]
+        np.take(self.table, index, out=work)
+        work *= 10 ** (o.level / 20)
+        self.iq[a:b] += work
 
-def generate_noisy_sine_wave(freq=100, amplitude=1):
-    t = np.linspace(0, 1, lframe)
-    sine_wave = amplitude * np.sin(2 * np.pi * freq * t)
-    noise = np.random.normal(0, 0.1, sine_wave.shape)
-    return (sine_wave + noise).astype(np.float32)
+    def raw_samples(self, iq):
+        """8 bit interleaved I/Q as the RTL-SDR delivers it."""
+        scaled = self.work.view(np.float32)
+        np.multiply(iq.view(np.float32), 127.5, out=scaled)
+        scaled += 127.5
+        np.clip(scaled, 0, 255, out=scaled)
+        np.rint(scaled, out=scaled)
+        np.copyto(self.raw, scaled, casting='unsafe')
+        return self.raw
 
-context = zmq.Context()
-socket = zmq.Socket(context, zmq.PUB)
-socket.bind("tcp://*:5555")
 
-logger.add("sender_log.log", rotation="1 MB")  # Log file with rotation
+class Scorer(threading.Thread):
+    """Collects the triggers of a detectomer-engine and scores them against the scenario.
 
-logger.info("Now sending, press enter to send signal, or press Ctrl-C to abort...")
+    A trigger detects an expected occurrence if it comes between the start
+    of the occurrence and `tolerance` seconds after its end. Triggers that
+    match no occurrence at all are false alarms.
+    """
 
-while True:
+    def __init__(self, zmq_context, address, tolerance=0.5):
+        super().__init__(name='sim-scorer', daemon=True)
+        self.socket = zmq_context.socket(zmq.SUB)
+        self.socket.connect(address)
+        self.socket.setsockopt(zmq.SUBSCRIBE, b'trigger')
+        self.tolerance = tolerance
+        self.triggers = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            if self.socket.poll(100):
+                _, state = self.socket.recv_multipart()[:2]
+                self.triggers.append(json.loads(state)['time'])
+        self.socket.close(linger=0)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def score(self, truth):
+        """Detections, misses, false alarms and latencies for the ground truth records."""
+        triggers = sorted(self.triggers)
+        used = np.zeros(len(triggers), dtype=bool)
+        expected = [t for t in truth if t['expect']]
+        latencies = []
+        for t in expected:
+            for i, trigger in enumerate(triggers):
+                if not used[i] and t['time_start'] <= trigger <= t['time_stop'] + self.tolerance:
+                    used[i] = True
+                    latencies.append(trigger - t['time_start'])
+                    break
+        # triggers during occurrences that are not expected to trigger are no false alarms
+        for t in truth:
+            for i, trigger in enumerate(triggers):
+                if t['time_start'] <= trigger <= t['time_stop'] + self.tolerance:
+                    used[i] = True
+        latency = np.array(latencies) if latencies else np.zeros(1)
+        return {
+            'expected': len(expected),
+            'detected': len(latencies),
+            'miss_rate': 1 - len(latencies) / len(expected) if expected else 0.0,
+            'false_alarms': int((~used).sum()),
+            'latency_s': {
+                'p50': float(np.percentile(latency, 50)),
+                'p99': float(np.percentile(latency, 99)),
+                'max': float(latency.max()),
+            },
+        }
+
+
+def run(config, stopping):
+    section = config['sim']
+    simulator = Simulator(section, config.get('events', []))
+    lframe = simulator.lframe
+    sample_rate = simulator.sample_rate
+    dtype = wire_dtype(section.get('encoding', 'uint8'), section.get('compression', 'none'))
+    topic = section.get('topic', '')
+    topic = topic.encode() if topic else None
+    # 1 is real time, 0 as fast as possible
+    speed = section.get('speed', 1.0)
+    duration = section.get('duration', 0)
+    nframes = int(duration * sample_rate / lframe) if duration else None
+    stats_interval = section.get('stats_interval', 10)
+
+    zmq_context = zmq.Context()
+    publisher = open_publisher(
+        zmq_context, section.get('address', 'tcp://*:5555'), hwm=section.get('hwm', 1000),
+        slots=section.get('ring_slots', 64), slot_bytes=section.get('ring_slot_bytes') or slot_bytes_for(lframe),
+    )
+    scorer = None
+    score_section = config.get('score', {})
+    if score_section.get('engine'):
+        scorer = Scorer(zmq_context, score_section['engine'], score_section.get('tolerance', 0.5))
+        scorer.start()
+    # give the subscribers time to connect
+    sleep(section.get('start_delay', 1.0))
+
+    template = FrameHeader(0, 0.0, sample_rate, simulator.center_freq, 0.0, dtype, lframe)
+    frame_time = lframe / sample_rate / speed if speed else 0.0
+    truth = {}
+    truth_file = section.get('truth_file', '')
+    start_time = time()
+    start = monotonic()
+    last_stats = start
+    last_seq = 0
+    seq = 0
+    logger.info(f"Simulating {len(simulator.occurrences)} events at {sample_rate / 1e6:.3f} MS/s")
     try:
-        if sys.stdin in select.select([sys.stdin], [], [], 0)[0]:
-            _ = sys.stdin.read(1)
-            send_sine_wave = True
-            logger.info("Sending signal...")
-        else:
-            send_sine_wave = False
+        while not stopping.is_set() and (nframes is None or seq < nframes):
+            iq, active = simulator.frame(seq)
+            payload = encode_raw(simulator.raw_samples(iq), dtype)
+            if speed:
+                # frames leave when their last sample would have been captured
+                delay = start + (seq + 1) * frame_time - monotonic()
+                if delay > 0:
+                    sleep(delay)
+            timestamp = time()
+            send_frame(publisher, template._replace(seq=seq, timestamp=timestamp), payload, topic)
+            for o in active:
+                if o.index not in truth:
+                    truth[o.index] = o
+            seq += 1
 
-        if send_sine_wave:
-            data = generate_noisy_sine_wave(200, 1) + generate_noisy_sine_wave(160, 0.4)
-        else:
-            data = generate_noisy_sine_wave(200, 1)
-            #data = np.random.normal(0, 0.1, lframe).astype(np.float32)
-
-        data *= 1e-6  # Multiply everything by 1e-6
-        socket.send(data.tobytes())
-        time.sleep(0.1)
-        
-    except KeyboardInterrupt:
-        logger.success("\nAborted by user.")
-        break
+            now = monotonic()
+            if now - last_stats >= stats_interval:
+                rate = (seq - last_seq) * lframe / (now - last_stats)
+                logger.info(f"Sent {seq} frames, {rate / 1e6:.3f} MS/s")
+                last_stats = now
+                last_seq = seq
+    finally:
+        elapsed = monotonic() - start
+        logger.info(f"Sent {seq} frames in {elapsed:.1f} s, {seq * lframe / max(elapsed, 1e-9) / 1e6:.3f} MS/s")
+        # the stream time of every sample maps to the wall clock through the pacing
+        scale = 1 / sample_rate / speed if speed else elapsed / max(seq * lframe, 1)
+        records = [
+            {
+                'name': o.name,
+                'kind': o.kind,
+                'frequency': o.frequency,
+                'stop_frequency': o.stop_frequency,
+                'level': o.level,
+                'expect': o.expect,
+                'sample_start': o.start,
+                'sample_stop': o.stop,
+                'seq_start': o.start // lframe,
+                'seq_stop': (o.stop - 1) // lframe,
+                'time_start': start_time + o.start * scale,
+                'time_stop': start_time + o.stop * scale,
+            }
+            for o in sorted(truth.values(), key=lambda o: o.start)
+        ]
+        if truth_file:
+            with open(truth_file, 'w') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+            logger.info(f"Ground truth of {len(records)} events written to {truth_file}")
+        if scorer is not None:
+            # late triggers still count
+            sleep(scorer.tolerance)
+            scorer.stop()
+            score = scorer.score(records)
+            logger.info(f"Score: {score}")
+            if score_section.get('file'):
+                with open(score_section['file'], 'w') as f:
+                    json.dump(score, f, indent=2)
+        publisher.close(linger=0)
+        zmq_context.destroy(linger=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sdr2zmq-sim - synthetic I/Q source for load and detection tests")
+    parser.add_argument("--config", type=str, required=True, help="Path to the scenario file")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as file:
+        config = toml.load(file)
+    if 'sim' not in config:
+        logger.error("Configuration error: Missing section: sim")
+        sys.exit(1)
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, lambda sig, frame: stopping.set())
+    signal.signal(signal.SIGTERM, lambda sig, frame: stopping.set())
+    try:
+        run(config, stopping)
+    except ValueError as e:
+        logger.error(f"Configuration error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
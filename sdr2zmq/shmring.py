@@ -0,0 +1,267 @@
+import os
+import struct
+import tempfile
+import zmq
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+from .frame import HEADER_SIZE
+
+# frames of sdr2zmq and detectomer on the same machine go through a ring in shared memory
+SHM_SCHEME = 'shm://'
+
+RING_MAGIC = b'SDRR'
+RING_VERSION = 1
+# magic, version, slots, bytes per slot, generation, followed by the write counter and the closed flag
+RING_FORMAT = '<4sHxxIIQ'
+WRITE_OFFSET = struct.calcsize(RING_FORMAT)
+CLOSED_OFFSET = WRITE_OFFSET + 8
+CONTROL_SIZE = 64
+
+# stamp, topic length, payload length, followed by the frame header, topic and payload
+SLOT_FORMAT = '<QHxxI'
+HEADER_OFFSET = struct.calcsize(SLOT_FORMAT)
+TOPIC_OFFSET = HEADER_OFFSET + HEADER_SIZE
+MAX_TOPIC = 64
+PAYLOAD_OFFSET = TOPIC_OFFSET + MAX_TOPIC
+
+# rings published by this process, their readers here share the resource tracker of the publisher
+published = set()
+
+
+def is_ring_address(address):
+    return address.startswith(SHM_SCHEME)
+
+
+def ring_name(address):
+    name = address[len(SHM_SCHEME):]
+    if not name or '/' in name:
+        raise ValueError(f"Invalid shared memory address: {address}")
+    return name
+
+
+def notify_address(name):
+    return f"ipc://{tempfile.gettempdir()}/{name}.notify"
+
+
+def slot_bytes_for(nsamples):
+    """Slot size for frames of up to `nsamples` complex64 samples, with room for compression overhead."""
+    payload = 8 * nsamples
+    return PAYLOAD_OFFSET + payload + payload // 64 + 1024
+
+
+def open_publisher(context, address, hwm=1000, slots=64, slot_bytes=None):
+    """Bound PUB socket for tcp:// and ipc:// addresses, a RingPublisher for shm:// addresses."""
+    if is_ring_address(address):
+        return RingPublisher(context, address, slots, slot_bytes)
+    publisher = context.socket(zmq.PUB)
+    publisher.setsockopt(zmq.SNDHWM, hwm)
+    publisher.bind(address)
+    return publisher
+
+
+class RingPublisher:
+    """Single producer side of a ring of message slots in POSIX shared memory.
+
+    Takes the place of the PUB socket: `send_multipart` writes the frame
+    header, topic and payload into the next slot and counts up the write
+    counter, so no serialisation and no copy through the kernel happens on
+    the way. Each slot starts with a stamp, the number of the message in it
+    plus one, that is cleared while the slot is written, so readers notice
+    when a slot was overwritten under them. Readers are not tracked, a slow
+    reader loses the oldest messages instead of holding up the capture.
+    After every message its number is sent on a PUB socket on an ipc://
+    address next to the ring, for the readers to wait on.
+    """
+
+    def __init__(self, context, address, slots=64, slot_bytes=None):
+        self.name = ring_name(address)
+        self.slots = slots
+        self.slot_bytes = slot_bytes or slot_bytes_for(2 ** 16)
+        if self.slot_bytes <= PAYLOAD_OFFSET:
+            raise ValueError(f"Ring slots of {self.slot_bytes} bytes are too small")
+        # a ring left behind by a crashed publisher, closed so that its readers move on
+        try:
+            stale = shared_memory.SharedMemory(name=self.name)
+            if stale.size >= CONTROL_SIZE and bytes(stale.buf[:4]) == RING_MAGIC:
+                struct.pack_into('<Q', stale.buf, CLOSED_OFFSET, 1)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        self.memory = shared_memory.SharedMemory(
+            name=self.name, create=True, size=CONTROL_SIZE + slots * self.slot_bytes
+        )
+        # readers that are still attached to an older ring of the same name compare the generation
+        self.generation = int.from_bytes(os.urandom(8), 'little') >> 1
+        struct.pack_into(RING_FORMAT, self.memory.buf, 0, RING_MAGIC, RING_VERSION, slots, self.slot_bytes,
+                         self.generation)
+        self.written = np.ndarray(1, dtype=np.uint64, buffer=self.memory.buf, offset=WRITE_OFFSET)
+        self.written[0] = 0
+        self.closed = np.ndarray(1, dtype=np.uint64, buffer=self.memory.buf, offset=CLOSED_OFFSET)
+        self.closed[0] = 0
+        self.data = np.ndarray((slots, self.slot_bytes), dtype=np.uint8, buffer=self.memory.buf,
+                               offset=CONTROL_SIZE)
+        self.count = 0
+        published.add(self.name)
+        self.socket = context.socket(zmq.PUB)
+        self.socket.bind(notify_address(self.name))
+
+    def send_multipart(self, parts, copy=False):
+        """Write one [topic,] header, payload message into the next slot."""
+        topic = bytes(parts[0]) if len(parts) == 3 else b''
+        header = np.frombuffer(parts[-2], dtype=np.uint8)
+        payload = np.frombuffer(parts[-1], dtype=np.uint8)
+        if len(topic) > MAX_TOPIC:
+            raise ValueError(f"Topic {topic!r} is longer than {MAX_TOPIC} bytes")
+        if PAYLOAD_OFFSET + len(payload) > self.slot_bytes:
+            raise ValueError(f"Payload of {len(payload)} bytes does not fit into the ring slots")
+        slot = self.data[self.count % self.slots]
+        offset = CONTROL_SIZE + self.count % self.slots * self.slot_bytes
+        struct.pack_into(SLOT_FORMAT, self.memory.buf, offset, 0, len(topic), len(payload))
+        slot[HEADER_OFFSET:TOPIC_OFFSET] = header
+        slot[TOPIC_OFFSET:TOPIC_OFFSET + len(topic)] = np.frombuffer(topic, dtype=np.uint8)
+        slot[PAYLOAD_OFFSET:PAYLOAD_OFFSET + len(payload)] = payload
+        self.count += 1
+        struct.pack_into('<Q', self.memory.buf, offset, self.count)
+        self.written[0] = self.count
+        self.socket.send(struct.pack('<QQ', self.generation, self.count), zmq.NOBLOCK)
+
+    def close(self, linger=0):
+        self.socket.close(linger=linger)
+        if self.memory is not None:
+            self.closed[0] = 1
+            del self.data, self.written, self.closed
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+            published.discard(self.name)
+
+
+class RingSubscriber:
+    """Reader of a RingPublisher ring, with its own read cursor.
+
+    Starts with the next message written, like a SUB socket. `read` hands
+    out views into the slots, which stay valid until the publisher comes
+    around the ring again, so a message has to be checked with `intact`
+    after it was copied out or decoded. When the reader falls more than the
+    ring behind, it skips ahead to the oldest message still there, sets
+    `overrun` and counts the skipped messages in `overruns`. `socket`
+    becomes readable on new messages and can be used in a poller, messages
+    left over from a read are announced by `pending` instead. The ring
+    is attached on the first read after the publisher created it, and again
+    when the publisher closed it or was restarted.
+    """
+
+    def __init__(self, context, address):
+        self.name = ring_name(address)
+        self.memory = None
+        self.generation = None
+        self.cursor = 0
+        self.overrun = False
+        self.overruns = 0
+        self.socket = context.socket(zmq.SUB)
+        # only the newest notification is of interest
+        self.socket.setsockopt(zmq.CONFLATE, 1)
+        self.socket.connect(notify_address(self.name))
+        self.socket.setsockopt(zmq.SUBSCRIBE, b'')
+        self.attach(newest=True)
+
+    def attach(self, newest=False):
+        """Map the ring, reading from the next message with `newest`, from the oldest one still there otherwise."""
+        self.detach()
+        # the ring belongs to the publisher, it must not be removed when the reader exits
+        try:
+            memory = shared_memory.SharedMemory(name=self.name, track=False)
+        except FileNotFoundError:
+            return False
+        except TypeError:
+            # Python before 3.13 always tracks the memory
+            try:
+                memory = shared_memory.SharedMemory(name=self.name)
+            except FileNotFoundError:
+                return False
+            if self.name not in published:
+                resource_tracker.unregister(memory._name, 'shared_memory')
+        magic, version, slots, slot_bytes, generation = struct.unpack_from(RING_FORMAT, memory.buf, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            memory.close()
+            raise ValueError(f"{self.name} is not a sdr2zmq ring")
+        self.memory = memory
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.generation = generation
+        self.written = np.ndarray(1, dtype=np.uint64, buffer=memory.buf, offset=WRITE_OFFSET)
+        self.closed = np.ndarray(1, dtype=np.uint64, buffer=memory.buf, offset=CLOSED_OFFSET)
+        self.data = np.ndarray((slots, slot_bytes), dtype=np.uint8, buffer=memory.buf, offset=CONTROL_SIZE)
+        self.stamps = np.ndarray(slots, dtype=np.uint64, buffer=memory.buf, offset=CONTROL_SIZE,
+                                 strides=(slot_bytes,))
+        written = int(self.written[0])
+        self.cursor = written if newest else max(written - slots, 0)
+        return True
+
+    def detach(self):
+        if self.memory is None:
+            return
+        memory = self.memory
+        self.memory = None
+        del self.written, self.closed, self.data, self.stamps
+        try:
+            memory.close()
+        except BufferError:
+            # views handed out are still alive, the mapping goes with them
+            pass
+
+    def read(self, limit=None):
+        """Messages written since the last read as (topic, header, payload, number) tuples."""
+        try:
+            while True:
+                generation, _ = struct.unpack('<QQ', self.socket.recv(zmq.NOBLOCK))
+                if generation != self.generation:
+                    self.attach()
+        except zmq.Again:
+            pass
+        # a closed ring may have been replaced by the one of a new publisher
+        if (self.memory is None or self.closed[0]) and not self.attach():
+            return []
+
+        self.overrun = False
+        written = int(self.written[0])
+        if written - self.cursor > self.slots:
+            self.skip(written - self.slots)
+        messages = []
+        while self.cursor < written and (limit is None or len(messages) < limit):
+            number = self.cursor
+            self.cursor += 1
+            slot = self.data[number % self.slots]
+            stamp, topic_length, length = struct.unpack_from(
+                SLOT_FORMAT, self.memory.buf, CONTROL_SIZE + number % self.slots * self.slot_bytes
+            )
+            if stamp != number + 1:
+                self.skip(self.cursor)
+                continue
+            topic = slot[TOPIC_OFFSET:TOPIC_OFFSET + topic_length].tobytes()
+            header = slot[HEADER_OFFSET:TOPIC_OFFSET].tobytes()
+            messages.append((topic, header, slot[PAYLOAD_OFFSET:PAYLOAD_OFFSET + length], number))
+        return messages
+
+    def pending(self):
+        """Whether messages are left in the ring after a read that hit its limit."""
+        return self.memory is not None and self.cursor < int(self.written[0])
+
+    def intact(self, number):
+        """Whether message `number` is still in its slot, i.e. was not overwritten while it was read."""
+        if self.memory is not None and self.stamps[number % self.slots] == number + 1:
+            return True
+        self.overrun = True
+        self.overruns += 1
+        return False
+
+    def skip(self, cursor):
+        self.overrun = True
+        self.overruns += max(cursor - self.cursor, 1)
+        self.cursor = max(cursor, self.cursor)
+
+    def close(self):
+        self.socket.close(linger=0)
+        self.detach()
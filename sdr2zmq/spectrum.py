@@ -0,0 +1,51 @@
+import numpy as np
+
+from detectomer.spectrum import SpectrumEstimator
+from detectomer.averaging import SpectrumAverager
+
+from .codec import SPECTRUM_DTYPES
+from .frame import send_frame
+
+
+class SpectrumPublisher:
+    """Computes the averaged power spectrum once at the source and publishes it.
+
+    Uses the same estimator and averager as detectomer, configured by the
+    [spectrum] section. Every `every`-th frame the current average is sent
+    as float16 or float32 dBm on its own topic, with the number of bins in
+    `nsamples` of the header.
+    """
+
+    def __init__(self, section, template, topic=None):
+        dtype = section.get('dtype', 'float16')
+        if dtype not in SPECTRUM_DTYPES:
+            raise ValueError(f"Unknown spectrum dtype: {dtype}")
+        self.estimator = SpectrumEstimator.from_config(
+            template.nsamples, template.sample_rate, template.center_freq, section
+        )
+        nbins = len(self.estimator.freqs)
+        self.averager = SpectrumAverager(
+            nbins,
+            section.get('avg_depth', 1),
+            mode=section.get('avg_mode', 'mean'),
+            linear=section.get('avg_linear', False),
+        )
+        self.every = max(1, int(section.get('every', 1)))
+        self.count = 0
+        self.seq = 0
+        self.dtype = np.float16 if dtype == 'float16' else np.float32
+        name = section.get('topic', 'spectrum').encode()
+        self.topic = name if topic is None else topic + b'/' + name
+        self.header = template._replace(dtype=SPECTRUM_DTYPES[dtype], nsamples=nbins)
+
+    def publish(self, publisher, iq, seq, timestamp):
+        """Add the spectrum of one frame of I/Q and send the average if it is due."""
+        fft_data = self.averager.update(self.estimator.estimate([iq])[0])
+        self.count += 1
+        if self.count % self.every:
+            return
+        # a new buffer per message, as ZMQ sends it without copying
+        payload = fft_data.astype(self.dtype)
+        # numbered on their own, skipped frames are not lost
+        send_frame(publisher, self.header._replace(seq=self.seq, timestamp=timestamp), payload, self.topic)
+        self.seq += 1
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from detectomer.averaging import SpectrumAverager, AVERAGING_MODES
+
+
+@pytest.mark.parametrize('mode', AVERAGING_MODES)
+def test_reset_starts_over(mode):
+    rng = np.random.default_rng(0)
+    averager = SpectrumAverager(16, 4, mode)
+    for _ in range(6):
+        averager.update(rng.normal(size=16) + 40)
+    averager.reset()
+    fresh = SpectrumAverager(16, 4, mode)
+    for _ in range(6):
+        spectrum = rng.normal(size=16)
+        np.testing.assert_allclose(averager.update(spectrum), fresh.update(spectrum))
+
+
+def test_mean_over_depth():
+    averager = SpectrumAverager(3, 2)
+    averager.update(np.full(3, 1.0))
+    np.testing.assert_allclose(averager.update(np.full(3, 3.0)), 2.0)
+    np.testing.assert_allclose(averager.update(np.full(3, 5.0)), 4.0)
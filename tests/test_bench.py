@@ -0,0 +1,32 @@
+import copy
+import pytest
+
+from detectomer import kernels
+from detectomer.bench import Bench, DEFAULT_CONFIG, synthetic_frames
+
+LFRAME = 256
+
+
+def config(detector, kernel):
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    config['data']['lframe'] = LFRAME
+    # dBm for the fixed threshold, dB above the noise with a detector
+    config['trigger'].update(detector=detector, threshold=-60 if detector == 'fixed' else 10)
+    config['spectrum'] = {'kernel': kernel}
+    return config
+
+
+@pytest.mark.parametrize('detector', ['fixed', 'floor', 'ca-cfar', 'os-cfar'])
+def test_detector_runs_on_the_fused_kernel(monkeypatch, detector):
+    # the plain Python kernel stands in for the compiled one when numba is missing
+    monkeypatch.setattr(kernels, 'compiled_kernel', kernels.compiled_kernel or kernels.fused_kernel)
+    fused = Bench(config(detector, 'auto'))
+    numpy = Bench(config(detector, 'numpy'))
+    assert fused.fused is not None
+    assert numpy.fused is None
+
+    header, payloads = fused.payloads(synthetic_frames(LFRAME, 16))
+    result = fused.run(header, payloads, 16, warmup=0)
+    assert result['settings']['kernel'] == 'numba'
+    assert result['fires'] > 0
+    assert result['fires'] == numpy.run(header, payloads, 16, warmup=0)['fires']
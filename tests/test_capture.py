@@ -0,0 +1,114 @@
+import time
+import numpy as np
+import pytest
+
+from sdr2zmq.capture import RingBuffer, StreamCapture
+from sdr2zmq.replay import FileReplaySdr
+from sdr2zmq.__main__ import validate_config
+
+LFRAME = 256
+FILE_FRAMES = 10
+
+
+@pytest.fixture
+def recording(tmp_path):
+    """Raw I/Q file whose frame i is filled with the byte i."""
+    path = tmp_path / 'frames.cu8'
+    np.repeat(np.arange(FILE_FRAMES, dtype=np.uint8), 2 * LFRAME).tofile(path)
+    return str(path)
+
+
+def run_capture(sdr, ring, seconds=None, frames=None):
+    capture = StreamCapture(sdr, ring)
+    capture.start()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if frames is not None and ring.write_seq >= frames:
+            break
+        if seconds is not None and time.monotonic() > deadline - 5 + seconds:
+            break
+        time.sleep(0.001)
+    capture.stop()
+    capture.join(timeout=5)
+    assert capture.error is None
+    return capture
+
+
+def test_frames_in_order(recording):
+    ring = RingBuffer(LFRAME, 4096)
+    run_capture(FileReplaySdr(recording, realtime=False), ring, frames=100)
+    written = ring.write_seq
+    assert written >= 100
+    for expected in range(min(written, ring.nframes - 1)):
+        seq, frame, timestamp = ring.read(timeout=0)
+        assert seq == expected
+        assert np.all(frame == seq % FILE_FRAMES)
+        assert timestamp > 0
+    assert ring.overruns == 0
+
+
+def test_overrun_skips_oldest_frames(recording):
+    ring = RingBuffer(LFRAME, 8)
+    run_capture(FileReplaySdr(recording, realtime=False), ring, frames=50)
+    written = ring.write_seq
+    seq, frame, _ = ring.read(timeout=0)
+    # the slot of write_seq is never handed out
+    assert seq == written - ring.nframes + 1
+    assert ring.overruns == seq
+    assert np.all(frame == seq % FILE_FRAMES)
+    while (item := ring.read(timeout=0)) is not None:
+        assert item[0] == seq + 1
+        seq = item[0]
+    assert seq == written - 1
+
+
+def test_overwritten_frames_are_not_delivered(recording):
+    ring = RingBuffer(LFRAME, 4)
+    capture = StreamCapture(FileReplaySdr(recording, realtime=False), ring)
+    capture.start()
+    delivered = 0
+    last = -1
+    frame = np.empty(2 * LFRAME, dtype=np.uint8)
+    try:
+        for _ in range(200):
+            item = ring.read(timeout=1)
+            assert item is not None
+            seq, raw, _ = item
+            assert seq > last
+            last = seq
+            frame[:] = raw
+            time.sleep(0.0005)
+            if ring.intact(seq):
+                delivered += 1
+                # a torn frame would mix the bytes of two frames
+                assert np.all(frame == seq % FILE_FRAMES)
+    finally:
+        capture.stop()
+        capture.join(timeout=5)
+    # every frame up to the last one read was either delivered or counted
+    assert delivered + ring.overruns == last + 1
+    assert ring.overruns > 0
+
+
+def test_replay_loops_the_file(recording):
+    sdr = FileReplaySdr(recording, realtime=False)
+    raw = sdr.read_bytes(2 * LFRAME * (FILE_FRAMES + 1))
+    assert np.all(raw[-2 * LFRAME:] == 0)
+
+
+def test_stream_mode_needs_lframe_multiple_of_256():
+    config = {
+        'sdr': {'sample_rate': 2.048e6, 'center_freq': 410e6, 'freq_correction': 0, 'gain': 0,
+                'sleep_time': 0.1, 'lframe': 1000},
+        'zmq': {'address': 'tcp://*:5555'},
+    }
+    # any frame length can be polled
+    validate_config(config)
+    config['sdr']['mode'] = 'stream'
+    with pytest.raises(ValueError, match='multiple of 256'):
+        validate_config(config)
+    config['sdr']['lframe'] = 1024
+    validate_config(config)
+    config['devices'] = [{'name': 'pickup1', 'lframe': 1000}]
+    with pytest.raises(ValueError, match='pickup1'):
+        validate_config(config)
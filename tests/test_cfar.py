@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from detectomer.cfar import CFAR, Detector, NoiseFloor
+
+NBINS = 200
+
+
+def reference_cells(power, guard, train):
+    """Reference cells of every bin of the mirrored spectrum, gathered with fancy indexing."""
+    half = guard + train
+    width = 2 * half + 1
+    padded = np.r_[power[half:0:-1], power, power[-2:-half - 2:-1]]
+    windows = np.lib.stride_tricks.sliding_window_view(padded, width)
+    return windows[:, np.r_[0:train, width - train:width]]
+
+
+@pytest.mark.parametrize('kind', ['ca', 'os'])
+@pytest.mark.parametrize('guard, train', [(2, 8), (0, 1), (3, 4)])
+def test_cfar_matches_direct_gather(kind, guard, train):
+    rng = np.random.default_rng(0)
+    cfar = CFAR(NBINS, kind, guard, train)
+    for _ in range(3):
+        power = rng.exponential(size=NBINS)
+        cells = reference_cells(power, guard, train)
+        if kind == 'ca':
+            expected = cells.mean(axis=1)
+        else:
+            expected = np.partition(cells, cfar.rank, axis=1)[:, cfar.rank]
+        np.testing.assert_allclose(cfar.update(power), expected, rtol=1e-9)
+
+
+def test_quantile_floor_steps():
+    rng = np.random.default_rng(1)
+    floor = NoiseFloor(NBINS, quantile=0.25, step=0.1)
+    floor.update(rng.normal(size=NBINS))
+    spectrum = rng.normal(size=NBINS)
+    expected = floor.floor + 0.1 * 0.25
+    expected[spectrum < floor.floor] -= 0.1
+    np.testing.assert_allclose(floor.update(spectrum), expected)
+
+
+@pytest.mark.parametrize('mode', ['ca-cfar', 'os-cfar'])
+@pytest.mark.parametrize('line', [0.0, 40.0, 60.0, 100.0])
+def test_strong_line_next_to_the_noise(mode, line):
+    rng = np.random.default_rng(2)
+    guard, train = 2, 8
+    spectrum = -120 + 10 * np.log10(rng.exponential(size=NBINS))
+    spectrum[100] = line
+    detector = Detector(NBINS, mode, guard=guard, train=train)
+    excess = detector.update(spectrum)
+
+    cells = reference_cells(10 ** (spectrum / 10), guard, train)
+    if mode == 'ca-cfar':
+        noise = cells.mean(axis=1)
+    else:
+        noise = np.partition(cells, detector.cfar.rank, axis=1)[:, detector.cfar.rank]
+    np.testing.assert_allclose(detector.noise, 10 * np.log10(noise), atol=1e-6)
+    assert np.isfinite(excess).all()
+    # only the line stands out, its neighbours see it in their reference cells
+    assert np.argmax(excess) == 100
+
+
+def test_zero_noise_stays_finite():
+    detector = Detector(NBINS, 'ca-cfar')
+    excess = detector.update(np.full(NBINS, -4000.0))
+    assert np.isfinite(excess).all()
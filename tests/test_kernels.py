@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from detectomer.spectrum import SpectrumEstimator
+from detectomer.averaging import SpectrumAverager, AVERAGING_MODES
+from detectomer.trigger import RuleMatrix, TriggerRule, apply_reference
+from detectomer.kernels import FusedSpectrum, fused_kernel, compiled_kernel
+
+KERNELS = [fused_kernel] + ([compiled_kernel] if compiled_kernel is not None else [])
+
+RULES = [
+    TriggerRule('plain', -3e5, 1e5, 0, False, 'max', 0, 0, []),
+    TriggerRule('inverted', -1e5, 2e5, 0, True, 'power', 0, 0, []),
+    TriggerRule('span', None, None, 0, False, 'mean', 0, 0, []),
+]
+
+
+def frames(rng, count, nsamples):
+    for i in range(count):
+        x = (rng.normal(size=(2, nsamples)) + 1j * rng.normal(size=(2, nsamples))).astype(np.complex64)
+        if i == 1:
+            # empty bins are clamped to the floor in both paths
+            x[0] = 0
+        yield x
+
+
+@pytest.mark.parametrize('kernel', KERNELS, ids=lambda k: 'compiled' if k is compiled_kernel else 'python')
+@pytest.mark.parametrize('mode', AVERAGING_MODES)
+@pytest.mark.parametrize('method', ['fft', 'welch'])
+@pytest.mark.parametrize('invert', [False, True])
+@pytest.mark.parametrize('count', [3, 20])
+def test_fused_matches_numpy(kernel, mode, method, invert, count):
+    rng = np.random.default_rng(1)
+    estimator = SpectrumEstimator(256, 1e6, 0, method=method, segment=64)
+    nbins = len(estimator.freqs)
+    # with 3 frames the moving average is still below its depth of 8
+    reference = SpectrumAverager(nbins, 8, mode)
+    fused = FusedSpectrum(estimator, SpectrumAverager(nbins, 8, mode), kernel=kernel)
+    rules = RuleMatrix(estimator.freqs, RULES)
+    fused.set_bands(rules.limits, rules.invert)
+    out = np.empty(nbins)
+
+    for batch in frames(rng, count, 256):
+        expected_spectra = np.array(estimator.estimate(batch))
+        spectra = np.array(fused.transform(batch))
+        for expected_spectrum, spectrum in zip(expected_spectra, spectra):
+            expected = apply_reference(reference.update(expected_spectrum), 5, invert)
+            levels = rules.levels(expected)
+            result = fused.update(spectrum, 5, invert, out=out)
+            np.testing.assert_allclose(result, expected, atol=1e-4)
+            for field, value in zip(levels._fields, levels):
+                np.testing.assert_allclose(getattr(fused.levels, field), value, atol=1e-4, err_msg=field)
+    assert fused.averager.count == reference.count
+    if mode == 'mean':
+        assert fused.averager.index == reference.index
+
+
+def test_numpy_fallback_without_kernel():
+    from detectomer.kernels import fused_spectrum
+    estimator = SpectrumEstimator(256, 1e6, 0)
+    assert fused_spectrum(estimator, SpectrumAverager(256, 4), {'kernel': 'numpy'}) is None
+    # averaging in power is left to NumPy
+    if compiled_kernel is not None:
+        assert fused_spectrum(estimator, SpectrumAverager(256, 4, linear=True), {}) is None
+    with pytest.raises(ValueError):
+        fused_spectrum(estimator, SpectrumAverager(256, 4), {'kernel': 'cuda'})
@@ -0,0 +1,46 @@
+import urllib.request
+
+from sdr2zmq.metrics import Histogram, Metrics, MetricsServer
+
+
+def test_metrics_endpoint():
+    metrics = Metrics('sdr2zmq')
+    metrics.counter('frames', 'Frames published').inc(3)
+    metrics.gauge('queue', 'Frames waiting', fn=lambda: 2)
+    metrics.histogram('latency_seconds', 'Capture to publish').observe(0.001)
+    server = MetricsServer(metrics, 0)
+    server.start()
+    try:
+        port = server.server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            text = response.read().decode()
+    finally:
+        server.stop()
+
+    lines = text.splitlines()
+    assert '# TYPE sdr2zmq_frames_total counter' in lines
+    assert 'sdr2zmq_frames_total 3' in lines
+    assert '# TYPE sdr2zmq_queue gauge' in lines
+    assert 'sdr2zmq_queue 2' in lines
+    assert '# TYPE sdr2zmq_latency_seconds histogram' in lines
+    assert 'sdr2zmq_latency_seconds_count 1' in lines
+    assert 'sdr2zmq_latency_seconds_bucket{le="+Inf"} 1' in lines
+    # every sample belongs to the family declared before it
+    family = None
+    for line in lines:
+        if line.startswith('# TYPE'):
+            family = line.split()[2]
+        elif not line.startswith('#'):
+            assert line.split('{')[0].split()[0].startswith(family)
+
+
+def test_histogram_quantiles():
+    histogram = Histogram('latency_seconds', 'Latency')
+    for i in range(1, 101):
+        histogram.observe(i * 1e-3)
+    summary = histogram.summary()
+    assert summary['count'] == 100
+    assert summary['max'] == 0.1
+    # the buckets are a quarter octave wide
+    assert 0.05 <= summary['p50'] <= 0.05 * 2 ** 0.25
+    assert 0.099 <= summary['p99'] <= 0.1
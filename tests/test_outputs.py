@@ -0,0 +1,109 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from detectomer.outputs import RestDispatcher
+
+
+class Endpoint:
+    """Local REST endpoint that records the bodies it receives and answers with `status` after `delay`."""
+
+    def __init__(self, status=200, delay=0.0):
+        self.status = status
+        self.delay = delay
+        self.requests = []
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_PUT(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                endpoint.requests.append((self.path, json.loads(body)))
+                time.sleep(endpoint.delay)
+                try:
+                    self.send_response(endpoint.status)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                except OSError:
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/signals"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def endpoint():
+    endpoint = Endpoint()
+    yield endpoint
+    endpoint.close()
+
+
+def dispatch(dispatcher, *commands):
+    dispatcher.start()
+    for scid, status in commands:
+        (dispatcher.activate if status else dispatcher.release)(scid)
+    dispatcher.stop()
+    dispatcher.join(timeout=10)
+    assert not dispatcher.is_alive()
+
+
+def test_activate_and_release_in_order(endpoint):
+    dispatcher = RestDispatcher(endpoint.url)
+    dispatch(dispatcher, (7, True), (7, False), (8, True))
+
+    assert [body['dynamicSignals'] for _, body in endpoint.requests] == [
+        [{'enabled': True, 'id': 7}],
+        [{'enabled': False, 'id': 7}],
+        [{'enabled': True, 'id': 8}],
+    ]
+    assert all(path == '/signals' for path, _ in endpoint.requests)
+    stats = dispatcher.stats()
+    assert stats['sent'] == 3
+    assert stats['failed'] == 0
+    assert stats['count'] == 3
+
+
+def test_error_status_counts_as_failed(endpoint):
+    endpoint.status = 404
+    dispatcher = RestDispatcher(endpoint.url, retries=0)
+    dispatch(dispatcher, (7, True))
+
+    assert len(endpoint.requests) == 1
+    assert dispatcher.sent == 0
+    assert dispatcher.failed == 1
+
+
+def test_timeout_does_not_block_the_caller(endpoint):
+    endpoint.delay = 1.0
+    dispatcher = RestDispatcher(endpoint.url, timeout=0.1, retries=0)
+    dispatcher.start()
+    start = time.perf_counter()
+    dispatcher.activate(7)
+    dispatcher.release(7)
+    assert time.perf_counter() - start < 0.05
+    dispatcher.stop()
+    dispatcher.join(timeout=10)
+
+    assert dispatcher.sent == 0
+    assert dispatcher.failed == 2
+    # both requests gave up after the timeout instead of waiting for the answer
+    assert dispatcher.latency.max < endpoint.delay
+
+
+def test_unreachable_endpoint_counts_as_failed():
+    dispatcher = RestDispatcher('http://127.0.0.1:9/signals', timeout=0.5, retries=0)
+    dispatch(dispatcher, (7, True))
+
+    assert dispatcher.failed == 1
+
@@ -0,0 +1,54 @@
+import time
+import numpy as np
+import pytest
+import zmq
+
+from detectomer.receiver import FrameReceiver
+from sdr2zmq.frame import FrameHeader, DTYPE_CF32, send_frame
+
+NSAMPLES = 64
+
+
+@pytest.fixture
+def publisher():
+    context = zmq.Context()
+    socket = context.socket(zmq.PUB)
+    port = socket.bind_to_random_port('tcp://127.0.0.1')
+    yield context, socket, f"tcp://127.0.0.1:{port}"
+    socket.close(linger=0)
+    context.term()
+
+
+def send(socket, seq, topic=None):
+    header = FrameHeader(seq, time.time(), 1e6, 100e6, 0.0, DTYPE_CF32, NSAMPLES)
+    send_frame(socket, header, np.full(NSAMPLES, seq, dtype=np.complex64), topic)
+
+
+def receive(context, socket, address, topic, sent):
+    receiver = FrameReceiver(context, address, topic=topic)
+    try:
+        # wait for the subscription to arrive, then send the frames of all topics
+        time.sleep(0.2)
+        for seq, frame_topic in enumerate(sent):
+            send(socket, seq, frame_topic)
+        frames = []
+        deadline = time.monotonic() + 5
+        while receiver.received + receiver.other_topic < len(sent) and time.monotonic() < deadline:
+            frames.extend(header.seq for header, _ in receiver.drain())
+            time.sleep(0.01)
+        return frames, receiver.stats()
+    finally:
+        receiver.close()
+
+
+def test_empty_topic_takes_frames_without_topic(publisher):
+    frames, stats = receive(*publisher, '', [None, b'dev1', None, b'dev1/ch'])
+    assert frames == [0, 2]
+    assert stats['other_topic'] == 2
+
+
+def test_topic_is_matched_exactly(publisher):
+    # "dev1" is a prefix of the channel topic, which SUB delivers as well
+    frames, stats = receive(*publisher, 'dev1', [b'dev1', b'dev1/ch', b'dev1'])
+    assert frames == [0, 2]
+    assert stats['other_topic'] == 1
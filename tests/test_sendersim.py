@@ -0,0 +1,23 @@
+import numpy as np
+
+from sdr2zmq.sendersim import Simulator
+
+SECTION = {'sample_rate': 1e6, 'center_freq': 100e6, 'lframe': 1024, 'seed': 0}
+TONE = {'kind': 'tone', 'start': 0.0, 'duration': 1.0, 'frequency': 100.1e6, 'level': -10}
+
+
+def test_noise_step_leaves_signals_alone():
+    # a noise step starting after the tone is sorted after it, but must only scale the noise
+    step = {'kind': 'noise_step', 'start': 0.0005, 'duration': 1.0, 'level': 20}
+    quiet = Simulator({**SECTION, 'noise_level': -300}, [TONE])
+    stepped = Simulator({**SECTION, 'noise_level': -300}, [TONE, step])
+    iq, active = stepped.frame(0)
+    assert [o.kind for o in active] == ['tone', 'noise_step']
+    np.testing.assert_allclose(iq, quiet.frame(0)[0], rtol=1e-6)
+
+
+def test_noise_step_scales_the_noise():
+    step = {'kind': 'noise_step', 'start': 0.0, 'duration': 1.0, 'level': 20}
+    plain = Simulator(SECTION, [])
+    stepped = Simulator(SECTION, [step])
+    np.testing.assert_allclose(stepped.frame(0)[0], 10 * plain.frame(0)[0], rtol=1e-5)
@@ -0,0 +1,144 @@
+import os
+import numpy as np
+import pytest
+import zmq
+
+from sdr2zmq.frame import HEADER_SIZE
+from sdr2zmq.shmring import RingPublisher, RingSubscriber, slot_bytes_for
+
+SLOTS = 4
+
+
+@pytest.fixture
+def context():
+    context = zmq.Context()
+    yield context
+    context.term()
+
+
+@pytest.fixture
+def address():
+    return f"shm://sdr2zmq-test-{os.getpid()}-{os.urandom(4).hex()}"
+
+
+def message(i):
+    """Topic, header and payload of message i, every byte of it derived from i."""
+    return [b'spectrum', bytes([i % 256]) * HEADER_SIZE, np.full(100 + i, i % 256, dtype=np.uint8)]
+
+
+def check(messages, numbers):
+    assert [number for *_, number in messages] == list(numbers)
+    for (topic, header, payload, number), i in zip(messages, numbers):
+        topic_sent, header_sent, payload_sent = message(i)
+        assert topic == topic_sent
+        assert header == header_sent
+        np.testing.assert_array_equal(payload, payload_sent)
+
+
+def test_round_trip(context, address):
+    publisher = RingPublisher(context, address, SLOTS, slot_bytes_for(64))
+    subscriber = RingSubscriber(context, address)
+    try:
+        # a subscriber starts with the next message, like a SUB socket
+        assert subscriber.read() == []
+        for i in range(3):
+            publisher.send_multipart(message(i))
+        messages = subscriber.read(limit=2)
+        check(messages, range(2))
+        assert all(subscriber.intact(number) for *_, number in messages)
+        assert subscriber.pending()
+        check(subscriber.read(), [2])
+        assert not subscriber.pending()
+        assert not subscriber.overrun
+        assert subscriber.overruns == 0
+    finally:
+        subscriber.close()
+        publisher.close()
+
+
+def test_payload_too_large(context, address):
+    publisher = RingPublisher(context, address, SLOTS, slot_bytes_for(16))
+    try:
+        with pytest.raises(ValueError):
+            publisher.send_multipart([b'', bytes(HEADER_SIZE), np.zeros(4096, dtype=np.uint8)])
+    finally:
+        publisher.close()
+
+
+def test_overrun_skips_to_oldest(context, address):
+    publisher = RingPublisher(context, address, SLOTS, slot_bytes_for(64))
+    subscriber = RingSubscriber(context, address)
+    try:
+        for i in range(10):
+            publisher.send_multipart(message(i))
+        check(subscriber.read(), range(10 - SLOTS, 10))
+        assert subscriber.overrun
+        assert subscriber.overruns == 10 - SLOTS
+    finally:
+        subscriber.close()
+        publisher.close()
+
+
+def test_overwritten_while_read(context, address):
+    publisher = RingPublisher(context, address, SLOTS, slot_bytes_for(64))
+    subscriber = RingSubscriber(context, address)
+    try:
+        publisher.send_multipart(message(0))
+        (_, _, _, number), = subscriber.read()
+        # the publisher comes around the ring before the view was used
+        for i in range(1, SLOTS + 1):
+            publisher.send_multipart(message(i))
+        assert not subscriber.intact(number)
+        assert subscriber.overrun
+        assert subscriber.overruns == 1
+        check(subscriber.read(), range(1, SLOTS + 1))
+    finally:
+        subscriber.close()
+        publisher.close()
+
+
+def test_publisher_restart(context, address):
+    publisher = RingPublisher(context, address, SLOTS, slot_bytes_for(64))
+    subscriber = RingSubscriber(context, address)
+    try:
+        publisher.send_multipart(message(0))
+        check(subscriber.read(), [0])
+        generation = subscriber.generation
+        publisher.close()
+        assert subscriber.read() == []
+
+        publisher = RingPublisher(context, address, SLOTS, slot_bytes_for(64))
+        for i in range(2):
+            publisher.send_multipart(message(10 + i))
+        # the new ring is read from its first message on
+        messages = subscriber.read()
+        assert subscriber.generation == publisher.generation != generation
+        assert [number for *_, number in messages] == [0, 1]
+        assert [header for _, header, _, _ in messages] == [message(10)[1], message(11)[1]]
+    finally:
+        subscriber.close()
+        publisher.close()
+
+
+def test_stale_ring_of_crashed_publisher(context, address):
+    crashed = RingPublisher(context, address, SLOTS, slot_bytes_for(64))
+    subscriber = RingSubscriber(context, address)
+    publisher = None
+    try:
+        crashed.send_multipart(message(0))
+        check(subscriber.read(), [0])
+        # the process went away without closing its ring
+        crashed.socket.close(linger=0)
+
+        publisher = RingPublisher(context, address, SLOTS, slot_bytes_for(64))
+        assert crashed.closed[0] == 1
+        publisher.send_multipart(message(5))
+        messages = subscriber.read()
+        assert subscriber.generation == publisher.generation != crashed.generation
+        assert [(header, number) for _, header, _, number in messages] == [(message(5)[1], 0)]
+    finally:
+        subscriber.close()
+        if publisher is not None:
+            publisher.close()
+        del crashed.data, crashed.written, crashed.closed
+        crashed.memory.close()
@@ -0,0 +1,28 @@
+import pytest
+
+from detectomer.trigger import TRIGGERBOX_TOPIC, load_rules
+
+TRIGGER = {'threshold': -20, 'invert': False, 'hold_time': 1, 'freq1': None, 'freq2': None}
+
+
+def rules(*outputs):
+    return {'trigger': TRIGGER, 'rules': [{'name': 'line', 'freq1': 1e6, 'freq2': 2e6, 'outputs': list(outputs)}]}
+
+
+def test_outputs_are_checked_on_loading():
+    rule, = load_rules(rules('rest:2222', 'triggerbox:10003', 'log', 'triggerbox'))
+    assert rule.outputs == ['rest:2222', 'triggerbox:10003', 'log', f"triggerbox:{TRIGGERBOX_TOPIC}"]
+
+
+@pytest.mark.parametrize('target', ['log:file', 'rest:', 'rest', 'rest:abc', 'triggerbox:foo', 'triggerbox:', 'mail'])
+def test_malformed_output(target):
+    with pytest.raises(ValueError, match=f"Unknown output {target} in rule line"):
+        load_rules(rules('log', target))
+
+
+def test_rest_scid_of_trigger_section():
+    config = {'trigger': {**TRIGGER, 'rest': True, 'triggerbox': False}, 'rest': {'SCID': ''}}
+    with pytest.raises(ValueError, match='in rule trigger'):
+        load_rules(config)
+    config['rest']['SCID'] = 2222
+    assert load_rules(config)[0].outputs == ['rest:2222']
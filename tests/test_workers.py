@@ -0,0 +1,76 @@
+import os
+import time
+import signal
+import numpy as np
+import pytest
+
+from detectomer.spectrum import SpectrumEstimator
+from detectomer.workers import ParallelSpectrum
+
+NSAMPLES = 1024
+SECTION = {'window': 'hann', 'backend': 'numpy'}
+
+
+@pytest.fixture
+def pool():
+    pool = ParallelSpectrum(NSAMPLES, 1e6, 0, SECTION, processes=2, slots=8, timeout=10)
+    yield pool
+    pool.close()
+
+
+def batch(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.normal(size=(n, NSAMPLES)) + 1j * rng.normal(size=(n, NSAMPLES))).astype(np.complex64)
+
+
+def reference(frames):
+    return np.array(SpectrumEstimator.from_config(NSAMPLES, 1e6, 0, SECTION).estimate(frames))
+
+
+def test_matches_single_estimator(pool):
+    # 20 frames take three rounds of 8 slots
+    frames = batch(20)
+    np.testing.assert_array_equal(pool.estimate(frames), reference(frames))
+
+
+def test_stale_results_are_dropped(pool):
+    frames = batch(6, seed=1)
+    # a result of an earlier round that came in after it timed out
+    pool.results.put((pool.round, 0, 3, None))
+    pool.spectra[:] = 0
+    np.testing.assert_array_equal(pool.estimate(frames), reference(frames))
+    assert not pool.failed
+
+
+def test_dead_worker_falls_back_to_this_process(pool):
+    frames = batch(6, seed=2)
+    pool.estimate(frames)
+    pool.processes[0].terminate()
+    pool.processes[0].join()
+    start = time.monotonic()
+    np.testing.assert_array_equal(pool.estimate(frames), reference(frames))
+    np.testing.assert_array_equal(pool.estimate(frames), reference(frames))
+    assert pool.failed
+    assert time.monotonic() - start < pool.timeout / 2
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGSTOP'), reason="needs SIGSTOP to hold up a worker")
+def test_timed_out_worker_does_not_overwrite_later_rounds():
+    pool = ParallelSpectrum(NSAMPLES, 1e6, 0, SECTION, processes=2, slots=8, timeout=1)
+    try:
+        pool.estimate(batch(2))
+        # the second worker hangs with its shard 4:8 of the next round
+        os.kill(pool.processes[1].pid, signal.SIGSTOP)
+        frames = batch(8, seed=3)
+        np.testing.assert_array_equal(pool.estimate(frames), reference(frames))
+        assert pool.failed
+        os.kill(pool.processes[1].pid, signal.SIGCONT)
+        pool.processes[1].join(timeout=5)
+        assert not pool.processes[1].is_alive()
+
+        # a different batch size gives shards that overlap the one of the late worker
+        frames = batch(6, seed=4)
+        time.sleep(0.2)
+        np.testing.assert_array_equal(pool.estimate(frames), reference(frames))
+    finally:
+        pool.close()